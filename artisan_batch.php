@@ -0,0 +1,54 @@
+<?php
+/*
+ * Runs several artisan commands inside a single Laravel bootstrap.
+ *
+ * Usage: php artisan_batch.php /var/www/wemx cache:clear config:clear ...
+ *
+ * Prints one JSON line per command as soon as it finishes:
+ * {"command": "cache:clear", "exit_code": 0, "duration_ms": 12.3, "output": "..."}
+ */
+
+if ($argc < 3) {
+    fwrite(STDERR, "Usage: php artisan_batch.php <laravel-path> <command> [<command> ...]\n");
+    exit(2);
+}
+
+$basePath = rtrim($argv[1], '/');
+chdir($basePath);
+
+define('LARAVEL_START', microtime(true));
+
+require $basePath . '/vendor/autoload.php';
+$app = require_once $basePath . '/bootstrap/app.php';
+
+$kernel = $app->make(Illuminate\Contracts\Console\Kernel::class);
+$kernel->bootstrap();
+
+$failed = 0;
+
+foreach (array_slice($argv, 2) as $command) {
+    $started = microtime(true);
+    $output = new Symfony\Component\Console\Output\BufferedOutput();
+
+    try {
+        $exitCode = $kernel->call($command, [], $output);
+        $text = $output->fetch();
+    } catch (Throwable $e) {
+        $exitCode = 1;
+        $text = $output->fetch() . get_class($e) . ': ' . $e->getMessage();
+    }
+
+    if ($exitCode !== 0) {
+        $failed++;
+    }
+
+    echo json_encode([
+        'command' => $command,
+        'exit_code' => $exitCode,
+        'duration_ms' => round((microtime(true) - $started) * 1000, 1),
+        'output' => $text,
+    ]) . "\n";
+    flush();
+}
+
+exit($failed ? 1 : 0);
@@ -0,0 +1,52 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+# The panel's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wemx_config  # noqa: E402
+
+# Point every state directory wemx_app opens at import into a scratch tree, so the
+# suite never touches a real panel's audit log, backups or command slots
+STATE_ROOT = tempfile.mkdtemp(prefix='wemx-admin-tests.')
+for setting, name in (('AUDIT_DIR', 'audit'), ('BACKUP_DIR', 'backups'), ('COMMAND_SLOT_DIR', 'slots'),
+                      ('NGINX_STAGING_DIR', 'nginx-staging')):
+    setattr(wemx_config, setting, os.path.join(STATE_ROOT, name))
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(STATE_ROOT, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def no_background_tasks():
+    """Keep test requests from starting the boot permission sweep and unit watcher"""
+    panel = sys.modules.get('wemx_app')
+    if panel is not None:
+        panel.background_tasks_started.set()
+
+
+@pytest.fixture
+def make_cert(tmp_path):
+    """Factory writing a self-signed PEM certificate with openssl; returns its path"""
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        pytest.skip('openssl is not installed')
+
+    def make(path, cn='example.com', sans=('DNS:example.com',), days=90, key='rsa:2048'):
+        path = os.fspath(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        key_args = ['-newkey', key] if key.startswith('rsa') else \
+            ['-newkey', 'ec', '-pkeyopt', f'ec_paramgen_curve:{key.split(":")[1]}']
+        command = [openssl, 'req', '-x509', *key_args, '-nodes', '-keyout', str(tmp_path / 'key.pem'),
+                   '-out', path, '-days', str(days), '-subj', f'/CN={cn}']
+        if sans:
+            command += ['-addext', 'subjectAltName=' + ','.join(sans)]
+        subprocess.run(command, check=True, capture_output=True)
+        return path
+    return make
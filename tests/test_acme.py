@@ -0,0 +1,64 @@
+import socket
+import threading
+import time
+
+from wemx_acme import AvailabilityProbe
+from wemx_certs import CertificateInventory
+
+
+def http_server(reply):
+    """Listening socket on a free localhost port answering every connection with reply"""
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(1024)
+                conn.sendall(reply)
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def run_probe(address, seconds=0.3):
+    with AvailabilityProbe(address, interval=0.05, timeout=0.5) as probe:
+        time.sleep(seconds)
+    return probe
+
+
+def test_any_http_response_counts_as_up():
+    server = http_server(b'HTTP/1.1 403 Forbidden\r\nServer: hidden\r\nContent-Length: 0\r\n\r\n')
+    try:
+        probe = run_probe(server.getsockname())
+    finally:
+        server.close()
+    assert probe.probes > 0
+    assert probe.failed_probes == 0
+
+
+def test_refused_or_non_http_counts_as_down():
+    server = http_server(b'SSH-2.0-OpenSSH\r\n')
+    closed = socket.create_server(('127.0.0.1', 0))
+    address = closed.getsockname()
+    closed.close()
+    try:
+        for probe in (run_probe(server.getsockname()), run_probe(address)):
+            assert probe.failed_probes == probe.probes > 0
+    finally:
+        server.close()
+
+
+def test_lineage_is_found_by_san_not_by_name(tmp_path, make_cert):
+    root = tmp_path / 'letsencrypt'
+    make_cert(root / 'live' / 'example.com' / 'cert.pem', cn='example.com',
+              sans=('DNS:example.com',), days=10)
+    make_cert(root / 'live' / 'example.com-0001' / 'cert.pem', cn='example.com',
+              sans=('DNS:example.com', 'DNS:www.example.com'), days=90)
+    inventory = CertificateInventory(str(root))
+
+    assert inventory.for_domains(['example.com', 'www.example.com'])['name'] == 'example.com-0001'
+    assert inventory.for_domains(['WWW.example.com'])['name'] == 'example.com-0001'
+    assert inventory.for_domains(['other.example.com']) is None
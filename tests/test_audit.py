@@ -0,0 +1,53 @@
+import glob
+import os
+
+import wemx_app
+from wemx_audit import AuditJournal, redact
+from wemx_backups import BackupStore
+
+
+def test_redact_masks_secret_fields_and_env_values():
+    clean = redact({
+        'username': 'bob',
+        'password': 'hunter2',
+        'key_0': 'DB_PASSWORD',
+        'value_0': 's3cret',
+        'config_content': 'FLEET_TOKEN = "abc"'
+    })
+    assert clean['username'] == 'bob'
+    assert clean['password'] == '[redacted]'
+    assert clean['key_0'] == 'DB_PASSWORD'
+    assert clean['value_0'] == '[redacted]'
+    assert 'abc' not in clean['config_content']
+
+
+def test_save_env_secret_never_reaches_the_journal(tmp_path, monkeypatch):
+    env_file = tmp_path / 'wemx' / '.env'
+    env_file.parent.mkdir()
+    env_file.write_text('APP_DEBUG=false\nDB_PASSWORD=old\n')
+    journal_dir = tmp_path / 'audit'
+    monkeypatch.setattr(wemx_app, 'ENV_FILE_PATH', str(env_file))
+    monkeypatch.setattr(wemx_app, 'audit_journal', AuditJournal(str(journal_dir)))
+    monkeypatch.setattr(wemx_app, 'backups', BackupStore(str(tmp_path / 'backups')))
+    monkeypatch.setattr(wemx_app, 'check_root_permissions', lambda: False)
+
+    client = wemx_app.app.test_client()
+    response = client.post('/save-env', data={
+        'key_0': 'APP_DEBUG', 'value_0': 'true',
+        'key_1': 'DB_PASSWORD', 'value_1': 's3cret'
+    })
+    response.close()
+
+    assert 'DB_PASSWORD=s3cret' in env_file.read_text()
+    lines = [line for path in glob.glob(os.path.join(journal_dir, 'audit-*.jsonl'))
+             for line in open(path)]
+    assert len(lines) == 1
+    assert 's3cret' not in lines[0]
+    assert 'DB_PASSWORD' in lines[0]
+
+
+def test_journal_files_are_private(tmp_path):
+    journal = AuditJournal(str(tmp_path / 'audit'))
+    journal.record({'route': '/delete-user', 'ip': '127.0.0.1'})
+    modes = {path.name: path.stat().st_mode & 0o777 for path in (tmp_path / 'audit').iterdir()}
+    assert modes == {'audit-00000001.jsonl': 0o600, 'audit-00000001.idx': 0o600, 'journal.lock': 0o600}
@@ -0,0 +1,60 @@
+import multiprocessing
+
+from wemx_backups import BackupStore
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'))
+    target = tmp_path / 'site.conf'
+    target.write_text('one')
+    first = store.snapshot('nginx', str(target))
+    assert store.snapshot('nginx', str(target)) == first
+    target.write_text('two')
+    store.snapshot('nginx', str(target))
+    assert [entry['hash'] for entry in store.list('nginx')][1] == first['hash']
+    assert store.read('nginx', first['hash']) == b'one'
+
+
+def test_keep_limits_snapshots_and_collects_objects(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'), keep=2)
+    target = tmp_path / 'site.conf'
+    for version in range(4):
+        target.write_text(f'version {version}')
+        store.snapshot('nginx', str(target))
+    assert [store.read('nginx', entry['hash']) for entry in store.list('nginx')] == [b'version 3', b'version 2']
+    assert len(list((tmp_path / 'backups' / 'objects').glob('*/*.gz'))) == 2
+
+
+def test_keep_zero_keeps_nothing(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'), keep=0)
+    target = tmp_path / 'site.conf'
+    target.write_text('secret')
+    assert store.snapshot('nginx', str(target)) is None
+    assert store.list('nginx') == []
+    assert list((tmp_path / 'backups').glob('objects/*/*.gz')) == []
+
+
+def _snapshot_many(root, target, path, count):
+    store = BackupStore(root, keep=3)
+    for version in range(count):
+        with open(path, 'w') as f:
+            f.write(f'{target} {version}')
+        store.snapshot(target, path)
+
+
+def test_workers_do_not_lose_each_others_snapshots(tmp_path):
+    root = str(tmp_path / 'backups')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_snapshot_many, args=(root, target, str(tmp_path / target), 30))
+               for target in ('env', 'nginx', 'config')]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    store = BackupStore(root, keep=3)
+    for target in ('env', 'nginx', 'config'):
+        entries = store.list(target)
+        assert [store.read(target, entry['hash']).decode() for entry in entries] == \
+            [f'{target} {version}' for version in (29, 28, 27)]
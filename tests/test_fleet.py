@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from werkzeug.serving import make_server
+
+import wemx_app
+from wemx_audit import AuditJournal
+from wemx_fleet import (HEADER_NONCE, HEADER_SIGNATURE, HEADER_TIMESTAMP, RPC_PATH, FleetController,
+                        RequestVerifier, sign)
+from wemx_procs import CommandLimiter
+
+TOKEN = 'fleet-test-token'
+
+
+@pytest.fixture
+def agents(tmp_path, monkeypatch):
+    """Two agents serving the panel on localhost ports; yields {name: base URL}"""
+    monkeypatch.setattr(wemx_app, 'audit_journal', AuditJournal(str(tmp_path / 'audit')))
+    monkeypatch.setattr(wemx_app, 'command_limiter', CommandLimiter(lock_dir=str(tmp_path / 'slots')))
+    monkeypatch.setattr(wemx_app, 'fleet_verifier', RequestVerifier(TOKEN))
+    monkeypatch.setattr(wemx_app, 'collect_status', lambda: {'nginx': True, 'wemx_installed': True})
+    servers = [make_server('127.0.0.1', 0, wemx_app.app, threaded=True) for _ in range(2)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield {f'node{i}': f'http://127.0.0.1:{server.server_port}' for i, server in enumerate(servers, 1)}
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post_signed(base_url, operation, timestamp, nonce, token=TOKEN, body=b'{}'):
+    """Status code and JSON of a hand-signed RPC call"""
+    request = urllib.request.Request(base_url + RPC_PATH + operation, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        HEADER_TIMESTAMP: str(timestamp),
+        HEADER_NONCE: nonce,
+        HEADER_SIGNATURE: sign(token, timestamp, nonce, operation, body)
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_signed_call_runs_on_every_agent(agents):
+    result = FleetController(agents, TOKEN, timeout=5).call('status')
+    assert result['succeeded'] == ['node1', 'node2']
+    assert result['failed'] == []
+    assert all(node['nginx'] is True for node in result['nodes'].values())
+
+
+def test_bad_signature_is_rejected(agents):
+    result = FleetController(agents, 'wrong-token', timeout=5).call('status')
+    assert result['failed'] == ['node1', 'node2']
+    assert all(node['error'] == 'Bad signature' for node in result['nodes'].values())
+
+
+def test_stale_timestamp_is_rejected(agents):
+    status, result = post_signed(agents['node1'], 'status', int(time.time()) - 120, 'stale-nonce')
+    assert status == 403
+    assert 'clock skew' in result['error']
+
+
+def test_replayed_nonce_is_rejected(agents):
+    timestamp = int(time.time())
+    assert post_signed(agents['node1'], 'status', timestamp, 'once')[0] == 200
+    status, result = post_signed(agents['node1'], 'status', timestamp, 'once')
+    assert status == 403
+    assert result['error'] == 'Replayed request'
@@ -0,0 +1,57 @@
+import pytest
+
+from wemx_ipallow import IPAllowlist
+
+
+@pytest.mark.parametrize('address, allowed', [
+    ('10.1.2.3', False),
+    ('192.168.0.255', False),
+    ('192.168.1.0', True),
+    ('192.168.1.255', True),
+    ('192.168.2.0', False),
+    ('203.0.113.7', True),
+    ('203.0.113.8', False),
+    ('::ffff:192.168.1.10', True),
+    ('2001:db7:ffff:ffff:ffff:ffff:ffff:ffff', False),
+    ('2001:db8::', True),
+    ('2001:db8:0:ffff:ffff:ffff:ffff:ffff', True),
+    ('2001:db8:1::', False),
+    ('::1', True),
+    ('::2', False),
+    ('not-an-ip', False),
+    (None, False),
+])
+def test_cidr_boundaries(address, allowed):
+    allowlist = IPAllowlist(['192.168.1.0/24', '203.0.113.7', '2001:db8::/48', '::1'])
+    assert (address in allowlist) is allowed
+    # The memoised answer must match the first one
+    assert (address in allowlist) is allowed
+
+
+def test_adjacent_and_overlapping_ranges_merge():
+    allowlist = IPAllowlist(['10.0.0.0/25', '10.0.0.128/25', '10.0.0.64/26', '10.0.1.0/24'])
+    assert len(allowlist) == 1
+    assert '10.0.1.255' in allowlist
+    assert '10.0.2.0' not in allowlist
+
+
+def test_invalid_entries_are_listed_and_skipped():
+    allowlist = IPAllowlist(['10.0.0.1', '10.0.0.300', 'example.com'])
+    assert allowlist.invalid == ['10.0.0.300', 'example.com']
+    assert '10.0.0.1' in allowlist
+
+
+@pytest.mark.parametrize('peer, header, client', [
+    ('127.0.0.1', '198.51.100.4', '198.51.100.4'),
+    ('10.9.0.2', '198.51.100.4', '198.51.100.4'),
+    ('198.51.100.9', '127.0.0.1', '198.51.100.9'),
+    ('127.0.0.1', None, '127.0.0.1'),
+])
+def test_x_real_ip_is_honoured_only_from_trusted_proxies(monkeypatch, peer, header, client):
+    import wemx_app
+    monkeypatch.setattr(wemx_app, 'trusted_proxies', IPAllowlist(['127.0.0.1', '10.9.0.0/16']))
+    monkeypatch.setattr(wemx_app, 'ip_allowlist', IPAllowlist(['127.0.0.1', '198.51.100.4']))
+    headers = {'X-Real-IP': header} if header else {}
+    with wemx_app.app.test_request_context(environ_base={'REMOTE_ADDR': peer}, headers=headers):
+        assert wemx_app.get_client_ip() == client
+        assert wemx_app.check_ip() is (client in ('127.0.0.1', '198.51.100.4'))
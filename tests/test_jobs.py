@@ -0,0 +1,85 @@
+import threading
+
+from wemx_jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobManager
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def test_job_moves_from_queued_through_running_to_succeeded():
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    blocker = manager.submit('blocker', lambda job: release.wait(5) and {'success': True})
+
+    def steps(job, domain):
+        job.begin_step('Requesting certificate')
+        job.log(f'issuing {domain}\n')
+        job.end_step(True)
+        return {'success': True, 'domain': domain}
+
+    job = manager.submit('ssl', steps, 'example.com', total_steps=1)
+    # The single worker is busy, so the second job waits its turn
+    assert blocker.wait_for_change(0, timeout=2) and blocker.status == JOB_RUNNING
+    assert job.status == JOB_QUEUED
+    assert {j.id for j in manager.active()} == {blocker.id, job.id}
+
+    release.set()
+    assert job.wait(timeout=5)
+    snapshot = job.to_dict()
+    assert snapshot['status'] == JOB_SUCCEEDED
+    assert snapshot['result'] == {'success': True, 'domain': 'example.com'}
+    assert snapshot['error'] is None
+    assert snapshot['output'] == 'issuing example.com\n'
+    assert snapshot['completed_steps'] == snapshot['total_steps'] == 1
+    assert snapshot['created_at'] <= snapshot['started_at'] <= snapshot['finished_at']
+    assert manager.get(job.id) is job
+    assert manager.drain(timeout=5)
+    assert manager.active() == []
+
+
+def test_unsuccessful_result_fails_the_job():
+    manager = JobManager()
+    job = manager.submit('restart', lambda job: {'success': False, 'error': 'unit failed'})
+    assert job.wait(timeout=5)
+    assert (job.status, job.error) == (JOB_FAILED, 'unit failed')
+
+
+def test_exception_fails_the_job_and_keeps_output():
+    logger = RecordingLogger()
+    manager = JobManager(logger=logger)
+
+    def crash(job):
+        job.begin_step('Running migrations')
+        job.log('migrating\n')
+        raise RuntimeError('database is down')
+
+    job = manager.submit('migrate', crash)
+    assert job.wait(timeout=5)
+    assert job.status == JOB_FAILED
+    assert job.error == 'database is down'
+    assert job.result == {'success': False, 'error': 'database is down', 'output': 'migrating\n'}
+    assert job.progress()['current_step'] is None
+    assert len(logger.errors) == 1 and 'database is down' in logger.errors[0]
+
+
+def test_missing_result_counts_as_failure():
+    manager = JobManager()
+    job = manager.submit('noop', lambda job: None)
+    assert job.wait(timeout=5)
+    assert job.status == JOB_FAILED
+
+
+def test_oldest_finished_jobs_are_pruned():
+    manager = JobManager(max_finished=2)
+    jobs = [manager.submit(f'job-{index}', lambda job: {'success': True}) for index in range(3)]
+    assert manager.drain(timeout=5)
+    manager.submit('last', lambda job: {'success': True}).wait(timeout=5)
+    kept = [job.name for job in manager.list()]
+    assert jobs[0].name not in kept
+    assert manager.get(jobs[0].id) is None
+    assert len(kept) == 3
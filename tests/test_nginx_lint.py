@@ -0,0 +1,84 @@
+from wemx_nginx_lint import lint
+
+
+def errors(text):
+    return [issue for issue in lint(text, exists=lambda path: True) if issue['severity'] == 'error']
+
+
+def test_quic_listen_does_not_collide_with_tcp():
+    assert errors('''
+server {
+    listen 443 ssl;
+    listen 443 quic reuseport;
+    listen [::]:443 ssl;
+    listen [::]:443 quic reuseport;
+    server_name example.com;
+}
+''') == []
+
+
+def test_duplicate_listen_on_same_transport_is_an_error():
+    issues = errors('''
+server {
+    listen 443 quic;
+    listen 0.0.0.0:443 quic;
+}
+''')
+    assert [issue['line'] for issue in issues] == [4]
+    assert '(udp)' in issues[0]['message']
+
+
+def test_backslash_escapes_outside_quotes():
+    assert errors('''
+server {
+    listen 80;
+    location ~ ^/a\\{2\\}$ {
+        return 204;
+    }
+    location ~ \\.php$ {
+        return 404;
+    }
+}
+''') == []
+
+
+def test_unbalanced_braces_still_fail():
+    assert errors('server {\n    listen 80;\n') != []
+
+
+class StubStager:
+    def __init__(self, success=True):
+        self.success = success
+        self.applied = []
+
+    def apply(self, path, content):
+        self.applied.append(content)
+        return {'success': self.success, 'stdout': '', 'stderr': 'nginx: [emerg] test failed'}
+
+
+def save(monkeypatch, stager, **form):
+    import wemx_app
+    monkeypatch.setattr(wemx_app, 'check_root_permissions', lambda: True)
+    monkeypatch.setattr(wemx_app, 'nginx_stager', stager)
+    monkeypatch.setattr(wemx_app.backups, 'snapshot', lambda *args: None)
+    return wemx_app.app.test_client().post('/save-nginx-config', data=form).get_json()
+
+
+def test_save_refuses_lint_errors_without_force(monkeypatch):
+    stager = StubStager()
+    result = save(monkeypatch, stager, config_content='server {\n    listen 80;\n')
+    assert result['success'] is False
+    assert result['can_force'] is True
+    assert result['issues']
+    assert stager.applied == []
+
+
+def test_forced_save_skips_lint_but_still_runs_nginx_test(monkeypatch):
+    config = 'server {\n    listen 80;\n'
+    stager = StubStager()
+    assert save(monkeypatch, stager, config_content=config, force='1')['success'] is True
+    assert stager.applied == [config]
+
+    result = save(monkeypatch, StubStager(success=False), config_content=config, force='1')
+    assert result['success'] is False
+    assert 'live config left unchanged' in result['error']
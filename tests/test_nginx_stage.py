@@ -0,0 +1,107 @@
+import os
+
+from wemx_nginx_stage import NginxStager
+
+LIVE_SITE = 'server {\n    listen 80;\n}\n'
+CANDIDATE = 'server {\n    listen 8080;\n}\n'
+
+
+class RecordingRunner:
+    """Stands in for nginx -t: captures the shadow tree while it still exists"""
+
+    def __init__(self, success=True):
+        self.success = success
+        self.seen = None
+
+    def __call__(self, argv, shell=False, timeout=30):
+        config = argv[-1]
+        shadow = os.path.dirname(config)
+        with open(config) as f:
+            main = f.read()
+        enabled = os.path.join(shadow, 'sites-enabled', 'wemx.conf')
+        with open(enabled) as f:
+            site = f.read()
+        self.seen = {'argv': argv, 'shadow': shadow, 'main': main, 'site': site,
+                     'enabled_target': os.path.realpath(enabled),
+                     'mime_link': os.readlink(os.path.join(shadow, 'mime.types'))}
+        stderr = f'nginx: [emerg] unknown directive in {enabled}:2' if not self.success else ''
+        return {'success': self.success, 'stdout': '', 'stderr': stderr}
+
+
+def make_root(tmp_path):
+    root = tmp_path / 'etc' / 'nginx'
+    for directory in ('sites-available', 'sites-enabled'):
+        (root / directory).mkdir(parents=True)
+    (root / 'nginx.conf').write_text(f'http {{\n    include mime.types;\n    include {root}/sites-enabled/*;\n}}\n')
+    (root / 'mime.types').write_text('types {}\n')
+    (root / 'sites-available' / 'wemx.conf').write_text(LIVE_SITE)
+    os.symlink(root / 'sites-available' / 'wemx.conf', root / 'sites-enabled' / 'wemx.conf')
+    return root
+
+
+def stager(tmp_path, runner):
+    return NginxStager(runner, nginx_root=str(make_root(tmp_path)), staging_dir=str(tmp_path / 'staging'),
+                       nginx_binary='/usr/sbin/nginx')
+
+
+def test_includes_and_links_into_the_root_point_at_the_shadow(tmp_path):
+    runner = RecordingRunner()
+    nginx = stager(tmp_path, runner)
+    site = os.path.join(nginx.nginx_root, 'sites-available', 'wemx.conf')
+    assert nginx.validate(site, CANDIDATE)['success']
+
+    seen = runner.seen
+    assert seen['argv'] == ['/usr/sbin/nginx', '-t', '-c', os.path.join(seen['shadow'], 'nginx.conf')]
+    assert f"include {seen['shadow']}/sites-enabled/*;" in seen['main']
+    assert nginx.nginx_root + '/sites-enabled' not in seen['main']
+    # Relative includes and files without includes stay links to the live tree
+    assert 'include mime.types;' in seen['main']
+    assert seen['mime_link'] == os.path.join(nginx.nginx_root, 'mime.types')
+    # The enabled symlink now reaches the candidate, not the live site
+    assert seen['enabled_target'] == os.path.join(seen['shadow'], 'sites-available', 'wemx.conf')
+    assert seen['site'] == CANDIDATE
+
+    with open(site) as f:
+        assert f.read() == LIVE_SITE
+    assert os.listdir(nginx.staging_dir) == []
+
+
+def test_failed_test_leaves_the_live_file_untouched(tmp_path):
+    runner = RecordingRunner(success=False)
+    nginx = stager(tmp_path, runner)
+    site = os.path.join(nginx.nginx_root, 'sites-available', 'wemx.conf')
+    before = os.stat(site)
+
+    result = nginx.apply(site, CANDIDATE)
+    assert result['success'] is False
+    # Errors are reported against the live paths
+    assert runner.seen['shadow'] not in result['stderr']
+    assert os.path.join(nginx.nginx_root, 'sites-enabled', 'wemx.conf') in result['stderr']
+
+    with open(site) as f:
+        assert f.read() == LIVE_SITE
+    assert os.stat(site).st_ino == before.st_ino
+    assert os.listdir(nginx.staging_dir) == []
+
+
+def test_passing_test_replaces_the_live_file(tmp_path):
+    nginx = stager(tmp_path, RecordingRunner())
+    site = os.path.join(nginx.nginx_root, 'sites-available', 'wemx.conf')
+    assert nginx.apply(site, CANDIDATE)['success']
+    with open(site) as f:
+        assert f.read() == CANDIDATE
+
+
+def test_candidate_for_a_new_file_is_staged(tmp_path):
+    runner = RecordingRunner()
+    nginx = stager(tmp_path, runner)
+    new_site = os.path.join(nginx.nginx_root, 'conf.d', 'new.conf')
+    original = runner.__call__
+
+    def check(argv, **kwargs):
+        with open(os.path.join(os.path.dirname(argv[-1]), 'conf.d', 'new.conf')) as f:
+            assert f.read() == CANDIDATE
+        return original(argv, **kwargs)
+    nginx._runner = check
+    assert nginx.validate(new_site, CANDIDATE)['success']
+    assert not os.path.exists(new_site)
@@ -0,0 +1,81 @@
+import os
+import stat
+
+from wemx_permissions import PermissionFixer
+
+
+def mode(path):
+    return stat.S_IMODE(os.lstat(path).st_mode)
+
+
+def inodes(root):
+    return {path: (st.st_mode, st.st_uid, st.st_gid, st.st_ctime_ns)
+            for path, st in ((path, os.lstat(path)) for path in root.rglob('*'))}
+
+
+def make_tree(tmp_path):
+    root = tmp_path / 'wemx'
+    (root / 'storage' / 'logs').mkdir(parents=True)
+    (root / 'public').mkdir()
+    for path, file_mode in (('artisan', 0o600), ('.env', 0o644), ('public/index.php', 0o777),
+                            ('storage/logs/laravel.log', 0o600)):
+        (root / path).write_text('x')
+        os.chmod(root / path, file_mode)
+    os.chmod(root / 'public', 0o700)
+
+    outside = tmp_path / 'outside'
+    (outside / 'dir').mkdir(parents=True)
+    (outside / 'file').write_text('x')
+    (outside / 'dir' / 'inner').write_text('x')
+    for path in (outside / 'file', outside / 'dir' / 'inner'):
+        os.chmod(path, 0o600)
+    os.chmod(outside / 'dir', 0o700)
+    os.symlink(outside / 'file', root / 'public' / 'link')
+    os.symlink(outside / 'dir', root / 'public' / 'dirlink')
+    return root, outside
+
+
+def fixer(root):
+    return PermissionFixer(str(root), os.getuid(), os.getgid(),
+                           tree_modes={'storage': 0o775}, path_modes={'.env': 0o640}, workers=4)
+
+
+def test_fixes_modes_with_tree_and_path_overrides(tmp_path):
+    root, _ = make_tree(tmp_path)
+    stats = fixer(root).run()
+    assert stats['errors'] == 0
+    assert stats['scanned_files'] == 4
+    assert stats['scanned_dirs'] == 4
+    assert stats['scanned_links'] == 2
+    assert mode(root / 'artisan') == 0o644
+    assert mode(root / '.env') == 0o640
+    assert mode(root / 'public') == 0o755
+    assert mode(root / 'public' / 'index.php') == 0o644
+    assert mode(root / 'storage' / 'logs') == 0o775
+    assert mode(root / 'storage' / 'logs' / 'laravel.log') == 0o775
+
+
+def test_symlinks_are_neither_chmodded_nor_followed(tmp_path):
+    root, outside = make_tree(tmp_path)
+    fixer(root).run()
+    assert mode(outside / 'file') == 0o600
+    assert mode(outside / 'dir') == 0o700
+    assert mode(outside / 'dir' / 'inner') == 0o600
+
+
+def test_second_run_changes_nothing(tmp_path):
+    root, _ = make_tree(tmp_path)
+    first = fixer(root).run()
+    assert first['changed_mode'] > 0
+
+    before = inodes(root)
+    second = fixer(root).run()
+    assert (second['changed_owner'], second['changed_mode'], second['errors']) == (0, 0, 0)
+    # Even a no-op chmod or chown would bump ctime
+    assert inodes(root) == before
+
+
+def test_missing_root_is_reported_as_an_error(tmp_path):
+    stats = PermissionFixer(str(tmp_path / 'missing'), os.getuid(), os.getgid()).run()
+    assert stats['errors'] == 1
+    assert stats['running'] is False
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+import wemx_procs
+from wemx_procs import CommandBusy, CommandLimiter, command_category, spawn
+
+
+def alive(pid):
+    """True while pid exists and is not a zombie waiting to be reaped"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_timeout_kills_grandchildren(tmp_path, monkeypatch):
+    import wemx_app
+    monkeypatch.setattr(wemx_app, 'command_limiter', CommandLimiter(lock_dir=str(tmp_path / 'slots')))
+    pidfile = tmp_path / 'grandchild.pid'
+    # sh -> sh -> sleep: the sleep is a grandchild of the spawned command
+    command = f'sh -c "sleep 60 & echo \\$! > {pidfile}; wait"; wait'
+
+    started = time.monotonic()
+    result = wemx_app.run_command_with_privileges(command, timeout=0.5)
+    assert result == {'success': False, 'stdout': '', 'stderr': 'Command timed out', 'returncode': -1}
+    assert time.monotonic() - started < 10
+
+    pid = int(pidfile.read_text())
+    deadline = time.monotonic() + 2
+    while alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(pid)
+
+
+def test_category_slots_are_shared_across_limiters(tmp_path):
+    lock_dir = str(tmp_path / 'slots')
+    first = CommandLimiter(max_concurrent=8, category_limits={'packages': 1}, lock_dir=lock_dir)
+    second = CommandLimiter(max_concurrent=8, category_limits={'packages': 1}, lock_dir=lock_dir)
+    assert command_category(['apt-get', 'update']) == 'packages'
+
+    with first.slot('packages'):
+        with pytest.raises(CommandBusy):
+            with second.slot('packages', timeout=0.2):
+                pass
+        # Other categories only need a global slot
+        with second.slot('other', timeout=0.2):
+            pass
+    with second.slot('packages', timeout=0.2):
+        pass
+    assert second.snapshot()['system_wide'] is True
+
+
+def test_global_slots_are_shared_across_limiters(tmp_path):
+    lock_dir = str(tmp_path / 'slots')
+    first = CommandLimiter(max_concurrent=1, lock_dir=lock_dir)
+    second = CommandLimiter(max_concurrent=1, lock_dir=lock_dir)
+    with first.slot('other'):
+        with pytest.raises(CommandBusy):
+            with second.slot('services', timeout=0.2):
+                pass
+
+
+def limited_nofile(**spawn_kwargs):
+    process = spawn(['sh', '-c', 'sleep 0.2; ulimit -n'], limits={'nofile': 64},
+                    stdout=subprocess.PIPE, text=True, **spawn_kwargs)
+    stdout, _ = process.communicate(timeout=10)
+    return stdout.strip()
+
+
+@pytest.mark.skipif(not os.path.exists(wemx_procs.PRLIMIT), reason='prlimit is not installed')
+def test_limits_applied_through_prlimit():
+    assert limited_nofile() == '64'
+
+
+def test_limits_applied_without_prlimit(monkeypatch):
+    monkeypatch.setattr(wemx_procs, 'PRLIMIT', '/nonexistent/prlimit')
+    assert limited_nofile() == '64'
+
+
+def test_spawn_starts_a_new_session():
+    process = spawn(['sleep', '5'])
+    try:
+        assert os.getsid(process.pid) == process.pid
+    finally:
+        process.kill()
+        process.wait()
@@ -0,0 +1,33 @@
+import wemx_app
+from wemx_certs import CertificateInventory
+from wemx_jobs import Job
+
+
+def write_lineage(root, make_cert, name, days):
+    make_cert(root / 'live' / name / 'cert.pem', cn=name, sans=(f'DNS:{name}',), days=days)
+    (root / 'renewal').mkdir(exist_ok=True)
+    (root / 'renewal' / f'{name}.conf').write_text('[renewalparams]\nauthenticator = webroot\n')
+
+
+def test_plan_holds_only_lineages_inside_the_window(tmp_path, make_cert, monkeypatch):
+    root = tmp_path / 'letsencrypt'
+    write_lineage(root, make_cert, 'soon.example.com', 10)
+    write_lineage(root, make_cert, 'later.example.com', 80)
+    write_lineage(root, make_cert, 'sooner.example.com', 2)
+    monkeypatch.setattr(wemx_app, 'certificate_inventory', CertificateInventory(str(root)))
+
+    assert [cert['name'] for cert in wemx_app.renewal_plan(30)] == ['sooner.example.com', 'soon.example.com']
+
+
+def test_renew_lineage_skips_certbots_random_sleep(monkeypatch):
+    commands = []
+
+    def stream(command, timeout, shell):
+        commands.append(command)
+        yield 'exit', {'success': True, 'stdout': '', 'stderr': '', 'returncode': 0}
+    monkeypatch.setattr(wemx_app, 'stream_command_with_privileges', stream)
+
+    assert wemx_app.renew_lineage(Job('renew'), 'example.com', '--webroot -w /var/www/letsencrypt') == 'renewed'
+    assert commands == [['/usr/bin/certbot', 'renew', '--cert-name', 'example.com',
+                         '--webroot', '-w', '/var/www/letsencrypt',
+                         '--force-renewal', '--non-interactive', '--no-random-sleep-on-renew']]
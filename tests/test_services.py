@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+import wemx_app
+from wemx_services import FeedFull, StatusFeed, UnitTable
+
+UNKNOWN_UNIT = {'active_state': 'unknown', 'sub_state': 'unknown', 'load_state': 'unknown',
+                'since': None, 'next_elapse': None, 'last_trigger': None}
+
+
+class FakeBus:
+    """In-memory backend: set unit states and emit change events by hand"""
+
+    def __init__(self, states=None):
+        self.states = {unit: dict(UNKNOWN_UNIT, **state) for unit, state in (states or {}).items()}
+        self.snapshots = []
+        self._notify = None
+        self._closed = threading.Event()
+
+    def snapshot(self, units):
+        # Same shape as show_units()
+        self.snapshots.append(list(units))
+        return {unit: dict(self.states.get(unit, UNKNOWN_UNIT)) for unit in units}
+
+    def watch(self, units, notify, ready):
+        self._closed.clear()
+        self._notify = notify
+        ready()
+        self._closed.wait()
+
+    def emit(self, unit, **state):
+        """Change unit's state and announce it, as systemd would"""
+        self.set(unit, **state)
+        if self._notify is not None:
+            self._notify(unit)
+
+    def set(self, unit, **state):
+        """Change unit's state without an event, like a change the stream missed"""
+        self.states[unit] = dict(self.states.get(unit, UNKNOWN_UNIT), **state)
+
+    def close(self):
+        """End the watch stream"""
+        self._notify = None
+        self._closed.set()
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'condition not reached in time'
+        time.sleep(0.01)
+
+
+def live_table(bus, **kwargs):
+    table = UnitTable(['nginx', 'php8.1-fpm'], bus, **dict({'settle': 0.05, 'retry': 60}, **kwargs))
+    table.start()
+    wait_until(lambda: table.live)
+    return table
+
+
+def test_seed_snapshot_serves_reads_without_forking():
+    bus = FakeBus({'nginx': {'active_state': 'active', 'sub_state': 'running', 'load_state': 'loaded'}})
+    table = live_table(bus)
+
+    for _ in range(100):
+        assert table.get() == {'nginx': 'active', 'php8.1-fpm': 'unknown'}
+    assert bus.snapshots == [['nginx', 'php8.1-fpm']]
+    assert table.details()['nginx'] == dict(UNKNOWN_UNIT, active_state='active', sub_state='running',
+                                            load_state='loaded')
+
+
+def test_event_rereads_only_that_unit_after_settle_delay():
+    bus = FakeBus({'nginx': {'active_state': 'active'}})
+    table = live_table(bus, settle=0.2)
+    changes = []
+    table.on_change = lambda: changes.append(table.get())
+    table.get()
+
+    bus.emit('nginx', active_state='deactivating')
+    bus.emit('nginx', active_state='failed')
+    time.sleep(0.1)
+    assert table.get()['nginx'] == 'active'
+
+    wait_until(lambda: table.get()['nginx'] == 'failed')
+    assert bus.snapshots == [['nginx', 'php8.1-fpm'], ['nginx']]
+    assert table.events == 2
+    assert changes[-1]['nginx'] == 'failed'
+
+
+def test_invalidate_forces_a_fresh_snapshot():
+    bus = FakeBus({'nginx': {'active_state': 'active'}})
+    table = live_table(bus)
+    invalidated = []
+    table.on_invalidate = lambda: invalidated.append(True)
+    table.get()
+
+    bus.set('nginx', active_state='inactive')
+    assert table.get()['nginx'] == 'active'
+    table.invalidate()
+    assert table.get()['nginx'] == 'inactive'
+    assert invalidated == [True]
+    assert len(bus.snapshots) == 2
+
+
+def test_falls_back_to_polling_when_the_stream_closes():
+    bus = FakeBus({'nginx': {'active_state': 'active'}})
+    table = live_table(bus, poll_ttl=0.2)
+    table.get()
+
+    bus.close()
+    wait_until(lambda: not table.live)
+    bus.set('nginx', active_state='failed')
+    assert table.get()['nginx'] == 'failed'
+
+    bus.set('nginx', active_state='active')
+    assert table.get()['nginx'] == 'failed'
+    time.sleep(0.25)
+    assert table.get()['nginx'] == 'active'
+
+
+def test_feed_pushes_one_sample_to_every_subscriber():
+    samples = []
+    feed = StatusFeed(lambda: samples.append(1) or {'nginx': len(samples) > 1}, interval=60)
+    subscriptions = [feed.subscribe() for _ in range(3)]
+    assert [next(s) for s in subscriptions] == [('status', {'nginx': False})] * 3
+    feed.poke()
+    assert [next(s) for s in subscriptions] == [('delta', {'nginx': True})] * 3
+    assert len(samples) == 2
+    for subscription in subscriptions:
+        subscription.close()
+
+
+def test_feed_slot_is_freed_when_closed_before_first_event():
+    feed = StatusFeed(lambda: {}, interval=60, max_subscribers=1)
+    feed.subscribe().close()
+    subscription = feed.subscribe()
+    with pytest.raises(FeedFull):
+        feed.subscribe()
+    subscription.close()
+    subscription.close()
+    feed.subscribe().close()
+
+
+def test_status_stream_abandoned_before_iteration_frees_its_slot(monkeypatch):
+    feed = StatusFeed(lambda: {'nginx': True}, interval=60, max_subscribers=1)
+    monkeypatch.setattr(wemx_app, 'status_feed', feed)
+    client = wemx_app.app.test_client()
+    for _ in range(3):
+        response = client.get('/status/stream', buffered=False)
+        assert response.status_code == 200
+        response.close()
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from wemx_singleflight import SingleFlight
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def concurrent_calls(flights, key, func, callers=5):
+    """Start callers threads calling flights.call(key, func); returns (threads, results)"""
+    results = [None] * callers
+
+    def call(index):
+        results[index] = flights.call(key, func)
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_result():
+    attached = []
+    flights = SingleFlight(on_attach=attached.append)
+    release = threading.Event()
+    runs = []
+
+    def restart():
+        runs.append(1)
+        release.wait(5)
+        return {'success': True, 'output': 'restarted'}
+
+    threads, results = concurrent_calls(flights, ('restart', 'nginx'), restart)
+    assert wait_until(lambda: len(attached) == 4)
+    assert flights.in_flight() == [{'key': ['restart', 'nginx'], 'attached': 4}]
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert runs == [1]
+    assert sorted(result.get('coalesced', False) for result in results) == [False] + [True] * 4
+    assert all(dict(result, coalesced=True) == {'success': True, 'output': 'restarted', 'coalesced': True}
+               for result in results)
+    assert flights.in_flight() == []
+
+
+def test_concurrent_callers_share_one_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fail():
+        runs.append(1)
+        release.wait(5)
+        raise RuntimeError('unit not found')
+
+    threads, results = concurrent_calls(flights, ('restart', 'missing'), fail)
+    assert wait_until(lambda: flights.in_flight() and flights.in_flight()[0]['attached'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert runs == [1]
+    assert all(result['success'] is False and result['error'] == 'unit not found' for result in results)
+
+
+def test_a_finished_flight_is_not_reused():
+    flights = SingleFlight()
+    runs = []
+
+    def run():
+        runs.append(1)
+        return {'success': True}
+
+    assert flights.call(('reload', 'nginx'), run) == {'success': True}
+    assert flights.call(('reload', 'nginx'), run) == {'success': True}
+    assert runs == [1, 1]
+
+
+def test_followers_replay_output_from_the_start():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def factory():
+        yield 'output', 'stopping\n'
+        release.wait(5)
+        yield 'output', 'starting\n'
+        yield 'result', {'success': True}
+
+    leader = flights.events(('restart', 'php'), factory)
+    assert next(leader) == ('output', 'stopping\n')
+    follower = flights.events(('restart', 'php'), factory)
+    release.set()
+
+    assert list(leader) == [('output', 'starting\n'), ('result', {'success': True})]
+    assert list(follower) == [('output', 'stopping\n'), ('output', 'starting\n'),
+                              ('result', {'success': True, 'coalesced': True})]
+    assert flights.drain(timeout=2)
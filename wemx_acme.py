@@ -0,0 +1,131 @@
+import os
+import re
+import socket
+import ssl
+import threading
+import time
+
+from wemx_certs import CertificateError, parse_certificate
+from wemx_files import atomic_write
+
+ACME_CHALLENGE_SNIPPET = '''# Managed by the WemX admin panel: serves Let's Encrypt HTTP-01 challenges
+location ^~ /.well-known/acme-challenge/ {{
+    root {webroot};
+    default_type "text/plain";
+    try_files $uri =404;
+}}
+'''
+
+SERVER_BLOCK_RE = re.compile(r'^(\s*)server\s*\{\s*(#.*)?$')
+
+
+def write_challenge_snippet(snippet_path, webroot):
+    """Create the webroot and the nginx snippet serving it; returns True if the snippet changed"""
+    os.makedirs(os.path.join(webroot, '.well-known', 'acme-challenge'), mode=0o755, exist_ok=True)
+    content = ACME_CHALLENGE_SNIPPET.format(webroot=webroot)
+    try:
+        with open(snippet_path, 'r') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(snippet_path), mode=0o755, exist_ok=True)
+    atomic_write(snippet_path, content, mode=0o644)
+    return True
+
+
+def add_snippet_include(config_text, snippet_path):
+    """config_text with ``include snippet_path;`` opening every server block
+
+    Returns None when the snippet is already included somewhere, so the
+    caller knows nothing needs to be written.
+    """
+    if snippet_path in config_text:
+        return None
+    lines = config_text.split('\n')
+    output = []
+    for line in lines:
+        output.append(line)
+        match = SERVER_BLOCK_RE.match(line)
+        if match:
+            output.append(f'{match.group(1)}    include {snippet_path};')
+    return '\n'.join(output)
+
+
+class AvailabilityProbe:
+    """Background prober that measures how long nginx stops answering
+
+    Every interval it sends a HEAD request to address and counts the probe
+    as up if any HTTP response comes back, whatever its status or Server
+    header (sites may run with server_tokens off). Downtime is the summed
+    length of the failed probe intervals.
+    """
+
+    def __init__(self, address=('127.0.0.1', 80), interval=0.1, timeout=1.0):
+        self.address = address
+        self.interval = interval
+        self.timeout = timeout
+        self.probes = 0
+        self.failed_probes = 0
+        self.downtime = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='wemx-availability-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        return {
+            'probes': self.probes,
+            'failed_probes': self.failed_probes,
+            'downtime_seconds': round(self.downtime, 3)
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            up = self._probe()
+            self.probes += 1
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+            if not up:
+                self.failed_probes += 1
+                self.downtime += time.monotonic() - started
+
+    def _probe(self):
+        try:
+            with socket.create_connection(self.address, timeout=self.timeout) as sock:
+                sock.sendall(b'HEAD / HTTP/1.0\r\nHost: localhost\r\n\r\n')
+                return sock.recv(4096).startswith(b'HTTP/')
+        except OSError:
+            return False
+
+
+def served_certificate(server_name, address=('127.0.0.1', 443), timeout=2.0):
+    """Parsed certificate nginx presents for server_name, or None if none is served"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        with socket.create_connection(address, timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=server_name) as tls:
+                der = tls.getpeercert(binary_form=True)
+        return parse_certificate(der) if der else None
+    except (OSError, CertificateError):
+        return None
+
+
+def wait_until_served(server_name, serial, timeout=10.0, interval=0.2):
+    """Seconds until nginx serves the certificate with serial for server_name, or None"""
+    started = time.monotonic()
+    while True:
+        cert = served_certificate(server_name)
+        if cert is not None and cert['serial'] == serial:
+            return time.monotonic() - started
+        if time.monotonic() - started >= timeout:
+            return None
+        time.sleep(interval)
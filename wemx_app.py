@@ -1,24 +1,139 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from werkzeug.serving import make_server
 import os
 import subprocess
-import shutil
-from datetime import datetime
+import selectors
+import json
+import time
+import threading
 import re
+import socket
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pwd
 import grp
+import wemx_config
 from wemx_config import WHITELISTED_IPS
+from wemx_jobs import JobManager
+from wemx_services import UnitTable, JournalBackend, SystemctlBackend, StatusFeed, FeedFull
+from wemx_permissions import PermissionFixer
+from wemx_ipallow import IPAllowlist
+from wemx_envfile import EnvFileCache
+from wemx_files import atomic_write
+from wemx_backups import BackupStore, BackupError
+from wemx_users import UserInventory
+from wemx_cmdcache import CommandResultCache
+from wemx_certs import CertificateInventory, format_certificates
+from wemx_nginx_lint import lint as lint_nginx_config
+from wemx_nginx_stage import NginxStager
+from wemx_acme import AvailabilityProbe, write_challenge_snippet, add_snippet_include, wait_until_served
+from wemx_timing import HookTimer, TimedSessionInterface, TimingMiddleware
+from wemx_procs import CommandLimiter, CommandBusy, command_category, spawn, kill_tree
+from wemx_singleflight import SingleFlight
+from wemx_audit import AuditJournal, redact
+from wemx_fleet import FleetController, RequestVerifier, FleetAuthError
+from wemx_metrics import Registry, Counter, Histogram, command_labels, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import wemx_artisan
+import wemx_server
 
 app = Flask(__name__)
 app.secret_key = 'wemx-secret-key-change-this'
 
+# Cost of the per-request hook chain (allowlist, session, other hooks); see /timings
+hook_timer = HookTimer()
+app.session_interface = TimedSessionInterface(hook_timer)
+app.wsgi_app = TimingMiddleware(app.wsgi_app, hook_timer)
+
+# Prometheus metrics for this process, served at /metrics
+metrics = Registry()
+command_duration = Histogram('wemx_command_duration_seconds', 'Wall time of commands run by the panel',
+                             ['executable', 'verb'], registry=metrics)
+command_runs = Counter('wemx_commands_total', 'Commands run by the panel by exit code',
+                       ['executable', 'verb', 'exit_code'], registry=metrics)
+command_timeouts = Counter('wemx_command_timeouts_total', 'Commands killed after their timeout',
+                           ['executable', 'verb'], registry=metrics)
+command_output = Counter('wemx_command_output_bytes_total', 'Bytes commands wrote to stdout/stderr',
+                         ['executable', 'verb', 'stream'], registry=metrics)
+http_duration = Histogram('wemx_http_request_duration_seconds', 'Time until a view returns its response (streamed bodies excluded)',
+                          ['endpoint', 'method'], registry=metrics)
+http_requests = Counter('wemx_http_requests_total', 'HTTP requests by status code',
+                        ['endpoint', 'method', 'status'], registry=metrics)
+
 ENV_FILE_PATH = '/var/www/wemx/.env'
+WEMX_PATH = '/var/www/wemx'
+NGINX_CONFIG_PATH = '/etc/nginx/sites-available/wemx.conf'
+ADMIN_CONFIG_PATH = '/opt/wemx-admin/wemx_config.py'
+
+# Snapshots of every file the panel edits, taken before each save
+BACKUP_TARGETS = {'env': ENV_FILE_PATH, 'nginx': NGINX_CONFIG_PATH, 'config': ADMIN_CONFIG_PATH}
+backups = BackupStore(
+    getattr(wemx_config, 'BACKUP_DIR', '/var/lib/wemx-admin/backups'),
+    keep=getattr(wemx_config, 'BACKUP_KEEP', 20),
+    max_age_days=getattr(wemx_config, 'BACKUP_MAX_AGE_DAYS', 90)
+)
+
+# Journal of every state-changing request (who, what, how long, outcome)
+audit_journal = AuditJournal(
+    getattr(wemx_config, 'AUDIT_DIR', '/var/lib/wemx-admin/audit'),
+    segment_bytes=getattr(wemx_config, 'AUDIT_SEGMENT_BYTES', 8 * 1024 * 1024),
+    keep_segments=getattr(wemx_config, 'AUDIT_KEEP_SEGMENTS', 100)
+)
+AUDITED_METHODS = ('POST', 'PUT', 'DELETE')
+# Read-only POSTs fired continuously by the UI
+AUDIT_EXCLUDED_ENDPOINTS = {'lint_nginx_config_route'}
+
+# Laravel needs these writable by the web server group; chmod -R semantics
+WEMX_WRITABLE_TREES = {'storage': 0o775, 'bootstrap/cache': 0o775, 'public': 0o775}
+PERMISSION_WORKERS = getattr(wemx_config, 'PERMISSION_WORKERS', 8)
+
+# Long-running operations (certbot, apt) run here instead of on the request thread
+JOB_WORKERS = getattr(wemx_config, 'JOB_WORKERS', 2)
+jobs = JobManager(max_workers=JOB_WORKERS, logger=app.logger)
+
+# PHP-FPM versions checked by /status, most preferred first
+PHP_FPM_VERSIONS = ['8.2', '8.1', '8.0', '7.4']
+
+# The effective uid does not change while the process runs, so check it once
+ROOT_PRIVILEGES = os.geteuid() == 0
+if not ROOT_PRIVILEGES:
+    app.logger.warning("Application not running with root privileges - some functions may fail")
+
+# Every command runs in its own session under these rlimits, and holds a slot of
+# the global and its category's limit (apt, certbot, filesystem...) while it runs
+COMMAND_RLIMITS = getattr(wemx_config, 'COMMAND_RLIMITS', {'cpu': 900, 'memory': 4 * 1024 ** 3, 'nofile': 4096})
+COMMAND_CONCURRENCY = getattr(wemx_config, 'COMMAND_CONCURRENCY', 8)
+COMMAND_CATEGORY_LIMITS = getattr(wemx_config, 'COMMAND_CATEGORY_LIMITS',
+                                  {'packages': 1, 'filesystem': 1, 'certbot': 2, 'artisan': 2})
+try:
+    # Lock files under COMMAND_SLOT_DIR make the caps hold across all workers
+    command_limiter = CommandLimiter(COMMAND_CONCURRENCY, COMMAND_CATEGORY_LIMITS,
+                                     lock_dir=getattr(wemx_config, 'COMMAND_SLOT_DIR', '/run/wemx-admin/slots'))
+except OSError as e:
+    app.logger.warning(f"Command concurrency caps apply per worker, slot directory unavailable: {e}")
+    command_limiter = CommandLimiter(COMMAND_CONCURRENCY, COMMAND_CATEGORY_LIMITS)
 
 def check_root_permissions():
     """Check if running with sufficient privileges"""
-    return os.geteuid() == 0
+    return ROOT_PRIVILEGES
+
+def observe_command(command, started, exit_code, stdout_bytes, stderr_bytes):
+    """Record one finished command in the command metrics"""
+    executable, verb = command_labels(command)
+    command_duration.observe(time.monotonic() - started, executable=executable, verb=verb)
+    command_runs.inc(executable=executable, verb=verb, exit_code=exit_code)
+    if exit_code == 'timeout':
+        command_timeouts.inc(executable=executable, verb=verb)
+    command_output.inc(stdout_bytes, executable=executable, verb=verb, stream='stdout')
+    command_output.inc(stderr_bytes, executable=executable, verb=verb, stream='stderr')
 
 def run_command_with_privileges(command, timeout=30, shell=True, cwd=None):
-    """Run command with proper error handling and privileges"""
+    """Run command with proper error handling and privileges
+    
+    The command gets its own session (so a timeout kills everything it
+    started, not just the shell), COMMAND_RLIMITS, and a command_limiter slot.
+    """
+    started = time.monotonic()
     try:
         if isinstance(command, str) and not shell:
             command = command.split()
@@ -27,30 +142,54 @@ def run_command_with_privileges(command, timeout=30, shell=True, cwd=None):
         env = os.environ.copy()
         env['PATH'] = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
         
-        result = subprocess.run(
-            command, 
-            shell=shell,
-            capture_output=True, 
-            text=True, 
-            timeout=timeout,
-            cwd=cwd,
-            env=env  # Use proper environment
-        )
-        
+        with command_limiter.slot(command_category(command), timeout=timeout):
+            process = spawn(
+                command,
+                limits=COMMAND_RLIMITS,
+                shell=shell,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                cwd=cwd,
+                env=env  # Use proper environment
+            )
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                kill_tree(process)
+                process.stdout.close()
+                process.stderr.close()
+                raise
+            finally:
+                if process.poll() is None:
+                    kill_tree(process)
+        
+        observe_command(command, started, process.returncode,
+                        len(stdout.encode()), len(stderr.encode()))
         return {
-            'success': result.returncode == 0,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'returncode': result.returncode
+            'success': process.returncode == 0,
+            'stdout': stdout,
+            'stderr': stderr,
+            'returncode': process.returncode
         }
     except subprocess.TimeoutExpired:
+        observe_command(command, started, 'timeout', 0, 0)
         return {
             'success': False,
             'stdout': '',
             'stderr': 'Command timed out',
             'returncode': -1
         }
+    except CommandBusy as e:
+        observe_command(command, started, 'busy', 0, 0)
+        return {
+            'success': False,
+            'stdout': '',
+            'stderr': str(e),
+            'returncode': -1
+        }
     except Exception as e:
+        observe_command(command, started, 'error', 0, 0)
         return {
             'success': False,
             'stdout': '',
@@ -58,43 +197,314 @@ def run_command_with_privileges(command, timeout=30, shell=True, cwd=None):
             'returncode': -1
         }
 
+def stream_command_with_privileges(command, timeout=30, shell=True, cwd=None):
+    """Run command and yield its output line by line as it is produced
+
+    Yields ('stdout', line) and ('stderr', line) tuples, then a final
+    ('exit', result) with the same shape run_command_with_privileges returns.
+    Process group, limits and concurrency slot are as there.
+    """
+    if isinstance(command, str) and not shell:
+        command = command.split()
+    
+    env = os.environ.copy()
+    env['PATH'] = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+    
+    started = time.monotonic()
+    with ExitStack() as stack:
+        try:
+            stack.enter_context(command_limiter.slot(command_category(command), timeout=timeout))
+            process = spawn(
+                command,
+                limits=COMMAND_RLIMITS,
+                shell=shell,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=env
+            )
+        except CommandBusy as e:
+            observe_command(command, started, 'busy', 0, 0)
+            yield 'exit', {'success': False, 'stdout': '', 'stderr': str(e), 'returncode': -1}
+            return
+        except Exception as e:
+            observe_command(command, started, 'error', 0, 0)
+            yield 'exit', {'success': False, 'stdout': '', 'stderr': str(e), 'returncode': -1}
+            return
+        
+        captured = {'stdout': [], 'stderr': []}
+        partial = {'stdout': b'', 'stderr': b''}
+        output_bytes = {'stdout': 0, 'stderr': 0}
+        exit_code = 'aborted'
+        deadline = time.monotonic() + timeout
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+        
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(command, timeout)
+                
+                for key, _ in selector.select(remaining):
+                    name = key.data
+                    chunk = os.read(key.fd, 65536)
+                    output_bytes[name] += len(chunk)
+                    if not chunk:
+                        # EOF - flush a trailing line without newline
+                        selector.unregister(key.fileobj)
+                        lines = [partial[name]] if partial[name] else []
+                        partial[name] = b''
+                    else:
+                        *lines, partial[name] = (partial[name] + chunk).split(b'\n')
+                        lines = [line + b'\n' for line in lines]
+                    
+                    for line in lines:
+                        text = line.decode('utf-8', errors='replace')
+                        captured[name].append(text)
+                        yield name, text
+            
+            returncode = process.wait(timeout=max(0, deadline - time.monotonic()))
+            exit_code = returncode
+            yield 'exit', {
+                'success': returncode == 0,
+                'stdout': ''.join(captured['stdout']),
+                'stderr': ''.join(captured['stderr']),
+                'returncode': returncode
+            }
+        except subprocess.TimeoutExpired:
+            exit_code = 'timeout'
+            yield 'exit', {
+                'success': False,
+                'stdout': ''.join(captured['stdout']),
+                'stderr': 'Command timed out',
+                'returncode': -1
+            }
+        finally:
+            # Also reached when the client disconnects mid-stream
+            observe_command(command, started, exit_code, output_bytes['stdout'], output_bytes['stderr'])
+            selector.close()
+            if process.poll() is None or exit_code == 'timeout':
+                kill_tree(process)
+            process.stdout.close()
+            process.stderr.close()
+
+def command_events(command, **kwargs):
+    """Yield ('output', line) events for a command and return its result
+
+    Use as ``result = yield from command_events(...)`` inside an event generator.
+    """
+    for stream, item in stream_command_with_privileges(command, **kwargs):
+        if stream == 'exit':
+            return item
+        yield 'output', item
+
+def wants_event_stream():
+    """Whether the client asked for Server-Sent Events instead of JSON"""
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(generate):
+    """Stream a generator of SSE strings without proxy buffering"""
+    return Response(
+        stream_with_context(generate),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def command_response(events):
+    """Send an operation's events live as SSE, or its final result as JSON
+
+    events yields ('output', text) while running and ends with ('result', dict).
+    """
+    if wants_event_stream():
+        return sse_response(sse_event(kind, payload) for kind, payload in events)
+    
+    result = {'success': False, 'error': 'Operation produced no result'}
+    for kind, payload in events:
+        if kind == 'result':
+            result = payload
+    return jsonify(result)
+
+# Unit states kept current from systemd's journal, so /status and the certbot
+# check read memory instead of forking systemctl. 'poll' re-reads at most every
+# STATUS_CACHE_TTL seconds instead
+STATUS_CACHE_TTL = getattr(wemx_config, 'STATUS_CACHE_TTL', 5)
+UNIT_STATE_BACKENDS = {'journal': JournalBackend, 'poll': SystemctlBackend}
+service_status = UnitTable(
+    ['nginx'] + [f'php{version}-fpm' for version in PHP_FPM_VERSIONS] + ['certbot.timer'],
+    UNIT_STATE_BACKENDS[getattr(wemx_config, 'UNIT_STATE_BACKEND', 'journal')](run_command_with_privileges),
+    poll_ttl=STATUS_CACHE_TTL,
+    logger=app.logger
+)
+
+# Let's Encrypt lineages parsed from /etc/letsencrypt, re-read only when files change
+certificate_inventory = CertificateInventory()
+
+# 'webroot' answers HTTP-01 challenges through the running nginx; 'standalone'
+# stops nginx so certbot can bind port 80 itself
+CERTBOT_CHALLENGE = getattr(wemx_config, 'CERTBOT_CHALLENGE', 'webroot')
+ACME_WEBROOT = getattr(wemx_config, 'ACME_WEBROOT', '/var/www/letsencrypt')
+ACME_SNIPPET_PATH = '/etc/nginx/snippets/wemx-acme-challenge.conf'
+
+# Renewal only touches lineages expiring within the window. certbot holds a lock
+# on /etc/letsencrypt while it runs, so concurrency above 1 only helps setups
+# that give each run its own config directory
+RENEWAL_WINDOW_DAYS = getattr(wemx_config, 'RENEWAL_WINDOW_DAYS', 30)
+RENEWAL_CONCURRENCY = getattr(wemx_config, 'RENEWAL_CONCURRENCY', 1)
+lineage_locks = {}
+lineage_locks_guard = threading.Lock()
+
+# Read-only inspection commands (uname, certbot --version, license:check); routes that
+# change their output invalidate the matching tags
+COMMAND_CACHE_SIZE = getattr(wemx_config, 'COMMAND_CACHE_SIZE', 64)
+command_cache_lookups = Counter('wemx_command_cache_total', 'Read-only command cache lookups by result',
+                                ['result'], registry=metrics)
+inspection_cache = CommandResultCache(
+    run_command_with_privileges,
+    max_entries=COMMAND_CACHE_SIZE,
+    on_lookup=lambda outcome: command_cache_lookups.inc(result=outcome)
+)
+
+# Edited nginx config is validated in a shadow copy of /etc/nginx before it replaces the live file
+nginx_stager = NginxStager(
+    run_command_with_privileges,
+    staging_dir=getattr(wemx_config, 'NGINX_STAGING_DIR', '/var/lib/wemx-admin/nginx-staging')
+)
+
 def stop_nginx_service():
     """Stop nginx service"""
-    return run_command_with_privileges(['/usr/bin/systemctl', 'stop', 'nginx'], shell=False, timeout=30)
+    result = run_command_with_privileges(['/usr/bin/systemctl', 'stop', 'nginx'], shell=False, timeout=30)
+    service_status.invalidate()
+    return result
 
 def start_nginx_service():
     """Start nginx service"""  
-    return run_command_with_privileges(['/usr/bin/systemctl', 'start', 'nginx'], shell=False, timeout=30)
+    result = run_command_with_privileges(['/usr/bin/systemctl', 'start', 'nginx'], shell=False, timeout=30)
+    service_status.invalidate()
+    return result
+
+def reload_nginx_service():
+    """Test the nginx config, then reload it without dropping connections"""
+    test_result = run_command_with_privileges(['/usr/sbin/nginx', '-t'], shell=False)
+    if not test_result['success']:
+        return test_result
+    result = run_command_with_privileges(['/usr/bin/systemctl', 'reload', 'nginx'], shell=False, timeout=30)
+    service_status.invalidate()
+    return result
+
+def run_job_step(job, title, command, **kwargs):
+    """Run a command as a named step of a background job"""
+    job.begin_step(title)
+    job.log(f"{title}:\n")
+    for stream, item in stream_command_with_privileges(command, **kwargs):
+        if stream == 'exit':
+            result = item
+        else:
+            job.log(item)
+    if not result['success'] and result['stderr'] == 'Command timed out':
+        job.log("Command timed out\n")
+    job.log("\n")
+    job.end_step(result['success'])
+    return result
+
+def job_started_response(job, message):
+    """Response for a POST that handed its work to a background job"""
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'message': message
+    }), 202
+
+# Compiled once at load; entries may be single addresses or CIDR ranges
+ip_allowlist = IPAllowlist(WHITELISTED_IPS)
+if ip_allowlist.invalid:
+    app.logger.warning(f"Ignoring invalid WHITELISTED_IPS entries: {', '.join(map(str, ip_allowlist.invalid))}")
+
+# Only these peers may set X-Real-IP (e.g. nginx proxying on the same host)
+TRUSTED_PROXIES = getattr(wemx_config, 'TRUSTED_PROXIES', ['127.0.0.1', '::1'])
+trusted_proxies = IPAllowlist(TRUSTED_PROXIES)
+
+def get_client_ip():
+    """Client address, honouring X-Real-IP only from a trusted proxy"""
+    real_ip = request.environ.get('HTTP_X_REAL_IP')
+    if real_ip and request.remote_addr in trusted_proxies:
+        return real_ip.strip()
+    return request.remote_addr
 
 def check_ip():
     """Check if the request IP is whitelisted"""
-    client_ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
-    if client_ip not in WHITELISTED_IPS:
-        return False
-    return True
+    return get_client_ip() in ip_allowlist
+
+@app.before_request
+def start_request_metrics():
+    """Remember when the request reached Flask, for the route latency histogram"""
+    request.environ['wemx.started'] = time.monotonic()
 
 @app.before_request
 def before_request():
-    """Check IP whitelist and permissions before each request"""
+    """Check IP whitelist before each request"""
     if not check_ip():
         return redirect('https://acd.swiftpeakhosting.com/')
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency, labelled by route endpoint"""
+    started = request.environ.get('wemx.started')
+    endpoint = request.endpoint or 'unmatched'
+    if started is not None:
+        http_duration.observe(time.monotonic() - started, endpoint=endpoint, method=request.method)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def record_audit_entry(response):
+    """Journal state-changing requests once the response has been fully sent"""
+    if request.method not in AUDITED_METHODS or request.endpoint in AUDIT_EXCLUDED_ENDPOINTS:
+        return response
     
-    # Log permission status
-    if not check_root_permissions():
-        app.logger.warning("Application not running with root privileges - some functions may fail")
+    started = request.environ.get('wemx.started', time.monotonic())
+    result = None if response.is_streamed else response.get_json(silent=True)
+    entry = {
+        'ip': get_client_ip(),
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else request.path,
+        'path': request.path,
+        'args': redact({**(request.view_args or {}), **request.form.to_dict()}),
+        'status': response.status_code,
+        # Streamed (SSE) responses report their outcome to the client only
+        'success': result.get('success') if isinstance(result, dict) else None,
+        'error': result.get('error') if isinstance(result, dict) else None
+    }
+    
+    def write():
+        entry['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        try:
+            audit_journal.record(entry)
+        except OSError as e:
+            app.logger.error(f"Could not write audit entry: {e}")
+    
+    response.call_on_close(write)
+    return response
+
+# Accounts for the user dropdowns, rebuilt when /etc/passwd or /home changes
+user_inventory = UserInventory()
+
+# Parsed .env documents, reused until the file's inode/mtime/size changes
+env_files = EnvFileCache()
 
 def parse_env_file(file_path):
     """Parse .env file into key-value pairs"""
     env_vars = {}
     if os.path.exists(file_path):
         try:
-            with open(file_path, 'r') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        if '=' in line:
-                            key, value = line.split('=', 1)
-                            env_vars[key.strip()] = value.strip()
+            env_vars = env_files.document(file_path).to_dict()
         except PermissionError:
             app.logger.error(f"Permission denied reading {file_path}")
         except Exception as e:
@@ -102,26 +512,26 @@ def parse_env_file(file_path):
     return env_vars
 
 def write_env_file(file_path, env_vars):
-    """Write environment variables back to .env file"""
+    """Write environment variables back to .env file
+
+    Only lines whose key changed are rewritten; comments and blank lines are
+    kept, and the file is replaced atomically.
+    """
     try:
-        # Create backup
-        if os.path.exists(file_path):
-            backup_path = f"{file_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(file_path, backup_path)
+        def backup():
+            backups.snapshot('env', file_path)
         
         # Ensure directory exists
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        with open(file_path, 'w') as f:
-            for key, value in env_vars.items():
-                f.write(f"{key}={value}\n")
-        
-        # Set proper ownership and permissions
+        # Set proper ownership and permissions on the new file before it goes live
+        uid = gid = None
         if check_root_permissions():
             # Get www-data user/group IDs
             www_data_user = pwd.getpwnam('www-data')
-            os.chown(file_path, www_data_user.pw_uid, www_data_user.pw_gid)
-            os.chmod(file_path, 0o644)
+            uid, gid = www_data_user.pw_uid, www_data_user.pw_gid
+        
+        return env_files.write(file_path, env_vars, mode=0o644, uid=uid, gid=gid, before_write=backup)
             
     except Exception as e:
         app.logger.error(f"Error writing {file_path}: {str(e)}")
@@ -149,8 +559,11 @@ def save_env():
                 if var_key:  # Only add if key is not empty
                     env_vars[var_key] = var_value
         
-        write_env_file(ENV_FILE_PATH, env_vars)
-        flash('WemX environment file saved successfully!', 'success')
+        changes = write_env_file(ENV_FILE_PATH, env_vars)
+        if changes:
+            flash(f'WemX environment file saved successfully! ({changes} changed)', 'success')
+        else:
+            flash('No changes to save.', 'success')
     except Exception as e:
         flash(f'Error saving file: {str(e)}', 'error')
     
@@ -159,33 +572,83 @@ def save_env():
 @app.route('/commands')
 def commands():
     """Commands page for WemX management"""
-    # Get list of system users for dropdown
+    # User dropdowns load lazily from /api/users
+    return render_template('wemx_commands.html')
+
+@app.route('/api/users')
+def api_users():
+    """Filterable, paginated list of system users with home directories"""
     try:
-        result = run_command_with_privileges(['/usr/bin/cut', '-d:', '-f1', '/etc/passwd'], shell=False)
-        if result['success']:
-            all_users = result['stdout'].strip().split('\n')
-            # Filter to only show users with home directories
-            system_users = []
-            for user in all_users:
-                home_dir = f'/home/{user}'
-                if os.path.exists(home_dir):
-                    system_users.append(user)
+        search = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+        
+        return jsonify({'success': True, **user_inventory.query(search, page, per_page)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def artisan_batch_events(commands, timeout=120):
+    """Run artisan commands in one Laravel bootstrap, yielding a line per finished command
+
+    Returns a list of per-command reports (command, success, exit_code,
+    duration_ms, output). Commands the batch driver did not get to, e.g.
+    because the app failed to bootstrap, are retried one by one.
+    """
+    reports = []
+    driver_command = wemx_artisan.batch_command(commands, WEMX_PATH)
+    for stream, item in stream_command_with_privileges(driver_command, timeout=timeout, shell=False, cwd=WEMX_PATH):
+        if stream == 'exit':
+            driver = item
+            continue
+        report = wemx_artisan.parse_report(item) if stream == 'stdout' else None
+        if report:
+            reports.append(report)
+            yield 'output', wemx_artisan.format_report(report) + '\n'
         else:
-            system_users = []
-    except:
-        system_users = []
+            yield 'output', item
     
-    return render_template('wemx_commands.html', system_users=system_users)
+    remaining = commands[len(reports):]
+    if remaining:
+        app.logger.warning(f"Artisan batch driver stopped early ({driver['stderr'].strip()}); running {len(remaining)} commands individually")
+    for command in remaining:
+        started = time.monotonic()
+        result = yield from command_events(wemx_artisan.single_command(command), shell=False, cwd=WEMX_PATH)
+        reports.append({
+            'command': command,
+            'success': result['success'],
+            'exit_code': result['returncode'],
+            'duration_ms': round((time.monotonic() - started) * 1000, 1),
+            'output': result['stdout'] + result['stderr'],
+            'batched': False
+        })
+        yield 'output', wemx_artisan.format_report(reports[-1]) + '\n'
+    
+    return reports
+
+# A restart, cache clear or permission fix requested while an identical one is
+# running attaches to it instead of starting a second run
+coalesced_operations = Counter('wemx_coalesced_operations_total',
+                               'Requests that attached to an identical operation already running',
+                               ['operation'], registry=metrics)
+operations = SingleFlight(on_attach=lambda key: coalesced_operations.inc(operation=key[0]))
+
+def flight_key(operation):
+    """Single-flight key of the current request: operation plus its form arguments"""
+    return (operation,) + tuple(sorted(request.form.items(multi=True)))
 
 @app.route('/restart-wemx', methods=['POST'])
 def restart_wemx():
     """Restart WemX services"""
+    return command_response(operations.events(flight_key('restart-wemx'), restart_wemx_events))
+
+def restart_wemx_events():
+    """Restart WemX services, yielding output as each command runs"""
     try:
+        # Rebuild the Laravel caches in a single artisan bootstrap
+        artisan_commands = ['config:cache', 'route:cache', 'view:cache']
+        
         # Common WemX restart commands
         commands = [
-            'cd /var/www/wemx && /usr/bin/php artisan config:cache',
-            'cd /var/www/wemx && /usr/bin/php artisan route:cache', 
-            'cd /var/www/wemx && /usr/bin/php artisan view:cache',
             '/usr/bin/systemctl restart nginx',
             '/usr/bin/systemctl restart php8.1-fpm',  # Adjust PHP version as needed
             '/usr/bin/systemctl restart php8.2-fpm'   # Alternative PHP version
@@ -193,9 +656,21 @@ def restart_wemx():
         
         output = []
         success_count = 0
+        total = len(artisan_commands) + len(commands)
+        
+        reports = yield from artisan_batch_events(artisan_commands, timeout=90)
+        for report in reports:
+            output.append(wemx_artisan.format_report(report))
+            if report['output'].strip():
+                output.append(f"Output: {report['output'].strip()}")
+            if report['success']:
+                success_count += 1
+            output.append("---")
+        yield 'output', "---\n"
         
         for cmd in commands:
-            result = run_command_with_privileges(cmd, timeout=30)
+            yield 'output', f"Command: {cmd}\n"
+            result = yield from command_events(cmd, timeout=30)
             output.append(f"Command: {cmd}")
             output.append(f"Output: {result['stdout']}")
             if result['stderr']:
@@ -206,74 +681,176 @@ def restart_wemx():
             else:
                 output.append("❌ Failed")
             output.append("---")
+            yield 'output', f"{output[-2]}\n---\n"
+        
+        service_status.invalidate()
         
         # Fix WemX permissions after restart
+        yield 'output', "Fixing WemX permissions...\n"
         fix_wemx_permissions()
         
-        return jsonify({
-            'success': success_count > len(commands) // 2,  # Success if more than half commands succeeded
+        message = f'{success_count}/{total} commands executed successfully'
+        yield 'output', f"\n{message}\n"
+        yield 'result', {
+            'success': success_count > total // 2,  # Success if more than half commands succeeded
             'output': '\n'.join(output),
-            'message': f'{success_count}/{len(commands)} commands executed successfully'
-        })
+            'message': message,
+            'artisan': reports
+        }
     except Exception as e:
-        return jsonify({
+        yield 'result', {
             'success': False,
             'error': str(e)
-        })
+        }
 
 @app.route('/clear-cache', methods=['POST'])
 def clear_cache():
     """Clear WemX cache"""
+    return command_response(operations.events(flight_key('clear-cache'), clear_cache_events))
+
+def clear_cache_events():
+    """Clear WemX cache, yielding output as each command runs"""
     try:
-        commands = [
-            '/usr/bin/php artisan cache:clear',
-            '/usr/bin/php artisan config:clear',
-            '/usr/bin/php artisan route:clear',
-            '/usr/bin/php artisan view:clear'
-        ]
+        commands = ['cache:clear', 'config:clear', 'route:clear', 'view:clear']
         
         output = []
-        success_count = 0
+        reports = yield from artisan_batch_events(commands)
         
-        for cmd in commands:
-            result = run_command_with_privileges(cmd, cwd='/var/www/wemx')
-            if result['success']:
-                output.append(f"✅ {cmd}")
-                success_count += 1
-            else:
-                output.append(f"❌ {cmd} - {result['stderr']}")
-            
-            if result['stderr'] and 'warning' in result['stderr'].lower():
-                output.append(f"⚠️ Warning: {result['stderr']}")
+        for report in reports:
+            output.append(wemx_artisan.format_report(report))
+            if report['success'] and 'warning' in report['output'].lower():
+                output.append(f"⚠️ Warning: {report['output'].strip()}")
         
-        return jsonify({
+        success_count = sum(1 for report in reports if report['success'])
+        summary = f'\n\n🎉 WemX cache operations completed ({success_count}/{len(commands)} successful)!'
+        yield 'output', summary.lstrip('\n') + '\n'
+        yield 'result', {
             'success': success_count == len(commands),
-            'output': '\n'.join(output) + f'\n\n🎉 WemX cache operations completed ({success_count}/{len(commands)} successful)!'
-        })
+            'output': '\n'.join(output) + summary,
+            'artisan': reports
+        }
     except Exception as e:
-        return jsonify({
+        yield 'result', {
             'success': False,
             'error': str(e)
-        })
+        }
+
+def wemx_permission_fixer(path_modes=None):
+    """PermissionFixer for the WemX tree owned by www-data"""
+    www_data_user = pwd.getpwnam('www-data')
+    www_data_group = grp.getgrnam('www-data')
+    return PermissionFixer(
+        WEMX_PATH,
+        www_data_user.pw_uid,
+        www_data_group.gr_gid,
+        file_mode=0o644,
+        dir_mode=0o755,
+        tree_modes=WEMX_WRITABLE_TREES,
+        path_modes=path_modes,
+        workers=PERMISSION_WORKERS
+    )
+
+def format_permission_stats(stats):
+    """Human readable summary of a PermissionFixer run"""
+    lines = [
+        f"🔍 Scanned {stats['scanned_files']} files, {stats['scanned_dirs']} directories "
+        f"and {stats['scanned_links']} symlinks in {stats['elapsed']:.2f}s",
+        f"✏️ Fixed ownership on {stats['changed_owner']} and mode on {stats['changed_mode']} entries"
+    ]
+    if stats['errors']:
+        lines.append(f"❌ {stats['errors']} errors:")
+        lines.extend(f"   {sample}" for sample in stats['error_samples'])
+    return '\n'.join(lines)
 
 def fix_wemx_permissions():
     """Fix WemX file permissions - internal function"""
     try:
-        commands = [
-            '/usr/bin/chown -R www-data:www-data /var/www/wemx',
-            '/usr/bin/find /var/www/wemx -type f -exec chmod 644 {} \\;',
-            '/usr/bin/find /var/www/wemx -type d -exec chmod 755 {} \\;',
-            '/usr/bin/chmod -R 775 /var/www/wemx/storage',
-            '/usr/bin/chmod -R 775 /var/www/wemx/bootstrap/cache',
-            '/usr/bin/chmod -R 775 /var/www/wemx/public'
-        ]
-        
-        for cmd in commands:
-            run_command_with_privileges(cmd)
-            
+        # The permission walk is a chown/chmod storm of its own; share the filesystem cap
+        with command_limiter.slot('filesystem', timeout=300):
+            stats = wemx_permission_fixer().run()
+        app.logger.info(format_permission_stats(stats))
+        return stats
     except Exception as e:
         app.logger.error(f"Error fixing permissions: {str(e)}")
 
+# Startup permission sweep, run in the background once the server is listening
+boot_sweep = {'state': 'pending', 'fixer': None, 'started_at': None, 'finished_at': None, 'error': None}
+
+def start_boot_permission_sweep():
+    """Fix WemX permissions on a background thread so startup never waits on it"""
+    if not check_root_permissions():
+        boot_sweep['state'] = 'skipped'
+        return
+    
+    def run():
+        try:
+            fixer = wemx_permission_fixer()
+            boot_sweep['fixer'] = fixer
+            boot_sweep['state'] = 'running'
+            with command_limiter.slot('filesystem'):
+                stats = fixer.run()
+            app.logger.info(f"Boot permission sweep finished:\n{format_permission_stats(stats)}")
+            boot_sweep['state'] = 'done'
+        except Exception as e:
+            app.logger.error(f"Boot permission sweep failed: {str(e)}")
+            boot_sweep['error'] = str(e)
+            boot_sweep['state'] = 'failed'
+        finally:
+            boot_sweep['finished_at'] = time.time()
+    
+    boot_sweep['started_at'] = time.time()
+    threading.Thread(target=run, name='wemx-boot-sweep', daemon=True).start()
+
+background_tasks_lock = threading.Lock()
+background_tasks_started = threading.Event()
+
+def start_background_tasks(first_boot=True):
+    """Start background work once the server is listening; later calls do nothing
+    
+    wemx_server calls this in every worker but passes first_boot only to the
+    first worker it starts, so reloads and extra workers skip the sweep.
+    """
+    with background_tasks_lock:
+        if background_tasks_started.is_set():
+            return
+        background_tasks_started.set()
+    service_status.start()
+    if first_boot:
+        start_boot_permission_sweep()
+    else:
+        boot_sweep['state'] = 'skipped'
+
+@app.before_request
+def start_background_tasks_lazily():
+    """Under WSGI servers that never call start_background_tasks, start them on the first request"""
+    if not background_tasks_started.is_set():
+        start_background_tasks()
+
+def drain_background_tasks(timeout):
+    """Wait up to timeout seconds for jobs and coalesced operations to finish
+    
+    wemx_server calls this in a worker that is being replaced, so e.g. a
+    standalone certbot run gets to start nginx again before the process exits.
+    """
+    deadline = time.monotonic() + timeout
+    jobs_done = jobs.drain(timeout)
+    return operations.drain(max(0, deadline - time.monotonic())) and jobs_done
+
+@app.route('/ready')
+def ready():
+    """Readiness of the panel and progress of the boot permission sweep"""
+    fixer = boot_sweep['fixer']
+    return jsonify({
+        'ready': boot_sweep['state'] in ('done', 'skipped', 'failed'),
+        'boot_sweep': {
+            'state': boot_sweep['state'],
+            'started_at': boot_sweep['started_at'],
+            'finished_at': boot_sweep['finished_at'],
+            'error': boot_sweep['error'],
+            'progress': fixer.progress() if fixer else None
+        }
+    })
+
 @app.route('/update-permissions', methods=['POST'])
 def update_permissions():
     """Fix WemX file permissions"""
@@ -284,37 +861,24 @@ def update_permissions():
                 'error': 'Root privileges required for permission changes'
             })
         
-        commands = [
-            '/usr/bin/chown -R www-data:www-data /var/www/wemx',
-            '/usr/bin/find /var/www/wemx -type f -exec chmod 644 {} \\;',
-            '/usr/bin/find /var/www/wemx -type d -exec chmod 755 {} \\;',
-            '/usr/bin/chmod -R 775 /var/www/wemx/storage',
-            '/usr/bin/chmod -R 775 /var/www/wemx/bootstrap/cache',
-            '/usr/bin/chmod -R 775 /var/www/wemx/public',
-            '/usr/bin/chmod 600 /var/www/wemx/.env'
-        ]
-        
-        output = []
-        success_count = 0
-        
-        for cmd in commands:
-            result = run_command_with_privileges(cmd, timeout=60)
-            if result['success']:
-                output.append(f"✅ {cmd}")
-                success_count += 1
-            else:
-                output.append(f"❌ {cmd} - {result['stderr']}")
-        
-        return jsonify({
-            'success': success_count == len(commands),
-            'output': '\n'.join(output) + f'\n\n🔒 WemX permissions update completed ({success_count}/{len(commands)} successful)!'
-        })
+        return jsonify(operations.call(flight_key('update-permissions'), update_permissions_result))
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
+def update_permissions_result():
+    """Fix WemX file permissions, tightening .env"""
+    with command_limiter.slot('filesystem', timeout=60):
+        stats = wemx_permission_fixer(path_modes={'.env': 0o600}).run()
+    
+    return {
+        'success': stats['errors'] == 0,
+        'output': format_permission_stats(stats) + '\n\n🔒 WemX permissions update completed!',
+        'stats': stats
+    }
+
 @app.route('/create-user', methods=['POST'])
 def create_user():
     """Create Ubuntu system user"""
@@ -455,17 +1019,16 @@ def reset_password():
 @app.route('/nginx-config')
 def nginx_config():
     """Nginx configuration editor"""
-    nginx_file_path = '/etc/nginx/sites-available/wemx.conf'
     config_content = ""
     
     try:
-        if os.path.exists(nginx_file_path):
-            with open(nginx_file_path, 'r') as f:
+        if os.path.exists(NGINX_CONFIG_PATH):
+            with open(NGINX_CONFIG_PATH, 'r') as f:
                 config_content = f.read()
     except Exception as e:
         flash(f'Error reading nginx config: {str(e)}', 'error')
     
-    return render_template('nginx_editor.html', config_content=config_content)
+    return render_template('nginx_editor.html', config_content=config_content, certbot_challenge=CERTBOT_CHALLENGE)
 
 @app.route('/save-nginx-config', methods=['POST'])
 def save_nginx_config():
@@ -477,34 +1040,57 @@ def save_nginx_config():
                 'error': 'Root privileges required for nginx configuration changes'
             })
             
-        nginx_file_path = '/etc/nginx/sites-available/wemx.conf'
         config_content = request.form.get('config_content', '')
         
-        # Create backup
-        if os.path.exists(nginx_file_path):
-            backup_path = f"{nginx_file_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(nginx_file_path, backup_path)
+        # Reject what the in-process linter already knows nginx -t would refuse,
+        # unless the caller overrides it; nginx -t below stays the final gate
+        errors = [issue for issue in lint_nginx_config(config_content) if issue['severity'] == 'error']
+        if errors and request.form.get('force') != '1':
+            return jsonify({
+                'success': False,
+                'error': 'Configuration has errors:\n' + '\n'.join(
+                    f"line {issue['line']}: {issue['message']}" for issue in errors),
+                'issues': errors,
+                'can_force': True
+            })
         
-        # Write new config
-        with open(nginx_file_path, 'w') as f:
-            f.write(config_content)
+        # Create backup
+        backups.snapshot('nginx', NGINX_CONFIG_PATH)
         
-        # Test configuration
-        test_result = run_command_with_privileges(['/usr/sbin/nginx', '-t'], shell=False)
+        # Test the candidate in a shadow tree; the live file is only replaced if it passes
+        test_result = nginx_stager.apply(NGINX_CONFIG_PATH, config_content)
         
         if not test_result['success']:
-            # Restore backup if test fails
-            if os.path.exists(backup_path):
-                shutil.copy2(backup_path, nginx_file_path)
             return jsonify({
                 'success': False, 
-                'error': f'Configuration test failed: {test_result["stderr"]}'
+                'error': f'Configuration test failed, live config left unchanged: {test_result["stderr"]}'
             })
         
+        if request.form.get('reload') == '1':
+            reload_result = reload_nginx_service()
+            if not reload_result['success']:
+                return jsonify({
+                    'success': False,
+                    'error': f'Configuration saved but nginx reload failed: {reload_result["stderr"]}'
+                })
+            return jsonify({'success': True, 'message': 'Nginx configuration saved, tested and reloaded!'})
+        
         return jsonify({'success': True, 'message': 'Nginx configuration saved and tested successfully!'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/lint-nginx-config', methods=['POST'])
+def lint_nginx_config_route():
+    """Check editor contents in-process, without forking nginx -t"""
+    started = time.perf_counter()
+    issues = lint_nginx_config(request.form.get('config_content', ''))
+    return jsonify({
+        'success': True,
+        'valid': not any(issue['severity'] == 'error' for issue in issues),
+        'issues': issues,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
+
 @app.route('/test-nginx-config', methods=['POST'])
 def test_nginx_config():
     """Test nginx configuration"""
@@ -540,6 +1126,7 @@ def reload_nginx():
         
         # Reload nginx
         reload_result = run_command_with_privileges(['/usr/bin/systemctl', 'reload', 'nginx'], shell=False)
+        service_status.invalidate()
         
         return jsonify({
             'success': reload_result['success'],
@@ -548,6 +1135,74 @@ def reload_nginx():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# =====================================================
+# BACKGROUND JOB ROUTES
+# =====================================================
+
+@app.route('/jobs')
+def list_jobs():
+    """List recent background jobs"""
+    return jsonify({
+        'success': True,
+        'jobs': [{'id': job.id, 'name': job.name, 'status': job.status, 'created_at': job.created_at}
+                 for job in jobs.list()]
+    })
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status, step progress and output of a background job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+# Each job event stream holds a server thread until the job ends, so cap them
+# like the live status streams; clients fall back to polling /jobs/<id>
+JOB_STREAM_MAX_CLIENTS = getattr(wemx_config, 'JOB_STREAM_MAX_CLIENTS', 4)
+job_stream_slots = threading.BoundedSemaphore(JOB_STREAM_MAX_CLIENTS)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a background job's output and progress as Server-Sent Events"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if not job_stream_slots.acquire(blocking=False):
+        return jsonify({
+            'success': False,
+            'error': f'At most {JOB_STREAM_MAX_CLIENTS} job event streams per worker, poll /jobs/{job_id} instead'
+        }), 503
+    
+    def generate():
+        offset = 0
+        version = None
+        last_progress = None
+        while True:
+            new_version = job.wait_for_change(version, timeout=15)
+            if new_version == version:
+                yield ': keep-alive\n\n'
+                continue
+            version = new_version
+            
+            chunks, offset = job.output_since(offset)
+            if chunks:
+                yield sse_event('output', ''.join(chunks))
+            
+            progress = job.progress()
+            if progress != last_progress:
+                yield sse_event('progress', progress)
+                last_progress = progress
+            
+            if progress['finished']:
+                yield sse_event('result', job.result)
+                return
+    
+    response = sse_response(generate())
+    # Runs when the stream ends or the client goes away, whether or not it was iterated
+    response.call_on_close(job_stream_slots.release)
+    return response
+
 # =====================================================
 # CERTBOT ROUTES
 # =====================================================
@@ -562,38 +1217,8 @@ def install_certbot():
                 'error': 'Root privileges required for certbot installation'
             })
         
-        # Use full path to apt to avoid PATH issues
-        update_cmd = '/usr/bin/apt update'
-        install_cmd = '/usr/bin/apt install -y certbot python3-certbot-nginx'
-        
-        app.logger.info(f"Updating packages with: {update_cmd}")
-        
-        # Update packages first
-        update_result = run_command_with_privileges(update_cmd, timeout=120)
-        if not update_result['success']:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to update package lists',
-                'output': f"Command: {update_cmd}\nSTDOUT: {update_result['stdout']}\nSTDERR: {update_result['stderr']}"
-            })
-        
-        app.logger.info(f"Installing certbot with: {install_cmd}")
-        
-        # Install certbot and nginx plugin
-        install_result = run_command_with_privileges(install_cmd, timeout=300)
-        
-        if install_result['success']:
-            return jsonify({
-                'success': True,
-                'message': 'Certbot and nginx plugin installed successfully on Ubuntu',
-                'output': update_result['stdout'] + '\n\n' + install_result['stdout']
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to install Certbot',
-                'output': f"Command: {install_cmd}\nSTDOUT: {install_result['stdout']}\nSTDERR: {install_result['stderr']}"
-            })
+        job = jobs.submit('install-certbot', install_certbot_job, total_steps=2)
+        return job_started_response(job, 'Certbot installation started')
             
     except Exception as e:
         return jsonify({
@@ -602,6 +1227,147 @@ def install_certbot():
             'output': ''
         })
 
+def prepare_acme_webroot(job):
+    """Make the running nginx answer HTTP-01 challenges from ACME_WEBROOT"""
+    job.begin_step('Preparing ACME webroot')
+    try:
+        snippet_changed = write_challenge_snippet(ACME_SNIPPET_PATH, ACME_WEBROOT)
+        with open(NGINX_CONFIG_PATH, 'r') as f:
+            updated = add_snippet_include(f.read(), ACME_SNIPPET_PATH)
+        
+        if updated is None and not snippet_changed:
+            job.log(f"ACME challenges are served from {ACME_WEBROOT}\n")
+            job.end_step(True)
+            return True
+        
+        if updated is not None:
+            backups.snapshot('nginx', NGINX_CONFIG_PATH)
+            stage_result = nginx_stager.apply(NGINX_CONFIG_PATH, updated)
+            if not stage_result['success']:
+                job.log(f"nginx rejected the ACME challenge include, live config left unchanged:\n{stage_result['stderr']}\n")
+                job.end_step(False)
+                return False
+        
+        reload_result = reload_nginx_service()
+        if not reload_result['success']:
+            job.log(f"nginx reload failed:\n{reload_result['stderr']}\n")
+            job.end_step(False)
+            return False
+        
+        job.log(f"nginx now serves ACME challenges from {ACME_WEBROOT} ({ACME_SNIPPET_PATH})\n")
+        job.end_step(True)
+        return True
+    except (OSError, BackupError) as e:
+        job.log(f"Preparing ACME webroot failed: {str(e)}\n")
+        job.end_step(False)
+        return False
+
+@contextmanager
+def certbot_window(job, challenge=True):
+    """Set up the configured challenge around one or more certbot runs
+    
+    Yields a dict with the certbot 'args' for CERTBOT_CHALLENGE and 'ready'
+    (False if the webroot could not be prepared). The caller sets
+    'succeeded' when any run changed certificates. In webroot mode nginx
+    keeps serving and is reloaded once at the end if something succeeded;
+    in standalone mode it is stopped for the whole window. An availability
+    probe measures the downtime either way; 'timing' is filled in on exit.
+    """
+    started = time.monotonic()
+    standalone = challenge and CERTBOT_CHALLENGE == 'standalone'
+    window = {'args': '', 'ready': True, 'succeeded': False, 'timing': None}
+    
+    with AvailabilityProbe() as probe:
+        try:
+            if standalone:
+                app.logger.info("Stopping nginx so certbot can bind port 80...")
+                job.begin_step('Stopping nginx')
+                stop_result = stop_nginx_service()
+                job.log(f"Stopping nginx:\n{stop_result['stdout']}\n{stop_result['stderr']}\n")
+                job.end_step(stop_result['success'])
+                window['args'] = '--standalone'
+            elif challenge:
+                window['ready'] = prepare_acme_webroot(job)
+                window['args'] = f'--webroot -w {ACME_WEBROOT}'
+            
+            yield window
+        finally:
+            if standalone:
+                # Start nginx again, even if certbot blew up
+                app.logger.info("Starting nginx service...")
+                job.begin_step('Starting nginx')
+                start_result = start_nginx_service()
+                job.log(f"Starting nginx:\n{start_result['stdout']}\n{start_result['stderr']}")
+                job.end_step(start_result['success'])
+            elif challenge and window['succeeded']:
+                # One graceful reload picks up every new certificate
+                job.begin_step('Reloading nginx')
+                reload_result = reload_nginx_service()
+                job.log(f"Reloading nginx:\n{reload_result['stdout']}\n{reload_result['stderr']}")
+                job.end_step(reload_result['success'])
+            time_to_serve = time.monotonic() - started
+    
+    if challenge and not standalone and not window['succeeded']:
+        job.log(f"\nHTTP-01 via {ACME_WEBROOT} failed. Make sure each domain's port 80 is served by a server block "
+                f"in {NGINX_CONFIG_PATH}, or set CERTBOT_CHALLENGE = 'standalone'.\n")
+    
+    window['timing'] = {
+        'challenge': 'standalone' if standalone else ('webroot' if challenge else 'none'),
+        'time_to_serve_seconds': round(time_to_serve, 3),
+        **probe.report()
+    }
+    job.log(f"\nTiming: {window['timing']['challenge']}, done in {window['timing']['time_to_serve_seconds']}s, "
+            f"nginx downtime {window['timing']['downtime_seconds']}s "
+            f"({window['timing']['failed_probes']}/{window['timing']['probes']} probes failed)\n")
+
+def run_certbot(job, title, certbot_cmd, timeout, challenge=True):
+    """Run a certbot command as a job step inside a certbot_window; returns (result, timing)
+    
+    certbot_cmd may contain {challenge}, replaced by the challenge arguments.
+    """
+    with certbot_window(job, challenge) as window:
+        if window['ready']:
+            result = run_job_step(job, title, certbot_cmd.replace('{challenge}', window['args']), timeout=timeout)
+        else:
+            result = {'success': False, 'stdout': '', 'stderr': 'ACME webroot could not be prepared', 'returncode': -1}
+        window['succeeded'] = result['success']
+    return result, window['timing']
+
+def install_certbot_job(job):
+    """Install Certbot and nginx plugin - background job"""
+    # Use full path to apt to avoid PATH issues
+    update_cmd = '/usr/bin/apt update'
+    install_cmd = '/usr/bin/apt install -y certbot python3-certbot-nginx'
+    
+    app.logger.info(f"Updating packages with: {update_cmd}")
+    
+    # Update packages first
+    update_result = run_job_step(job, 'Updating package lists', update_cmd, timeout=120)
+    if not update_result['success']:
+        return {
+            'success': False,
+            'error': 'Failed to update package lists',
+            'output': f"Command: {update_cmd}\nSTDOUT: {update_result['stdout']}\nSTDERR: {update_result['stderr']}"
+        }
+    
+    app.logger.info(f"Installing certbot with: {install_cmd}")
+    
+    # Install certbot and nginx plugin
+    install_result = run_job_step(job, 'Installing certbot', install_cmd, timeout=300)
+    inspection_cache.invalidate('certbot')
+    
+    if install_result['success']:
+        return {
+            'success': True,
+            'message': 'Certbot and nginx plugin installed successfully on Ubuntu',
+            'output': update_result['stdout'] + '\n\n' + install_result['stdout']
+        }
+    return {
+        'success': False,
+        'error': 'Failed to install Certbot',
+        'output': f"Command: {install_cmd}\nSTDOUT: {install_result['stdout']}\nSTDERR: {install_result['stderr']}"
+    }
+
 @app.route('/generate-certificate', methods=['POST'])
 def generate_certificate():
     """Generate SSL certificate using Certbot"""
@@ -624,55 +1390,84 @@ def generate_certificate():
         
         # Clean domain input (remove spaces, split by comma)
         domain_list = [d.strip() for d in domains.split(',') if d.strip()]
-        domain_args = ' '.join([f'-d {domain}' for domain in domain_list])
-        
-        output_log = []
-        
-        # Stop nginx first
-        app.logger.info("Stopping nginx service for certificate generation...")
-        stop_result = stop_nginx_service()
-        output_log.append(f"Stopping nginx:\n{stop_result['stdout']}\n{stop_result['stderr']}\n")
-        
-        # Generate certificate using standalone mode
-        certbot_cmd = f'/usr/bin/certbot certonly --standalone {domain_args} --email {email} --agree-tos --non-interactive --expand'
-        app.logger.info(f"Generating certificate: {certbot_cmd}")
-        
-        cert_result = run_command_with_privileges(certbot_cmd, timeout=300)
-        output_log.append(f"Certificate generation:\n{cert_result['stdout']}\n{cert_result['stderr']}\n")
         
-        # Start nginx again
-        app.logger.info("Starting nginx service...")
-        start_result = start_nginx_service()
-        output_log.append(f"Starting nginx:\n{start_result['stdout']}\n{start_result['stderr']}")
-        
-        if cert_result['success']:
-            return jsonify({
-                'success': True,
-                'message': f'SSL certificate generated successfully for: {", ".join(domain_list)}',
-                'output': ''.join(output_log)
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Certificate generation failed',
-                'output': ''.join(output_log)
-            })
+        job = jobs.submit('generate-certificate', generate_certificate_job, domain_list, email, total_steps=4)
+        return job_started_response(job, f'Certificate generation started for: {", ".join(domain_list)}')
             
     except Exception as e:
-        # Make sure to start nginx even if there's an error
-        try:
-            start_nginx_service()
-        except:
-            pass
         return jsonify({
             'success': False,
             'error': f'Certificate generation failed: {str(e)}',
             'output': ''
         })
 
+def generate_certificate_job(job, domain_list, email):
+    """Generate SSL certificate using Certbot - background job"""
+    domain_args = ' '.join([f'-d {domain}' for domain in domain_list])
+    
+    # Generate certificate; the challenge arguments must precede the domains
+    certbot_cmd = f'/usr/bin/certbot certonly {{challenge}} {domain_args} --email {email} --agree-tos --non-interactive --expand'
+    app.logger.info(f"Generating certificate: {certbot_cmd}")
+    
+    cert_result, timing = run_certbot(job, 'Certificate generation', certbot_cmd, timeout=300)
+    
+    if cert_result['success']:
+        # Confirm nginx now presents the new certificate
+        job.begin_step('Verifying served certificate')
+        issued = certificate_inventory.for_domains(domain_list)
+        served_after = wait_until_served(domain_list[0], issued['serial'], timeout=5) if issued and issued.get('serial') else None
+        timing['served_verified'] = served_after is not None
+        if served_after is not None:
+            timing['time_to_serve_seconds'] = round(timing['time_to_serve_seconds'] + served_after, 3)
+            job.log(f"nginx is serving the new certificate for {domain_list[0]}\n")
+        else:
+            job.log(f"nginx is not serving the new certificate for {domain_list[0]} yet - add it to the site's ssl_certificate settings\n")
+        job.end_step(True)
+        
+        return {
+            'success': True,
+            'message': f'SSL certificate generated successfully for: {", ".join(domain_list)}',
+            'timing': timing,
+            'output': ''.join(job.output)
+        }
+    return {
+        'success': False,
+        'error': 'Certificate generation failed',
+        'timing': timing,
+        'output': ''.join(job.output)
+    }
+
+def renewal_window_days():
+    """Expiry window from the request, falling back to RENEWAL_WINDOW_DAYS"""
+    value = request.values.get('window_days', '').strip()
+    if not value:
+        return RENEWAL_WINDOW_DAYS
+    days = int(value)
+    if not 0 <= days <= 3650:
+        raise ValueError('window_days must be between 0 and 3650')
+    return days
+
+def renewal_plan(window_days):
+    """Readable lineages expiring within window_days, soonest first"""
+    return [cert for cert in certificate_inventory.expiring_within(window_days) if not cert.get('error')]
+
+@app.route('/renewal-plan')
+def renewal_plan_view():
+    """Certificates the next renewal would renew"""
+    try:
+        window_days = renewal_window_days()
+        return jsonify({
+            'success': True,
+            'window_days': window_days,
+            'concurrency': RENEWAL_CONCURRENCY,
+            'certificates': renewal_plan(window_days)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/renew-certificates', methods=['POST'])
 def renew_certificates():
-    """Renew all SSL certificates"""
+    """Renew SSL certificates that expire within the renewal window"""
     try:
         if not check_root_permissions():
             return jsonify({
@@ -680,49 +1475,105 @@ def renew_certificates():
                 'error': 'Root privileges required for certificate renewal'
             })
         
-        output_log = []
-        
-        # Stop nginx first
-        app.logger.info("Stopping nginx for certificate renewal...")
-        stop_result = stop_nginx_service()
-        output_log.append(f"Stopping nginx:\n{stop_result['stdout']}\n{stop_result['stderr']}\n")
-        
-        # Renew certificates
-        renew_result = run_command_with_privileges('/usr/bin/certbot renew --force-renewal', timeout=300)
-        output_log.append(f"Certificate renewal:\n{renew_result['stdout']}\n{renew_result['stderr']}\n")
-        
-        # Start nginx again
-        app.logger.info("Starting nginx service...")
-        start_result = start_nginx_service()
-        output_log.append(f"Starting nginx:\n{start_result['stdout']}\n{start_result['stderr']}")
-        
-        return jsonify({
-            'success': renew_result['success'],
-            'message': 'Certificate renewal completed' if renew_result['success'] else 'Certificate renewal failed',
-            'output': ''.join(output_log)
-        })
+        window_days = renewal_window_days()
+        job = jobs.submit('renew-certificates', renew_certificates_job, window_days, total_steps=3)
+        return job_started_response(job, f'Certificate renewal started for certificates expiring within {window_days} days')
         
     except Exception as e:
-        # Make sure to start nginx even if there's an error
-        try:
-            start_nginx_service()
-        except:
-            pass
         return jsonify({
             'success': False,
             'error': f'Certificate renewal failed: {str(e)}',
             'output': ''
         })
 
+def lineage_lock(name):
+    """Lock serialising certbot runs for one certificate lineage"""
+    with lineage_locks_guard:
+        return lineage_locks.setdefault(name, threading.Lock())
+
+def renew_command(name, challenge_args):
+    """certbot argv renewing one lineage now
+    
+    Without a terminal certbot renew first sleeps up to 8 minutes at random
+    (meant for cron), which would outlast the command timeout.
+    """
+    return ['/usr/bin/certbot', 'renew', '--cert-name', name, *challenge_args.split(),
+            '--force-renewal', '--non-interactive', '--no-random-sleep-on-renew']
+
+def renew_lineage(job, name, challenge_args):
+    """Renew one lineage; returns 'renewed', 'failed' or 'busy'"""
+    lock = lineage_lock(name)
+    if not lock.acquire(blocking=False):
+        job.log(f"[{name}] already being renewed by another job, skipped\n")
+        return 'busy'
+    
+    try:
+        command = renew_command(name, challenge_args)
+        result = None
+        for stream, item in stream_command_with_privileges(command, timeout=300, shell=False):
+            if stream == 'exit':
+                result = item
+            else:
+                job.log(f"[{name}] {item}")
+        job.log(f"[{name}] {'renewed' if result['success'] else 'renewal failed'}\n")
+        return 'renewed' if result['success'] else 'failed'
+    finally:
+        lock.release()
+
+def renew_certificates_job(job, window_days):
+    """Renew the certificates expiring within window_days - background job"""
+    plan = renewal_plan(window_days)
+    if not plan:
+        job.log(f"No certificate expires within {window_days} days - nothing to renew\n")
+        return {
+            'success': True,
+            'message': f'No certificates expire within {window_days} days',
+            'renewed': [], 'failed': [], 'skipped': [],
+            'timing': None,
+            'output': ''.join(job.output)
+        }
+    
+    job.log(f"Renewal plan ({len(plan)} certificate(s), {RENEWAL_CONCURRENCY} at a time):\n")
+    for cert in plan:
+        job.log(f"  {cert['name']}: {'expired' if cert['expired'] else str(cert['days_left']) + ' days left'}\n")
+    
+    outcomes = {}
+    with certbot_window(job) as window:
+        if window['ready']:
+            job.begin_step(f'Renewing {len(plan)} certificate(s)')
+            with ThreadPoolExecutor(max_workers=RENEWAL_CONCURRENCY, thread_name_prefix='wemx-renew') as pool:
+                futures = {pool.submit(renew_lineage, job, cert['name'], window['args']): cert['name'] for cert in plan}
+                for future in as_completed(futures):
+                    outcomes[futures[future]] = future.result()
+            job.end_step('failed' not in outcomes.values())
+        window['succeeded'] = 'renewed' in outcomes.values()
+    
+    renewed = sorted(name for name, outcome in outcomes.items() if outcome == 'renewed')
+    skipped = sorted(name for name, outcome in outcomes.items() if outcome == 'busy')
+    failed = sorted(cert['name'] for cert in plan if outcomes.get(cert['name']) in (None, 'failed'))
+    success = not failed
+    
+    return {
+        'success': success,
+        'message': f'Renewed {len(renewed)} of {len(plan)} certificate(s)',
+        'error': None if success else f"Certificate renewal failed for: {', '.join(failed)}",
+        'renewed': renewed,
+        'failed': failed,
+        'skipped': skipped,
+        'timing': window['timing'],
+        'output': ''.join(job.output)
+    }
+
 @app.route('/list-certificates', methods=['POST'])
 def list_certificates():
     """List all SSL certificates"""
     try:
-        list_result = run_command_with_privileges('/usr/bin/certbot certificates', timeout=30)
+        certificates = certificate_inventory.certificates()
         
         return jsonify({
-            'success': list_result['success'],
-            'output': list_result['stdout'] + list_result['stderr'] if list_result['stdout'] or list_result['stderr'] else 'No certificates found or certbot not installed'
+            'success': True,
+            'certificates': certificates,
+            'output': format_certificates(certificates) if certificates else 'No certificates found or certbot not installed'
         })
         
     except Exception as e:
@@ -751,51 +1602,50 @@ def revoke_certificate():
                 'output': ''
             })
         
-        output_log = []
-        
-        # Stop nginx first
-        app.logger.info("Stopping nginx service...")
-        stop_result = stop_nginx_service()
-        output_log.append(f"Stopping nginx:\n{stop_result['stdout']}\n{stop_result['stderr']}\n")
-        
-        # Revoke certificate
-        cert_path = f'/etc/letsencrypt/live/{domain}/cert.pem'
-        revoke_cmd = f'/usr/bin/certbot revoke --cert-path {cert_path} --non-interactive'
-        
-        app.logger.info(f"Revoking certificate: {revoke_cmd}")
-        revoke_result = run_command_with_privileges(revoke_cmd, timeout=120)
-        output_log.append(f"Certificate revocation:\n{revoke_result['stdout']}\n{revoke_result['stderr']}\n")
-        
-        # Start nginx again
-        app.logger.info("Starting nginx service...")
-        start_result = start_nginx_service()
-        output_log.append(f"Starting nginx:\n{start_result['stdout']}\n{start_result['stderr']}")
-        
-        if revoke_result['success']:
-            return jsonify({
-                'success': True,
-                'message': f'Certificate for {domain} has been revoked',
-                'output': ''.join(output_log)
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Certificate revocation failed',
-                'output': ''.join(output_log)
-            })
+        job = jobs.submit('revoke-certificate', revoke_certificate_job, domain, total_steps=1)
+        return job_started_response(job, f'Certificate revocation started for {domain}')
             
     except Exception as e:
-        # Make sure to start nginx even if there's an error
-        try:
-            start_nginx_service()
-        except:
-            pass
         return jsonify({
             'success': False,
             'error': f'Certificate revocation failed: {str(e)}',
             'output': ''
         })
 
+def revoke_certificate_job(job, domain):
+    """Revoke SSL certificate - background job"""
+    # Revocation talks to the CA only, so nginx keeps running
+    cert_path = f'/etc/letsencrypt/live/{domain}/cert.pem'
+    revoke_cmd = f'/usr/bin/certbot revoke --cert-path {cert_path} --non-interactive'
+    
+    app.logger.info(f"Revoking certificate: {revoke_cmd}")
+    revoke_result, timing = run_certbot(job, 'Certificate revocation', revoke_cmd, timeout=120, challenge=False)
+    
+    if revoke_result['success']:
+        return {
+            'success': True,
+            'message': f'Certificate for {domain} has been revoked',
+            'timing': timing,
+            'output': ''.join(job.output)
+        }
+    return {
+        'success': False,
+        'error': 'Certificate revocation failed',
+        'timing': timing,
+        'output': ''.join(job.output)
+    }
+
+def format_unit_state(name, state):
+    """systemctl status style summary of a UnitTable entry"""
+    lines = [f"● {name} - {state['load_state']}",
+             f"     Active: {state['active_state']} ({state['sub_state']})"
+             + (f" since {state['since']}" if state.get('since') else '')]
+    if state.get('last_trigger'):
+        lines.append(f"  Triggered: {state['last_trigger']}")
+    if state.get('next_elapse'):
+        lines.append(f"    Trigger: {state['next_elapse']}")
+    return '\n'.join(lines) + '\n'
+
 @app.route('/check-certbot-status', methods=['POST'])
 def check_certbot_status():
     """Check Certbot and system status"""
@@ -803,7 +1653,7 @@ def check_certbot_status():
         output_log = []
         
         # Check system info
-        uname_result = run_command_with_privileges('/usr/bin/uname -a', timeout=30)
+        uname_result = inspection_cache.run('/usr/bin/uname -a', ttl=3600, tags=('system',), timeout=30)
         output_log.append(f"System Info:\n{uname_result['stdout']}\n")
         
         # Check Ubuntu version
@@ -816,23 +1666,24 @@ def check_certbot_status():
                 pass
         
         # Check certbot version
-        version_result = run_command_with_privileges('/usr/bin/certbot --version', timeout=30)
+        version_result = inspection_cache.run('/usr/bin/certbot --version', ttl=3600, tags=('certbot',), timeout=30)
         output_log.append(f"Certbot Version:\n{version_result['stdout']}\n{version_result['stderr']}\n")
         
+        units = service_status.details()
+        
         # Check nginx status
-        nginx_result = run_command_with_privileges('/usr/bin/systemctl status nginx --no-pager -l', timeout=30)
-        output_log.append(f"Nginx Status:\n{nginx_result['stdout']}\n{nginx_result['stderr']}\n")
+        output_log.append(f"Nginx Status:\n{format_unit_state('nginx.service', units['nginx'])}\n")
         
         # Check certificate expiry
-        cert_check = run_command_with_privileges('/usr/bin/certbot certificates', timeout=30)
-        output_log.append(f"Certificate Status:\n{cert_check['stdout']}\n{cert_check['stderr']}\n")
+        certificates = certificate_inventory.certificates()
+        output_log.append(f"Certificate Status:\n{format_certificates(certificates)}\n")
         
         # Check if certbot timer is active (auto-renewal)
-        timer_result = run_command_with_privileges('/usr/bin/systemctl status certbot.timer --no-pager -l', timeout=30)
-        output_log.append(f"Certbot Auto-renewal Timer:\n{timer_result['stdout']}\n{timer_result['stderr']}")
+        output_log.append(f"Certbot Auto-renewal Timer:\n{format_unit_state('certbot.timer', units['certbot.timer'])}")
         
         return jsonify({
             'success': True,
+            'certificates': certificates,
             'output': ''.join(output_log)
         })
         
@@ -913,6 +1764,7 @@ def update_license():
         
         # Change to WemX directory and run artisan command
         result = run_command_with_privileges(f'echo "{license_key}" | /usr/bin/php artisan license:update', cwd='/var/www/wemx')
+        inspection_cache.invalidate('license')
         
         output = result['stdout'] + result['stderr']
         
@@ -928,7 +1780,7 @@ def update_license():
 def check_license():
     """Check current WemX license status"""
     try:
-        result = run_command_with_privileges(['/usr/bin/php', 'artisan', 'license:check'], shell=False, cwd='/var/www/wemx')
+        result = inspection_cache.run(['/usr/bin/php', 'artisan', 'license:check'], ttl=300, tags=('license',), shell=False, cwd='/var/www/wemx')
         
         output = result['stdout'] + result['stderr']
         
@@ -940,15 +1792,77 @@ def check_license():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# =====================================================
+# BACKUP ROUTES
+# =====================================================
+
+@app.route('/backups/<target>')
+def list_backups(target):
+    """List snapshots of an edited file, newest first"""
+    if target not in BACKUP_TARGETS:
+        return jsonify({'success': False, 'error': f'Unknown backup target: {target}'}), 404
+    
+    try:
+        return jsonify({'success': True, 'target': target, 'path': BACKUP_TARGETS[target], 'backups': backups.list(target)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/backups/<target>/<digest>/diff')
+def diff_backup(target, digest):
+    """Unified diff from a snapshot to the live file"""
+    if target not in BACKUP_TARGETS:
+        return jsonify({'success': False, 'error': f'Unknown backup target: {target}'}), 404
+    
+    try:
+        return jsonify({'success': True, 'output': backups.diff(target, digest, BACKUP_TARGETS[target]) or 'No differences'})
+    except BackupError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/backups/<target>/<digest>/restore', methods=['POST'])
+def restore_backup(target, digest):
+    """Put a snapshot back in place of the live file"""
+    if target not in BACKUP_TARGETS:
+        return jsonify({'success': False, 'error': f'Unknown backup target: {target}'}), 404
+    
+    try:
+        if target == 'nginx' and not check_root_permissions():
+            return jsonify({
+                'success': False,
+                'error': 'Root privileges required for nginx configuration changes'
+            })
+        
+        path = BACKUP_TARGETS[target]
+        data = backups.read(target, digest)
+        
+        # Keep the current version so the restore itself can be undone
+        backups.snapshot(target, path)
+        
+        if target == 'nginx':
+            test_result = nginx_stager.apply(path, data.decode('utf-8'))
+            if not test_result['success']:
+                return jsonify({
+                    'success': False,
+                    'error': f'Configuration test failed, live config left unchanged: {test_result["stderr"]}'
+                })
+        else:
+            atomic_write(path, data)
+        
+        return jsonify({'success': True, 'message': f'Restored {path} from backup {digest[:12]}'})
+    except BackupError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/config-editor')
 def config_editor():
     """Configuration file editor"""
-    config_file_path = '/opt/wemx-admin/wemx_config.py'
     config_content = ""
     
     try:
-        if os.path.exists(config_file_path):
-            with open(config_file_path, 'r') as f:
+        if os.path.exists(ADMIN_CONFIG_PATH):
+            with open(ADMIN_CONFIG_PATH, 'r') as f:
                 config_content = f.read()
     except Exception as e:
         flash(f'Error reading config file: {str(e)}', 'error')
@@ -959,24 +1873,21 @@ def config_editor():
 def save_config():
     """Save configuration file"""
     try:
-        config_file_path = '/opt/wemx-admin/wemx_config.py'
         config_content = request.form.get('config_content', '')
         
         # Create backup
-        if os.path.exists(config_file_path):
-            backup_path = f"{config_file_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(config_file_path, backup_path)
+        backups.snapshot('config', ADMIN_CONFIG_PATH)
         
         # Ensure directory exists
-        os.makedirs(os.path.dirname(config_file_path), exist_ok=True)
+        os.makedirs(os.path.dirname(ADMIN_CONFIG_PATH), exist_ok=True)
         
         # Write new config
-        with open(config_file_path, 'w') as f:
+        with open(ADMIN_CONFIG_PATH, 'w') as f:
             f.write(config_content)
         
         # Set proper permissions
         if check_root_permissions():
-            os.chmod(config_file_path, 0o600)  # Secure permissions
+            os.chmod(ADMIN_CONFIG_PATH, 0o600)  # Secure permissions
         
         return jsonify({'success': True, 'message': 'Configuration saved successfully! Restart the admin panel to apply changes.'})
     except Exception as e:
@@ -1025,6 +1936,15 @@ def test_config():
                     'error': 'WHITELISTED_IPS must be a list'
                 })
             
+            # Every address or CIDR range must parse
+            for var in ['WHITELISTED_IPS', 'TRUSTED_PROXIES']:
+                invalid = IPAllowlist(getattr(test_module, var, [])).invalid
+                if invalid:
+                    return jsonify({
+                        'success': False,
+                        'error': f'Invalid entries in {var}: {", ".join(map(str, invalid))}'
+                    })
+            
             return jsonify({
                 'success': True,
                 'message': 'Configuration syntax is valid!'
@@ -1052,6 +1972,23 @@ def test_config():
 def restart_admin():
     """Restart the admin panel service"""
     try:
+        # Restarting would cut running jobs short, e.g. leave nginx stopped mid-certbot
+        busy = [job.name for job in jobs.active()] + [flight['key'][0] for flight in operations.in_flight()]
+        if busy and request.form.get('force') != '1':
+            return jsonify({
+                'success': False,
+                'error': f"Operations still running: {', '.join(busy)}. Restart once they finish "
+                         f"(or send force=1).",
+                'running': busy
+            }), 409
+        
+        # Under wemx_server a SIGHUP swaps in fresh workers without dropping connections
+        if wemx_server.request_reload():
+            return jsonify({
+                'success': True,
+                'output': 'Admin panel graceful reload initiated. New settings apply to requests made in a few seconds.'
+            })
+        
         if not check_root_permissions():
             return jsonify({
                 'success': False, 
@@ -1071,51 +2008,178 @@ def restart_admin():
 def status():
     """WemX system status check"""
     try:
-        # Check if WemX directory exists and is accessible
-        wemx_status = os.path.exists('/var/www/wemx') and os.access('/var/www/wemx', os.R_OK)
-        
-        # Check if .env file exists
-        env_status = os.path.exists(ENV_FILE_PATH)
-        
-        # Check web server status
-        nginx_result = run_command_with_privileges(['/usr/bin/systemctl', 'is-active', 'nginx'], shell=False)
-        nginx_status = nginx_result['success'] and nginx_result['stdout'].strip() == 'active'
-        
-        # Check PHP-FPM status (common versions)
-        php_versions = ['8.2', '8.1', '8.0', '7.4']
-        php_status = False
-        active_php_version = None
-        
-        for version in php_versions:
-            result = run_command_with_privileges(['/usr/bin/systemctl', 'is-active', f'php{version}-fpm'], shell=False)
-            if result['success'] and result['stdout'].strip() == 'active':
-                php_status = True
-                active_php_version = version
-                break
-        
-        # Check root privileges
-        root_status = check_root_permissions()
-        
-        return jsonify({
-            'wemx_directory': wemx_status,
-            'env_file': env_status,
-            'nginx': nginx_status,
-            'php_fpm': php_status,
-            'php_version': active_php_version,
-            'root_privileges': root_status,
-            'overall_status': all([wemx_status, env_status, nginx_status, php_status, root_status])
-        })
+        return jsonify(collect_status())
     except Exception as e:
         return jsonify({'error': str(e)})
 
+def collect_status():
+    """Status of the WemX install and its services, shared by /status and the live feed"""
+    # Check if WemX directory exists and is accessible
+    wemx_status = os.path.exists('/var/www/wemx') and os.access('/var/www/wemx', os.R_OK)
+    
+    # Check if .env file exists
+    env_status = os.path.exists(ENV_FILE_PATH)
+    
+    # Check web server and PHP-FPM status from the shared snapshot
+    units = service_status.get()
+    nginx_status = units.get('nginx') == 'active'
+    
+    php_status = False
+    active_php_version = None
+    
+    for version in PHP_FPM_VERSIONS:
+        if units.get(f'php{version}-fpm') == 'active':
+            php_status = True
+            active_php_version = version
+            break
+    
+    # Check root privileges
+    root_status = check_root_permissions()
+    
+    return {
+        'wemx_directory': wemx_status,
+        'env_file': env_status,
+        'nginx': nginx_status,
+        'php_fpm': php_status,
+        'php_version': active_php_version,
+        'root_privileges': root_status,
+        'overall_status': all([wemx_status, env_status, nginx_status, php_status, root_status])
+    }
+
+# One sampler per worker feeds every open dashboard over SSE
+status_feed = StatusFeed(
+    collect_status,
+    interval=getattr(wemx_config, 'STATUS_STREAM_INTERVAL', 5),
+    max_subscribers=getattr(wemx_config, 'STATUS_STREAM_MAX_CLIENTS', 8)
+)
+service_status.on_invalidate = status_feed.poke
+service_status.on_change = status_feed.poke
+
+@app.route('/status/stream')
+def status_stream():
+    """Live status over SSE: a full 'status' event, then 'delta' events with changed fields"""
+    try:
+        events = status_feed.subscribe()
+    except FeedFull as e:
+        return jsonify({'error': str(e)}), 503
+    
+    def generate():
+        for kind, payload in events:
+            # A comment line keeps proxies from closing an idle stream
+            yield ': keepalive\n\n' if kind == 'heartbeat' else sse_event(kind, payload)
+    
+    response = sse_response(generate())
+    # Frees the slot even if the client left before the stream was iterated
+    response.call_on_close(events.close)
+    return response
+
+# Fleet mode: this panel answers signed RPCs from a controller (agent) and/or fans
+# operations out to the panels in FLEET_NODES (controller)
+FLEET_TOKEN = getattr(wemx_config, 'FLEET_TOKEN', '')
+FLEET_NODES = getattr(wemx_config, 'FLEET_NODES', {})
+FLEET_OPERATIONS = {
+    'status': 'status',
+    'clear-cache': 'clear_cache',
+    'restart': 'restart_wemx',
+    'permissions': 'update_permissions',
+    'certificates': 'list_certificates'
+}
+fleet_verifier = RequestVerifier(FLEET_TOKEN)
+fleet = FleetController(
+    FLEET_NODES,
+    FLEET_TOKEN,
+    timeout=getattr(wemx_config, 'FLEET_TIMEOUT', 60),
+    max_workers=getattr(wemx_config, 'FLEET_CONCURRENCY', 16)
+)
+
+@app.route('/fleet/rpc/<operation>', methods=['POST'])
+def fleet_rpc(operation):
+    """Agent side: run one of FLEET_OPERATIONS locally for a signed controller call"""
+    try:
+        fleet_verifier.verify(request.headers, operation, request.get_data())
+    except FleetAuthError as e:
+        return jsonify({'success': False, 'error': str(e)}), 403
+    
+    endpoint = FLEET_OPERATIONS.get(operation)
+    if endpoint is None:
+        return jsonify({'success': False, 'error': f'Unknown operation: {operation}'}), 404
+    
+    result = app.make_response(app.view_functions[endpoint]()).get_json() or {}
+    # /status reports no success flag of its own
+    result.setdefault('success', 'error' not in result)
+    result['node'] = socket.gethostname()
+    return jsonify(result)
+
+@app.route('/fleet')
+def fleet_nodes():
+    """Controller side: configured nodes and the operations they accept"""
+    return jsonify({'nodes': FLEET_NODES, 'operations': sorted(FLEET_OPERATIONS)})
+
+@app.route('/fleet/<operation>', methods=['POST'])
+def fleet_call(operation):
+    """Controller side: run an operation on every node (or the comma separated nodes) at once"""
+    if operation not in FLEET_OPERATIONS:
+        return jsonify({'success': False, 'error': f'Unknown operation: {operation}'}), 404
+    if not FLEET_NODES or not FLEET_TOKEN:
+        return jsonify({'success': False, 'error': 'Fleet mode needs FLEET_NODES and FLEET_TOKEN in wemx_config.py'})
+    
+    names = [name.strip() for name in request.form.get('nodes', '').split(',') if name.strip()] or None
+    result = fleet.call(operation, names=names)
+    result['success'] = not result['failed']
+    return jsonify(result)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Command and route metrics of this process in Prometheus text format"""
+    return Response(metrics.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+def parse_audit_time(value):
+    """Epoch seconds from a query argument given as epoch or ISO 8601"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/audit')
+def audit():
+    """Journal entries, newest first, filtered by since/until, route, ip and success"""
+    try:
+        success = request.args.get('success')
+        entries, stats = audit_journal.query(
+            since=parse_audit_time(request.args.get('since')),
+            until=parse_audit_time(request.args.get('until')),
+            route=request.args.get('route') or None,
+            ip=request.args.get('ip') or None,
+            success=None if success in (None, '') else success.lower() in ('1', 'true', 'yes'),
+            limit=min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        )
+        return jsonify({'success': True, 'entries': entries, 'stats': stats})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid time: {e}'}), 400
+
+@app.route('/timings')
+def timings():
+    """Per-request hook timings since startup or the last reset"""
+    if request.args.get('reset') == '1':
+        hook_timer.reset()
+    return jsonify({'pid': os.getpid(), 'hooks': hook_timer.snapshot()})
+
+# Registered last so every request hook above is covered
+hook_timer.instrument(app)
+
 if __name__ == '__main__':
     # Check if running as root
     if not check_root_permissions():
         print("WARNING: Not running as root. Some functionality may be limited.")
         print("For full functionality, run as root or configure proper sudo permissions.")
     
-    # Ensure WemX permissions are correct on startup
-    if check_root_permissions():
-        fix_wemx_permissions()
+    # Bind first so the panel is reachable immediately
+    server = make_server('0.0.0.0', 5000, app, threaded=True)
+    print(" * Running on http://0.0.0.0:5000")
+    
+    # Ensure WemX permissions are correct on startup, without blocking requests
+    start_background_tasks()
     
-    app.run(host='0.0.0.0', port=5000, debug=False)  # Disable debug in production
+    server.serve_forever()
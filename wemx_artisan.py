@@ -0,0 +1,47 @@
+import json
+import os
+
+# Bundled driver that runs many artisan commands in one Laravel bootstrap
+ARTISAN_BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artisan_batch.php')
+
+
+def batch_command(commands, base_path, php='/usr/bin/php'):
+    """argv running commands through the batch driver in a single PHP process"""
+    return [php, ARTISAN_BATCH_SCRIPT, base_path, *commands]
+
+
+def single_command(command, php='/usr/bin/php'):
+    """argv running one command through artisan itself"""
+    return [php, 'artisan', *command.split()]
+
+
+def parse_report(line):
+    """Decode one per-command report line printed by the driver, or None"""
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        report = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(report, dict) or 'command' not in report:
+        return None
+
+    return {
+        'command': report['command'],
+        'success': report.get('exit_code') == 0,
+        'exit_code': report.get('exit_code'),
+        'duration_ms': report.get('duration_ms'),
+        'output': report.get('output', ''),
+        'batched': True
+    }
+
+
+def format_report(report):
+    """One status line for a finished artisan command"""
+    mark = '✅' if report['success'] else '❌'
+    timing = f" ({report['duration_ms']:.0f} ms)" if report.get('duration_ms') is not None else ''
+    line = f"{mark} artisan {report['command']}{timing}"
+    if not report['success']:
+        line += f" - exit {report['exit_code']}: {report['output'].strip()}"
+    return line
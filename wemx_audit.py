@@ -0,0 +1,245 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from wemx_files import atomic_write
+
+SEGMENT_RE = re.compile(r'^audit-(\d{8})\.jsonl$')
+
+# Form fields whose values never reach the journal
+SECRET_FIELD_RE = re.compile(r'pass|secret|token|key|licen[cs]e|auth|cookie', re.IGNORECASE)
+# Rows of the .env editor: key_N names a variable and stays visible, value_N is always masked
+ENV_ROW_RE = re.compile(r'^(key|value)_\d+$')
+# Whole config files are recorded as their size and hash whatever their length
+BODY_FIELD_RE = re.compile(r'content$')
+# As are other long values
+MAX_VALUE_CHARS = 256
+
+# A sparse index mark is written whenever the segment grows into a new block
+INDEX_BLOCK_BYTES = 64 * 1024
+
+
+def redact(fields):
+    """Copy of a {name: value} form with secrets masked and large values summarised"""
+    clean = {}
+    for name, value in fields.items():
+        env_row = ENV_ROW_RE.match(name)
+        if env_row:
+            clean[name] = value if env_row.group(1) == 'key' else '[redacted]'
+        elif SECRET_FIELD_RE.search(name):
+            clean[name] = '[redacted]'
+        elif isinstance(value, str) and (BODY_FIELD_RE.search(name) or len(value) > MAX_VALUE_CHARS):
+            digest = hashlib.sha256(value.encode('utf-8', errors='replace')).hexdigest()[:16]
+            clean[name] = f'[{len(value)} chars sha256:{digest}]'
+        else:
+            clean[name] = value
+    return clean
+
+
+class AuditJournal:
+    """Append-only operation journal in rotating JSONL segments
+
+    Entries go to audit-<n>.jsonl, one compact JSON object per line with a
+    ``ts`` taken under the journal lock, so lines are in time order. Next to
+    each segment a sparse .idx file marks a line start every
+    INDEX_BLOCK_BYTES. When a segment reaches segment_bytes it is sealed
+    with a .summary.json (time range, count, routes) and a new one starts.
+    Queries skip sealed segments by their summary and walk a segment's
+    blocks newest first, stopping at the first block older than the range,
+    so they read only the blocks that can match. A file lock makes appends
+    and rotation safe across wemx_server workers.
+    """
+
+    def __init__(self, root, segment_bytes=8 * 1024 * 1024, keep_segments=100):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self._lock = threading.Lock()
+        self._indexed_blocks = {}
+
+    def record(self, entry):
+        """Append entry (a dict) with the current time as its ts"""
+        with self._locked():
+            entry = dict(entry, ts=round(time.time(), 6))
+            line = (json.dumps(entry, separators=(',', ':'), default=str) + '\n').encode()
+            sequence = self._active_segment()
+            path = self._segment_path(sequence)
+            try:
+                offset = os.path.getsize(path)
+            except FileNotFoundError:
+                offset = 0
+            if offset and offset + len(line) > self.segment_bytes:
+                self._seal(sequence)
+                sequence += 1
+                path = self._segment_path(sequence)
+                offset = 0
+
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+            block = offset // INDEX_BLOCK_BYTES
+            if self._indexed_blocks.get(sequence, -1) < block:
+                # Another worker may have marked this block already; a duplicate mark is harmless
+                self._indexed_blocks = {sequence: block}
+                mark = json.dumps([entry['ts'], offset], separators=(',', ':')) + '\n'
+                fd = os.open(self._index_path(sequence), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, mark.encode())
+                finally:
+                    os.close(fd)
+
+    def query(self, since=None, until=None, route=None, ip=None, success=None, limit=100):
+        """Newest-first entries matching every given filter, plus how much was read"""
+        started = time.perf_counter()
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        entries = []
+        stats = {'segments_total': 0, 'segments_read': 0, 'bytes_read': 0}
+
+        sequences = self._sequences()
+        stats['segments_total'] = len(sequences)
+        for sequence in reversed(sequences):
+            summary = self._summary(sequence)
+            if summary is not None:
+                if summary['last_ts'] < since:
+                    break
+                if summary['first_ts'] > until or (route is not None and route not in summary['routes']):
+                    continue
+
+            stats['segments_read'] += 1
+            for window in self._windows(sequence):
+                matches = []
+                for entry, size in window:
+                    stats['bytes_read'] += size
+                    if not since <= entry['ts'] <= until:
+                        continue
+                    if route is not None and entry.get('route') != route:
+                        continue
+                    if ip is not None and entry.get('ip') != ip:
+                        continue
+                    if success is not None and entry.get('success') is not success:
+                        continue
+                    matches.append(entry)
+                entries.extend(reversed(matches))
+                if len(entries) >= limit or (window and window[0][0]['ts'] < since):
+                    break
+            if len(entries) >= limit:
+                break
+
+        stats['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return entries[:limit], stats
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            os.makedirs(self.root, mode=0o700, exist_ok=True)
+            fd = os.open(os.path.join(self.root, 'journal.lock'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            with open(fd, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segment_path(self, sequence):
+        return os.path.join(self.root, f'audit-{sequence:08d}.jsonl')
+
+    def _index_path(self, sequence):
+        return os.path.join(self.root, f'audit-{sequence:08d}.idx')
+
+    def _summary_path(self, sequence):
+        return os.path.join(self.root, f'audit-{sequence:08d}.summary.json')
+
+    def _sequences(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(int(match.group(1)) for match in map(SEGMENT_RE.match, names) if match)
+
+    def _active_segment(self):
+        sequences = self._sequences()
+        if not sequences:
+            return 1
+        # A sealed newest segment means its successor has no entries yet
+        return sequences[-1] + 1 if os.path.exists(self._summary_path(sequences[-1])) else sequences[-1]
+
+    def _summary(self, sequence):
+        try:
+            with open(self._summary_path(sequence), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _seal(self, sequence):
+        # Caller holds the journal lock
+        first_ts = last_ts = None
+        count = 0
+        routes = set()
+        for entry, _ in self._read_segment(sequence):
+            first_ts = entry['ts'] if first_ts is None else first_ts
+            last_ts = entry['ts']
+            count += 1
+            routes.add(entry.get('route'))
+        atomic_write(self._summary_path(sequence), json.dumps({
+            'first_ts': first_ts,
+            'last_ts': last_ts,
+            'entries': count,
+            'routes': sorted(route for route in routes if route)
+        }), mode=0o600)
+
+        if self.keep_segments:
+            for old in self._sequences()[:-self.keep_segments]:
+                for path in (self._segment_path(old), self._index_path(old), self._summary_path(old)):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _windows(self, sequence):
+        """Yield a segment's indexed blocks newest first, each as [(entry, line bytes)] in file order"""
+        try:
+            f = open(self._segment_path(sequence), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            end = os.fstat(f.fileno()).st_size
+            for start in reversed(self._block_offsets(sequence)):
+                if start >= end:
+                    continue
+                f.seek(start)
+                window = []
+                for line in f.read(end - start).splitlines(keepends=True):
+                    try:
+                        window.append((json.loads(line), len(line)))
+                    except ValueError:
+                        # A torn line from a crashed writer
+                        continue
+                yield window
+                end = start
+
+    def _block_offsets(self, sequence):
+        offsets = {0}
+        try:
+            with open(self._index_path(sequence), 'r') as f:
+                for line in f:
+                    try:
+                        offsets.add(json.loads(line)[1])
+                    except (ValueError, IndexError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return sorted(offsets)
+
+    def _read_segment(self, sequence):
+        """Yield (entry, line bytes) for every entry of a segment in file order"""
+        for window in reversed(list(self._windows(sequence))):
+            yield from window
@@ -0,0 +1,157 @@
+import difflib
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from wemx_files import atomic_write
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+TARGET_RE = re.compile(r'^[a-z0-9_-]+$')
+
+
+class BackupError(Exception):
+    """Unknown backup target or snapshot"""
+
+
+class BackupStore:
+    """Content-addressed, gzip-compressed snapshots of the files the panel edits
+
+    Snapshots live in objects/<aa>/<sha256>.gz and are shared between
+    targets; index/<target>.json lists a target's snapshots oldest first.
+    Saving content identical to the newest snapshot costs nothing. Each
+    target keeps at most ``keep`` snapshots and drops ones older than
+    ``max_age_days`` (the newest is always kept); objects no longer
+    referenced by any target are deleted. ``keep=0`` keeps no snapshots at
+    all. A file lock makes index updates and garbage collection safe across
+    wemx_server workers.
+    """
+
+    def __init__(self, root, keep=20, max_age_days=90):
+        self.root = root
+        self.keep = max(0, keep)
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+
+    def snapshot(self, target, path):
+        """Store the current contents of path; returns the entry or None if path is missing"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        with self._locked():
+            entries = self._load_index(target)
+            if entries and entries[-1]['hash'] == digest:
+                return entries[-1]
+
+            object_path = self._object_path(digest)
+            if self.keep and not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), mode=0o700, exist_ok=True)
+                atomic_write(object_path, gzip.compress(data, mtime=0), mode=0o600)
+
+            entry = {'hash': digest, 'created_at': time.time(), 'size': len(data), 'path': path}
+            entries.append(entry)
+            trimmed = self._apply_retention(entries)
+            self._save_index(target, entries)
+            if trimmed:
+                self._collect_garbage()
+            return entry if entries else None
+
+    def list(self, target):
+        """Snapshots of target, newest first"""
+        with self._locked():
+            return list(reversed(self._load_index(target)))
+
+    def read(self, target, digest):
+        """Decompressed bytes of one of target's snapshots"""
+        with self._locked():
+            if not any(entry['hash'] == digest for entry in self._load_index(target)):
+                raise BackupError(f'No snapshot {digest} for {target}')
+            with open(self._object_path(digest), 'rb') as f:
+                return gzip.decompress(f.read())
+
+    def diff(self, target, digest, path):
+        """Unified diff from a snapshot to the current contents of path"""
+        old = self.read(target, digest).decode('utf-8', errors='replace')
+        try:
+            with open(path, 'rb') as f:
+                new = f.read().decode('utf-8', errors='replace')
+        except FileNotFoundError:
+            new = ''
+        return ''.join(difflib.unified_diff(
+            old.splitlines(keepends=True),
+            new.splitlines(keepends=True),
+            fromfile=f'{target}@{digest[:12]}',
+            tofile=path
+        ))
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            os.makedirs(self.root, mode=0o700, exist_ok=True)
+            with open(os.path.join(self.root, 'store.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _object_path(self, digest):
+        if not DIGEST_RE.match(digest):
+            raise BackupError(f'Invalid snapshot id {digest}')
+        return os.path.join(self.root, 'objects', digest[:2], f'{digest}.gz')
+
+    def _index_path(self, target):
+        if not TARGET_RE.match(target):
+            raise BackupError(f'Invalid backup target {target}')
+        return os.path.join(self.root, 'index', f'{target}.json')
+
+    def _load_index(self, target):
+        try:
+            with open(self._index_path(target), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _save_index(self, target, entries):
+        index_path = self._index_path(target)
+        os.makedirs(os.path.dirname(index_path), mode=0o700, exist_ok=True)
+        atomic_write(index_path, json.dumps(entries, indent=1), mode=0o600)
+
+    def _apply_retention(self, entries):
+        """Trim entries in place; returns True if anything was dropped"""
+        before = len(entries)
+        cutoff = time.time() - self.max_age_days * 86400
+        newest = entries[-1:]
+        kept = [entry for entry in entries[:-1] if entry['created_at'] >= cutoff] + newest
+        # kept[-0:] would be everything
+        entries[:] = kept[-self.keep:] if self.keep else []
+        return len(entries) != before
+
+    def _collect_garbage(self):
+        """Delete objects that no target's index references any more
+
+        Caller holds the store lock, so no other worker is between writing an
+        object and indexing it.
+        """
+        index_dir = os.path.join(self.root, 'index')
+        referenced = set()
+        for name in os.listdir(index_dir):
+            if name.endswith('.json'):
+                referenced.update(entry['hash'] for entry in self._load_index(name[:-5]))
+
+        objects_dir = os.path.join(self.root, 'objects')
+        if not os.path.isdir(objects_dir):
+            return
+        for prefix in os.listdir(objects_dir):
+            for name in os.listdir(os.path.join(objects_dir, prefix)):
+                if name[:-3] not in referenced:
+                    os.unlink(os.path.join(objects_dir, prefix, name))
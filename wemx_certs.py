@@ -0,0 +1,329 @@
+import base64
+import bisect
+import datetime
+import ipaddress
+import os
+import threading
+
+from wemx_files import file_signature
+
+LETSENCRYPT_ROOT = '/etc/letsencrypt'
+
+# DER encodings of the object identifiers the inventory cares about
+OID_COMMON_NAME = bytes.fromhex('550403')                  # 2.5.4.3
+OID_SUBJECT_ALT_NAME = bytes.fromhex('551d11')             # 2.5.29.17
+OID_RSA = bytes.fromhex('2a864886f70d010101')              # 1.2.840.113549.1.1.1
+OID_EC_PUBLIC_KEY = bytes.fromhex('2a8648ce3d0201')        # 1.2.840.10045.2.1
+OID_ED25519 = bytes.fromhex('2b6570')                      # 1.3.101.112
+EC_CURVES = {
+    bytes.fromhex('2a8648ce3d030107'): 'P-256',            # prime256v1
+    bytes.fromhex('2b81040022'): 'P-384',                  # secp384r1
+    bytes.fromhex('2b81040023'): 'P-521'                   # secp521r1
+}
+
+TAG_UTC_TIME = 0x17
+TAG_VERSION = 0xa0          # [0] EXPLICIT in TBSCertificate
+TAG_EXTENSIONS = 0xa3       # [3] EXPLICIT in TBSCertificate
+TAG_SAN_DNS = 0x82          # dNSName [2] IMPLICIT
+TAG_SAN_IP = 0x87           # iPAddress [7] IMPLICIT
+
+
+class CertificateError(Exception):
+    """A certificate file that could not be read or parsed"""
+
+
+def _read_tlv(data, offset):
+    """(tag, value_start, value_end) of the DER element at offset"""
+    if offset + 2 > len(data):
+        raise CertificateError('Truncated DER element')
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        if count == 0 or count > 4 or offset + count > len(data):
+            raise CertificateError('Unsupported DER length')
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+    if offset + length > len(data):
+        raise CertificateError('Truncated DER element')
+    return tag, offset, offset + length
+
+
+def _children(data, start, end):
+    """(tag, value_start, value_end) of each element inside a constructed value"""
+    items = []
+    while start < end:
+        tag, value_start, value_end = _read_tlv(data, start)
+        items.append((tag, value_start, value_end))
+        start = value_end
+    return items
+
+
+def _parse_time(tag, raw):
+    text = raw.decode('ascii')
+    if tag == TAG_UTC_TIME:
+        # Two-digit years: 50-99 are 19xx, 00-49 are 20xx (RFC 5280)
+        year = int(text[:2])
+        text = ('19' if year >= 50 else '20') + text
+    return datetime.datetime.strptime(text[:14], '%Y%m%d%H%M%S').replace(tzinfo=datetime.timezone.utc)
+
+
+def _common_name(data, start, end):
+    for _, set_start, set_end in _children(data, start, end):
+        for _, attr_start, attr_end in _children(data, set_start, set_end):
+            (_, oid_start, oid_end), (_, value_start, value_end) = _children(data, attr_start, attr_end)[:2]
+            if data[oid_start:oid_end] == OID_COMMON_NAME:
+                return data[value_start:value_end].decode('utf-8', errors='replace')
+    return None
+
+
+def _key_type(data, start, end):
+    (_, alg_start, alg_end), (_, key_start, key_end) = _children(data, start, end)[:2]
+    algorithm = _children(data, alg_start, alg_end)
+    oid = data[algorithm[0][1]:algorithm[0][2]]
+    if oid == OID_RSA:
+        # BIT STRING: one unused-bits byte, then SEQUENCE { modulus, exponent }
+        _, seq_start, seq_end = _read_tlv(data, key_start + 1)
+        _, mod_start, mod_end = _children(data, seq_start, seq_end)[0]
+        bits = int.from_bytes(data[mod_start:mod_end], 'big').bit_length()
+        return f'RSA {bits}'
+    if oid == OID_EC_PUBLIC_KEY:
+        curve = data[algorithm[1][1]:algorithm[1][2]] if len(algorithm) > 1 else b''
+        return f"ECDSA {EC_CURVES.get(curve, 'unknown curve')}"
+    if oid == OID_ED25519:
+        return 'Ed25519'
+    return 'unknown'
+
+
+def _subject_alt_names(data, start, end):
+    names = []
+    _, seq_start, seq_end = _read_tlv(data, start)
+    for tag, value_start, value_end in _children(data, seq_start, seq_end):
+        if tag == TAG_SAN_DNS:
+            names.append(data[value_start:value_end].decode('ascii', errors='replace'))
+        elif tag == TAG_SAN_IP:
+            raw = data[value_start:value_end]
+            names.append(str(ipaddress.ip_address(raw)))
+    return names
+
+
+def parse_certificate(der):
+    """Subject CN, SANs, validity, issuer CN, serial and key type of a DER certificate"""
+    try:
+        _, cert_start, cert_end = _read_tlv(der, 0)
+        _, tbs_start, tbs_end = _children(der, cert_start, cert_end)[0]
+        fields = _children(der, tbs_start, tbs_end)
+        if fields and fields[0][0] == TAG_VERSION:
+            fields = fields[1:]
+
+        serial, _, issuer, validity, subject, public_key = fields[:6]
+        not_before, not_after = _children(der, validity[1], validity[2])[:2]
+
+        sans = []
+        for tag, ext_start, ext_end in fields[6:]:
+            if tag != TAG_EXTENSIONS:
+                continue
+            _, list_start, list_end = _read_tlv(der, ext_start)
+            for _, item_start, item_end in _children(der, list_start, list_end):
+                parts = _children(der, item_start, item_end)
+                if der[parts[0][1]:parts[0][2]] == OID_SUBJECT_ALT_NAME:
+                    _, value_start, value_end = parts[-1]
+                    sans = _subject_alt_names(der, value_start, value_end)
+
+        return {
+            'subject_cn': _common_name(der, subject[1], subject[2]),
+            'issuer_cn': _common_name(der, issuer[1], issuer[2]),
+            'serial': der[serial[1]:serial[2]].hex(),
+            'not_before': _parse_time(not_before[0], der[not_before[1]:not_before[2]]),
+            'not_after': _parse_time(not_after[0], der[not_after[1]:not_after[2]]),
+            'sans': sans,
+            'key_type': _key_type(der, public_key[1], public_key[2])
+        }
+    except (IndexError, ValueError, UnicodeDecodeError) as e:
+        raise CertificateError(f'Malformed certificate: {e}')
+
+
+def read_pem_certificate(path):
+    """DER bytes of the first certificate in a PEM file"""
+    with open(path, 'rb') as f:
+        text = f.read()
+    begin = text.find(b'-----BEGIN CERTIFICATE-----')
+    end = text.find(b'-----END CERTIFICATE-----', begin)
+    if begin < 0 or end < 0:
+        raise CertificateError(f'No PEM certificate in {path}')
+    return base64.b64decode(b''.join(text[begin + 27:end].split()))
+
+
+def parse_renewal_conf(path):
+    """Top-level keys of a certbot renewal .conf plus its [section] dicts"""
+    conf = {}
+    section = conf
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                section = conf.setdefault(line[1:-1], {})
+                continue
+            key, sep, value = line.partition('=')
+            if sep:
+                section[key.strip()] = value.strip()
+    return conf
+
+
+class CertificateInventory:
+    """Let's Encrypt lineages read straight from /etc/letsencrypt
+
+    Each lineage is parsed from live/<name>/cert.pem and renewal/<name>.conf
+    and kept until one of those files changes (inode/mtime/size, so a
+    renewal that repoints the live symlink is noticed). Lineages are kept
+    in an index sorted by expiry; days_left is computed when asked for.
+    """
+
+    def __init__(self, root=LETSENCRYPT_ROOT):
+        self.root = root
+        self._entries = {}
+        self._index = []
+        self._index_keys = []
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def certificates(self, now=None):
+        """All lineages, soonest expiry first"""
+        index, _ = self._refresh()
+        return [self._present(entry, now) for entry in index]
+
+    def get(self, name, now=None):
+        self._refresh()
+        entry = self._entries.get(name)
+        return self._present(entry[1], now) if entry else None
+
+    def for_domains(self, domains, now=None):
+        """Most recently issued lineage covering every name in domains, or None
+
+        certbot names lineages after their first domain but adds a -0001
+        suffix when that name is taken, so lineages are matched by SAN.
+        """
+        wanted = {domain.lower() for domain in domains}
+        index, _ = self._refresh()
+        matches = [entry for entry in index if entry.get('not_after') and
+                   wanted <= {name.lower() for name in entry['sans'] + [entry['subject_cn'] or '']}]
+        if not matches:
+            return None
+        return self._present(max(matches, key=lambda entry: entry['not_before']), now)
+
+    def expiring_within(self, days, now=None):
+        """Lineages whose certificate expires within days (including expired ones)"""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        index, keys = self._refresh()
+        cutoff = (now + datetime.timedelta(days=days)).timestamp()
+        return [self._present(entry, now) for entry in index[:bisect.bisect_right(keys, cutoff)]]
+
+    def _lineage_names(self):
+        live_dir = os.path.join(self.root, 'live')
+        try:
+            with os.scandir(live_dir) as entries:
+                return sorted(entry.name for entry in entries if entry.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def _refresh(self):
+        names = self._lineage_names()
+        signatures = {name: (file_signature(os.path.join(self.root, 'live', name, 'cert.pem')),
+                             file_signature(os.path.join(self.root, 'renewal', f'{name}.conf')))
+                      for name in names}
+        signature = tuple(sorted(signatures.items()))
+
+        with self._lock:
+            if signature == self._signature:
+                return self._index, self._index_keys
+
+            entries = {}
+            for name, lineage_signature in signatures.items():
+                cached = self._entries.get(name)
+                if cached is not None and cached[0] == lineage_signature:
+                    entries[name] = cached
+                else:
+                    entries[name] = (lineage_signature, self._load(name))
+
+            self._entries = entries
+            self._index = sorted((entry for _, entry in entries.values()), key=self._expiry_key)
+            self._index_keys = [self._expiry_key(entry) for entry in self._index]
+            self._signature = signature
+            return self._index, self._index_keys
+
+    @staticmethod
+    def _expiry_key(entry):
+        # Unreadable lineages sort first so they are not overlooked
+        return entry['not_after'].timestamp() if entry.get('not_after') else float('-inf')
+
+    def _load(self, name):
+        live = os.path.join(self.root, 'live', name)
+        entry = {
+            'name': name,
+            'cert_path': os.path.join(live, 'cert.pem'),
+            'fullchain_path': os.path.join(live, 'fullchain.pem'),
+            'privkey_path': os.path.join(live, 'privkey.pem'),
+            'renewal': {}
+        }
+        try:
+            entry.update(parse_certificate(read_pem_certificate(entry['cert_path'])))
+        except (OSError, CertificateError) as e:
+            entry['error'] = str(e)
+
+        renewal_path = os.path.join(self.root, 'renewal', f'{name}.conf')
+        try:
+            conf = parse_renewal_conf(renewal_path)
+            params = conf.get('renewalparams', {})
+            entry['renewal'] = {
+                'conf_path': renewal_path,
+                'authenticator': params.get('authenticator'),
+                'installer': params.get('installer'),
+                'server': params.get('server'),
+                'key_type': params.get('key_type'),
+                'webroot_path': params.get('webroot_path', '').rstrip(',') or None
+            }
+        except OSError:
+            pass
+        return entry
+
+    @staticmethod
+    def _present(entry, now=None):
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        result = dict(entry)
+        not_after = entry.get('not_after')
+        if not_after is not None:
+            domains = list(entry['sans'])
+            if entry['subject_cn'] and entry['subject_cn'] not in domains:
+                domains.insert(0, entry['subject_cn'])
+            result['domains'] = domains
+            result['days_left'] = (not_after - now).days
+            result['expired'] = not_after <= now
+            result['not_before'] = entry['not_before'].isoformat()
+            result['not_after'] = not_after.isoformat()
+        server = entry['renewal'].get('server') or ''
+        result['staging'] = 'staging' in server
+        return result
+
+
+def format_certificates(certificates):
+    """certbot-certificates style text for the panel's output box"""
+    if not certificates:
+        return 'No certificates found'
+    lines = [f'Found {len(certificates)} certificate(s), soonest expiry first:', '']
+    for cert in certificates:
+        lines.append(f"Certificate Name: {cert['name']}")
+        if cert.get('error'):
+            lines.append(f"  Error: {cert['error']}")
+        else:
+            state = 'EXPIRED' if cert['expired'] else f"VALID: {cert['days_left']} days"
+            lines.append(f"  Domains: {' '.join(cert['domains'])}")
+            lines.append(f"  Expiry Date: {cert['not_after']} ({state})")
+            lines.append(f"  Key Type: {cert['key_type']}")
+            lines.append(f"  Issuer: {cert['issuer_cn']}{' (staging)' if cert['staging'] else ''}")
+        lines.append(f"  Certificate Path: {cert['fullchain_path']}")
+        lines.append(f"  Private Key Path: {cert['privkey_path']}")
+        lines.append('')
+    return '\n'.join(lines)
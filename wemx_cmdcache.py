@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CommandResultCache:
+    """Memoised results of read-only commands with per-call TTLs and LRU eviction
+
+    Entries are keyed by the command and the runner's keyword arguments and
+    carry tags (e.g. 'certbot', 'license'); routes that change what a
+    command reports call invalidate() with the matching tags. Only
+    successful results are kept, so a failure (certbot not installed yet,
+    a timeout) is retried on the next view. Concurrent misses for the same
+    key run the command once.
+    """
+
+    def __init__(self, runner, max_entries=64, on_lookup=None):
+        self._runner = runner
+        self.max_entries = max_entries
+        self._on_lookup = on_lookup
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def run(self, command, ttl, tags=(), **kwargs):
+        """Result of runner(command, **kwargs), reused for up to ttl seconds"""
+        key = (tuple(command) if isinstance(command, list) else command, tuple(sorted(kwargs.items())))
+
+        result = self._lookup(key)
+        if result is not None:
+            self._report('hit')
+            return result
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another request may have filled the entry while we waited
+            result = self._lookup(key)
+            if result is not None:
+                self._report('hit')
+                return result
+
+            self._report('miss')
+            result = self._runner(command, **kwargs)
+            if result.get('success'):
+                with self._lock:
+                    self._entries[key] = (time.monotonic() + ttl, frozenset(tags), result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            with self._lock:
+                self._key_locks.pop(key, None)
+            return dict(result)
+
+    def invalidate(self, *tags):
+        """Drop entries carrying any of tags, or everything when no tag is given"""
+        with self._lock:
+            if not tags:
+                self._entries.clear()
+                return
+            wanted = set(tags)
+            for key in [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & wanted]:
+                del self._entries[key]
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, _, result = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(result)
+
+    def _report(self, outcome):
+        if self._on_lookup is not None:
+            self._on_lookup(outcome)
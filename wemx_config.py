@@ -3,7 +3,56 @@ WHITELISTED_IPS = [
     '::1',              # localhost IPv6
     '92.25.173.186',    # Your actual IP
     '198.51.100.50',    # Another allowed IP
-    # Add more IPs as needed
+    # Add more IPs or CIDR ranges (e.g. '10.8.0.0/24', '2001:db8::/48') as needed
 ]
 
+# Proxies allowed to pass the real client address in X-Real-IP
+TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
 PHP_VERSION = '8.1'   # Change to your PHP version (8.0, 8.1, 8.2, etc.)
+
+JOB_WORKERS = 2       # Background workers for long-running jobs (certbot, apt)
+STATUS_CACHE_TTL = 5  # Seconds a unit state is reused when not following the journal
+UNIT_STATE_BACKEND = 'journal'  # 'journal' (follow systemd's journal for unit changes) or 'poll'
+STATUS_STREAM_INTERVAL = 5  # Seconds between samples pushed to open dashboards
+STATUS_STREAM_MAX_CLIENTS = 8  # Live status streams per worker (each holds a server thread)
+JOB_STREAM_MAX_CLIENTS = 4  # Job output streams per worker; keep both caps below --threads
+PERMISSION_WORKERS = 8  # Threads used when fixing WemX file permissions
+COMMAND_CACHE_SIZE = 64  # Cached results of read-only commands (certbot --version, license:check)
+
+# Limits for every command the panel runs. Each runs in its own process group, so a
+# timeout kills apt/certbot children too. Categories: packages (apt, dpkg), certbot,
+# artisan, filesystem (chown, chmod, find...), services (systemctl, nginx), other
+COMMAND_RLIMITS = {'cpu': 900, 'memory': 4 * 1024 ** 3, 'nofile': 4096}  # CPU seconds, address space bytes, open files
+COMMAND_CONCURRENCY = 8     # Commands running at once, across all categories and workers
+COMMAND_SLOT_DIR = '/run/wemx-admin/slots'  # Lock files that share the caps between workers
+COMMAND_CATEGORY_LIMITS = {'packages': 1, 'filesystem': 1, 'certbot': 2, 'artisan': 2}
+
+# How certbot proves domain ownership: 'webroot' (through the running nginx, no
+# downtime) or 'standalone' (nginx is stopped while certbot runs)
+CERTBOT_CHALLENGE = 'webroot'
+ACME_WEBROOT = '/var/www/letsencrypt'
+RENEWAL_WINDOW_DAYS = 30    # Renew certificates expiring within this many days
+RENEWAL_CONCURRENCY = 1     # Parallel certbot runs (certbot locks /etc/letsencrypt, keep 1 unless isolated)
+
+# Deduplicated, compressed snapshots taken before every save
+BACKUP_DIR = '/var/lib/wemx-admin/backups'
+BACKUP_KEEP = 20            # Snapshots kept per file (0 keeps none)
+BACKUP_MAX_AGE_DAYS = 90    # Older snapshots are pruned (the newest is always kept)
+
+# Shadow copies of /etc/nginx where edited config is tested before it goes live
+NGINX_STAGING_DIR = '/var/lib/wemx-admin/nginx-staging'
+
+# Append-only journal of every state-changing request, queried via /audit
+AUDIT_DIR = '/var/lib/wemx-admin/audit'
+AUDIT_SEGMENT_BYTES = 8 * 1024 * 1024   # Size at which a journal segment is sealed and a new one started
+AUDIT_KEEP_SEGMENTS = 100               # Sealed segments kept (oldest are deleted)
+
+# Fleet mode. A panel with FLEET_TOKEN set accepts signed operations from a controller
+# (the controller's IP must also be whitelisted); a panel with FLEET_NODES is a controller
+FLEET_TOKEN = ''            # Shared secret, identical on controller and agents; empty disables the agent
+FLEET_NODES = {
+    # 'node-1': 'https://panel.node-1.example.com',
+}
+FLEET_TIMEOUT = 60          # Seconds to wait for each node before reporting it timed out
+FLEET_CONCURRENCY = 16      # Nodes contacted at the same time
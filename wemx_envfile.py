@@ -0,0 +1,113 @@
+import threading
+
+from wemx_files import atomic_write, file_signature
+
+
+class EnvDocument:
+    """Line-level model of a .env file that keeps comments, blank lines and layout
+
+    Each line is kept verbatim; assignment lines also record their key and
+    value. Applying new values only rewrites the lines whose value changed,
+    so everything else in the file survives a save untouched.
+    """
+
+    def __init__(self, text=''):
+        self.lines = []
+        for raw in text.splitlines(keepends=True):
+            stripped = raw.strip()
+            if stripped and not stripped.startswith('#') and '=' in stripped:
+                key, value = stripped.split('=', 1)
+                self.lines.append({'raw': raw, 'key': key.strip(), 'value': value.strip()})
+            else:
+                self.lines.append({'raw': raw, 'key': None, 'value': None})
+
+    def copy(self):
+        doc = EnvDocument()
+        doc.lines = [dict(line) for line in self.lines]
+        return doc
+
+    def to_dict(self):
+        """Key/value pairs; a later duplicate key wins"""
+        return {line['key']: line['value'] for line in self.lines if line['key'] is not None}
+
+    def apply(self, env_vars):
+        """Make the document match env_vars, touching only lines that differ
+
+        Returns the number of keys added, changed or removed.
+        """
+        positions = {}
+        for index, line in enumerate(self.lines):
+            if line['key'] is not None:
+                positions.setdefault(line['key'], []).append(index)
+
+        changes = 0
+        drop = set()
+        for key, indexes in positions.items():
+            if key not in env_vars:
+                drop.update(indexes)
+                changes += 1
+            elif self.lines[indexes[-1]]['value'] != env_vars[key]:
+                index = indexes[-1]
+                ending = '\n' if self.lines[index]['raw'].endswith('\n') else ''
+                self.lines[index] = {'raw': f"{key}={env_vars[key]}{ending}", 'key': key, 'value': env_vars[key]}
+                # Earlier duplicates would shadow or confuse the new value
+                drop.update(indexes[:-1])
+                changes += 1
+
+        if drop:
+            self.lines = [line for i, line in enumerate(self.lines) if i not in drop]
+
+        for key, value in env_vars.items():
+            if key not in positions:
+                if self.lines and not self.lines[-1]['raw'].endswith('\n'):
+                    self.lines[-1]['raw'] += '\n'
+                self.lines.append({'raw': f"{key}={value}\n", 'key': key, 'value': value})
+                changes += 1
+
+        return changes
+
+    def serialize(self):
+        return ''.join(line['raw'] for line in self.lines)
+
+
+class EnvFileCache:
+    """Parsed .env documents cached until the file's inode, mtime or size changes"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def document(self, path):
+        """Cached EnvDocument for path; callers must copy() before modifying"""
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                return entry[1]
+
+        if signature is None:
+            doc = EnvDocument()
+        else:
+            with open(path, 'r') as f:
+                doc = EnvDocument(f.read())
+        with self._lock:
+            self._entries[path] = (signature, doc)
+        return doc
+
+    def write(self, path, env_vars, mode=None, uid=None, gid=None, before_write=None):
+        """Apply env_vars to path atomically; returns the number of changed keys
+
+        Nothing is written when no key changed. before_write() is called just
+        before the file is replaced, e.g. to take a backup.
+        """
+        with self._write_lock:
+            doc = self.document(path).copy()
+            changes = doc.apply(env_vars)
+            if changes:
+                if before_write:
+                    before_write()
+                atomic_write(path, doc.serialize(), mode=mode, uid=uid, gid=gid)
+                with self._lock:
+                    self._entries[path] = (file_signature(path), doc)
+            return changes
@@ -0,0 +1,55 @@
+import os
+import stat
+import tempfile
+
+
+def file_signature(path):
+    """(inode, mtime_ns, size) of path, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def atomic_write(path, data, mode=None, uid=None, gid=None):
+    """Replace path with data so readers see either the old or new file, never a partial one
+
+    Data goes to a temp file in the same directory, which is fsynced, given
+    its final mode/owner and renamed over path; the directory is then
+    fsynced so the rename survives a crash. Mode and owner default to those
+    of the file being replaced (owner only when running as root).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        existing = os.stat(path)
+    except FileNotFoundError:
+        existing = None
+
+    if mode is None:
+        mode = stat.S_IMODE(existing.st_mode) if existing else 0o644
+    if uid is None and existing and os.geteuid() == 0:
+        uid, gid = existing.st_uid, existing.st_gid
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        if uid is not None:
+            os.chown(tmp_path, uid, gid if gid is not None else -1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
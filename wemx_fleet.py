@@ -0,0 +1,164 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+RPC_PATH = '/fleet/rpc/'
+HEADER_TIMESTAMP = 'X-Wemx-Fleet-Timestamp'
+HEADER_NONCE = 'X-Wemx-Fleet-Nonce'
+HEADER_SIGNATURE = 'X-Wemx-Fleet-Signature'
+
+
+class FleetAuthError(Exception):
+    pass
+
+
+def sign(token, timestamp, nonce, operation, body):
+    """HMAC-SHA256 over everything a replayed or altered call could change"""
+    message = b'\n'.join([str(timestamp).encode(), nonce.encode(), operation.encode(), body])
+    return hmac.new(token.encode(), message, hashlib.sha256).hexdigest()
+
+
+class RequestVerifier:
+    """Checks fleet RPC signatures on the agent side
+
+    A call is accepted once: its timestamp must be within max_skew seconds
+    and its nonce unseen in that window, so a captured request cannot be
+    replayed later. Seen nonces are kept in this process only, so with
+    several wemx_server workers a replay within the window can still be
+    accepted by a worker that has not seen it.
+    """
+
+    def __init__(self, token, max_skew=30):
+        self.token = token
+        self.max_skew = max_skew
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def verify(self, headers, operation, body):
+        """Raise FleetAuthError unless the request was signed with our token"""
+        if not self.token:
+            raise FleetAuthError('Fleet agent is disabled (FLEET_TOKEN is not set)')
+        try:
+            timestamp = int(headers.get(HEADER_TIMESTAMP, ''))
+        except ValueError:
+            raise FleetAuthError('Missing or invalid timestamp')
+        nonce = headers.get(HEADER_NONCE, '')
+        signature = headers.get(HEADER_SIGNATURE, '')
+        if not nonce or not signature:
+            raise FleetAuthError('Missing nonce or signature')
+
+        now = time.time()
+        if abs(now - timestamp) > self.max_skew:
+            raise FleetAuthError('Request timestamp outside the allowed clock skew')
+        if not hmac.compare_digest(signature, sign(self.token, timestamp, nonce, operation, body)):
+            raise FleetAuthError('Bad signature')
+
+        with self._lock:
+            for seen_nonce, expires in list(self._seen.items()):
+                if expires < now:
+                    del self._seen[seen_nonce]
+            if nonce in self._seen:
+                raise FleetAuthError('Replayed request')
+            self._seen[nonce] = now + 2 * self.max_skew
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # An agent that does not allow us redirects away; report that instead of following it
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class FleetController:
+    """Sends one operation to many agents at once and collects their results
+
+    nodes maps a node name to the agent's base URL. Every call runs on all
+    selected nodes concurrently; a node that has not answered within
+    timeout seconds is reported as timed out without holding up the rest.
+    """
+
+    def __init__(self, nodes, token, timeout=60, max_workers=16):
+        self.nodes = dict(nodes)
+        self.token = token
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wemx-fleet')
+        self._opener = urllib.request.build_opener(_NoRedirect)
+
+    def call(self, operation, params=None, names=None, timeout=None):
+        """{'nodes': {name: result}, 'succeeded': [...], 'failed': [...], 'elapsed': s}"""
+        timeout = self.timeout if timeout is None else timeout
+        selected = list(self.nodes) if names is None else [name for name in names if name in self.nodes]
+        unknown = [] if names is None else [name for name in names if name not in self.nodes]
+        body = json.dumps(params or {}).encode()
+
+        started = time.monotonic()
+        node_started = {}
+
+        def run(name):
+            node_started[name] = time.monotonic()
+            return self._call_node(self.nodes[name], operation, body, timeout)
+
+        futures = {self._pool.submit(run, name): name for name in selected}
+
+        # Each node gets timeout seconds from when its call starts, so nodes queued
+        # behind max_workers are not cut short
+        results = {}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            deadlines = [node_started[futures[f]] + timeout for f in pending if futures[f] in node_started]
+            done, pending = wait(pending, timeout=max(0, min(deadlines, default=now + timeout) - now),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+            now = time.monotonic()
+            for future in [f for f in pending if node_started.get(futures[f], now) + timeout <= now]:
+                pending.discard(future)
+                results[futures[future]] = {'success': False, 'error': f'No answer within {timeout}s',
+                                            'timed_out': True}
+        for name in unknown:
+            results[name] = {'success': False, 'error': 'Unknown node'}
+
+        return {
+            'operation': operation,
+            'nodes': results,
+            'succeeded': sorted(name for name, result in results.items() if result.get('success')),
+            'failed': sorted(name for name, result in results.items() if not result.get('success')),
+            'elapsed': round(time.monotonic() - started, 3)
+        }
+
+    def _call_node(self, base_url, operation, body, timeout):
+        started = time.monotonic()
+        timestamp = int(time.time())
+        nonce = os.urandom(16).hex()
+        request = urllib.request.Request(
+            base_url.rstrip('/') + RPC_PATH + operation,
+            data=body,
+            method='POST',
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                HEADER_TIMESTAMP: str(timestamp),
+                HEADER_NONCE: nonce,
+                HEADER_SIGNATURE: sign(self.token, timestamp, nonce, operation, body)
+            }
+        )
+        try:
+            with self._opener.open(request, timeout=timeout) as response:
+                result = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                result = json.loads(e.read().decode('utf-8'))
+            except ValueError:
+                result = {}
+            result.setdefault('error', f'HTTP {e.code} {e.reason}')
+            result['success'] = False
+        except (OSError, ValueError) as e:
+            result = {'success': False, 'error': str(getattr(e, 'reason', e))}
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        return result
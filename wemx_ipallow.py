@@ -0,0 +1,84 @@
+import bisect
+import ipaddress
+import threading
+
+
+def parse_address(value):
+    """Parse an address string, unwrapping IPv4-mapped IPv6 (::ffff:a.b.c.d)"""
+    address = ipaddress.ip_address(value.strip())
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address
+
+
+class IPAllowlist:
+    """IPv4/IPv6 addresses and CIDR ranges compiled for constant-cost lookups
+
+    Single addresses go into a set; ranges are merged into sorted,
+    non-overlapping intervals per address family and searched with bisect.
+    Recent decisions are memoised per address string, so the common case is
+    one dict lookup no matter how long the list is. Entries that do not
+    parse are skipped and listed in ``invalid``.
+    """
+
+    def __init__(self, entries, cache_size=4096):
+        self.invalid = []
+        self._exact = set()
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._cache = {}
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+
+        ranges = {4: [], 6: []}
+        for entry in entries:
+            try:
+                network = ipaddress.ip_network(str(entry).strip(), strict=False)
+            except ValueError:
+                self.invalid.append(entry)
+                continue
+
+            start = int(network.network_address)
+            if network.num_addresses == 1:
+                self._exact.add((network.version, start))
+            else:
+                ranges[network.version].append((start, int(network.broadcast_address)))
+
+        for version, intervals in ranges.items():
+            for start, end in sorted(intervals):
+                ends = self._ends[version]
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    self._starts[version].append(start)
+                    ends.append(end)
+
+    def __len__(self):
+        return len(self._exact) + len(self._starts[4]) + len(self._starts[6])
+
+    def __contains__(self, value):
+        if value is None:
+            return False
+
+        allowed = self._cache.get(value)
+        if allowed is None:
+            allowed = self._lookup(value)
+            with self._cache_lock:
+                if len(self._cache) >= self._cache_size:
+                    self._cache.clear()
+                self._cache[value] = allowed
+        return allowed
+
+    def _lookup(self, value):
+        try:
+            address = parse_address(value)
+        except ValueError:
+            return False
+
+        key = int(address)
+        if (address.version, key) in self._exact:
+            return True
+
+        starts = self._starts[address.version]
+        index = bisect.bisect_right(starts, key) - 1
+        return index >= 0 and key <= self._ends[address.version][index]
@@ -0,0 +1,190 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class Job:
+    """A long-running panel operation tracked by ID"""
+
+    def __init__(self, name, total_steps=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = JOB_QUEUED
+        self.total_steps = total_steps
+        self.steps = []
+        self.output = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _touch(self):
+        # Caller holds the lock; wake anyone streaming this job
+        self.version += 1
+        self._changed.notify_all()
+
+    def begin_step(self, title):
+        """Mark the start of a named step"""
+        with self._lock:
+            self.steps.append({
+                'title': title,
+                'status': JOB_RUNNING,
+                'started_at': time.time(),
+                'finished_at': None
+            })
+            self._touch()
+
+    def end_step(self, success):
+        """Mark the current step as finished"""
+        with self._lock:
+            if self.steps:
+                step = self.steps[-1]
+                step['status'] = JOB_SUCCEEDED if success else JOB_FAILED
+                step['finished_at'] = time.time()
+            self._touch()
+
+    def log(self, text):
+        """Append text to the job output"""
+        with self._lock:
+            self.output.append(text)
+            self._touch()
+
+    def mark_running(self):
+        with self._lock:
+            self.status = JOB_RUNNING
+            self.started_at = time.time()
+            self._touch()
+
+    def mark_finished(self, result, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.status = JOB_SUCCEEDED if result.get('success') else JOB_FAILED
+            self.finished_at = time.time()
+            self._touch()
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until the job changes past version; returns the current version"""
+        with self._lock:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; False if timeout ran out first"""
+        with self._lock:
+            return self._changed.wait_for(lambda: self.finished, timeout=timeout)
+
+    def output_since(self, index):
+        """Output chunks logged after index, and the new index"""
+        with self._lock:
+            return self.output[index:], len(self.output)
+
+    def progress(self):
+        """Status and current step without the accumulated output"""
+        with self._lock:
+            return {
+                'status': self.status,
+                'finished': self.finished,
+                'current_step': self.steps[-1]['title'] if self.steps and not self.finished else None,
+                'completed_steps': sum(1 for s in self.steps if s['status'] in FINISHED_STATES),
+                'total_steps': self.total_steps
+            }
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        """Snapshot of the job suitable for JSON responses"""
+        with self._lock:
+            current = self.steps[-1]['title'] if self.steps and not self.finished else None
+            return {
+                'id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'finished': self.finished,
+                'current_step': current,
+                'completed_steps': sum(1 for s in self.steps if s['status'] in FINISHED_STATES),
+                'total_steps': self.total_steps,
+                'steps': [dict(s) for s in self.steps],
+                'output': ''.join(self.output),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobManager:
+    """Runs jobs on a bounded worker pool and keeps recent ones for polling"""
+
+    def __init__(self, max_workers=2, max_finished=100, logger=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wemx-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_finished = max_finished
+        self._logger = logger
+
+    def submit(self, name, func, *args, total_steps=None, **kwargs):
+        """Queue func(job, *args, **kwargs) and return the Job immediately
+
+        The function returns a result dict; its 'success' key decides the
+        final job status.
+        """
+        job = Job(name, total_steps=total_steps)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self):
+        """Jobs that are queued or running"""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def drain(self, timeout=None):
+        """Wait for every queued and running job to finish; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in self.active():
+            if not job.wait(None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def _run(self, job, func, args, kwargs):
+        job.mark_running()
+        try:
+            result = func(job, *args, **kwargs) or {}
+            job.mark_finished(result, None if result.get('success') else result.get('error'))
+        except Exception as e:
+            if self._logger:
+                self._logger.error(f"Job {job.name} ({job.id}) failed: {str(e)}")
+            job.mark_finished({'success': False, 'error': str(e), 'output': ''.join(job.output)}, str(e))
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the retention limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
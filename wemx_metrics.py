@@ -0,0 +1,172 @@
+import bisect
+import os
+import shlex
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; spans a sub-10ms systemctl call up to a five minute certbot run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in items]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+# Executables whose first positional argument is a fixed verb
+VERB_EXECUTABLES = {'systemctl', 'apt-get', 'apt'}
+CERTBOT_VERBS = {'run', 'certonly', 'renew', 'revoke', 'certificates', 'delete', 'install',
+                 'register', 'unregister', 'update_account', 'show_account', 'plugins',
+                 'enhance', 'update_symlinks', 'reconfigure'}
+NGINX_SIGNALS = {'stop', 'quit', 'reload', 'reopen'}
+SHELL_SEPARATORS = {'|', '||', '&&', ';'}
+
+
+def command_labels(command):
+    """(executable, verb) labels for a command list or shell string
+
+    Only verbs drawn from a fixed vocabulary are used, so user input such as
+    usernames or domains never becomes a label value. For shell pipelines
+    the last stage is the one labelled (``echo key | php artisan x`` is
+    artisan/x).
+    """
+    if isinstance(command, str):
+        try:
+            tokens = shlex.split(command)
+        except ValueError:
+            tokens = command.split()
+    else:
+        tokens = [str(token) for token in command]
+
+    stage = []
+    for token in tokens:
+        # In an argument list (no shell) ';' and '|' are plain arguments, e.g. find -exec ... ;
+        if token in SHELL_SEPARATORS and isinstance(command, str):
+            stage = []
+        else:
+            stage.append(token)
+    while stage and ('=' in stage[0] or stage[0] == 'sudo'):
+        stage = stage[1:]
+    if not stage:
+        return 'unknown', ''
+
+    executable = os.path.basename(stage[0])
+    args = stage[1:]
+    positional = [arg for arg in args if not arg.startswith('-')]
+
+    if executable.startswith('php') and args:
+        script = os.path.basename(args[0])
+        if script == 'artisan':
+            return 'artisan', args[1] if len(args) > 1 else 'list'
+        if script == 'artisan_batch.php':
+            return 'artisan', 'batch'
+        return executable, ''
+    if executable in VERB_EXECUTABLES:
+        return executable, positional[0] if positional else ''
+    if executable == 'certbot':
+        if '--version' in args:
+            return executable, 'version'
+        return executable, positional[0] if positional and positional[0] in CERTBOT_VERBS else 'run'
+    if executable == 'nginx':
+        if '-t' in args or '-T' in args:
+            return executable, 'test'
+        if '-s' in args and args.index('-s') + 1 < len(args) and args[args.index('-s') + 1] in NGINX_SIGNALS:
+            return executable, args[args.index('-s') + 1]
+    return executable, ''
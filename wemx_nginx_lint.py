@@ -0,0 +1,292 @@
+import os
+
+# Directives of the core and commonly packaged modules (Debian/Ubuntu nginx).
+# Anything else is reported as a warning, since it may come from a third-party module.
+KNOWN_DIRECTIVES = frozenset('''
+absolute_redirect access_log add_after_body add_before_body add_header add_trailer addition_types aio
+aio_write alias allow ancient_browser ancient_browser_value auth_basic auth_basic_user_file auth_delay
+auth_request auth_request_set autoindex autoindex_exact_size autoindex_format autoindex_localtime break
+charset charset_map charset_types chunked_transfer_encoding client_body_buffer_size
+client_body_in_file_only client_body_in_single_buffer client_body_temp_path client_body_timeout
+client_header_buffer_size client_header_timeout client_max_body_size connection_pool_size create_full_put_path
+daemon dav_access dav_methods debug_connection debug_points default_type deny directio directio_alignment
+disable_symlinks empty_gif env error_log error_page etag events expires fastcgi_bind fastcgi_buffer_size
+fastcgi_buffering fastcgi_buffers fastcgi_busy_buffers_size fastcgi_cache fastcgi_cache_background_update
+fastcgi_cache_bypass fastcgi_cache_key fastcgi_cache_lock fastcgi_cache_lock_age fastcgi_cache_lock_timeout
+fastcgi_cache_max_range_offset fastcgi_cache_methods fastcgi_cache_min_uses fastcgi_cache_path
+fastcgi_cache_revalidate fastcgi_cache_use_stale fastcgi_cache_valid fastcgi_catch_stderr
+fastcgi_connect_timeout fastcgi_force_ranges fastcgi_hide_header fastcgi_ignore_client_abort
+fastcgi_ignore_headers fastcgi_index fastcgi_intercept_errors fastcgi_keep_conn fastcgi_limit_rate
+fastcgi_max_temp_file_size fastcgi_next_upstream fastcgi_next_upstream_timeout fastcgi_next_upstream_tries
+fastcgi_no_cache fastcgi_param fastcgi_pass fastcgi_pass_header fastcgi_pass_request_body
+fastcgi_pass_request_headers fastcgi_read_timeout fastcgi_request_buffering fastcgi_send_lowat
+fastcgi_send_timeout fastcgi_socket_keepalive fastcgi_split_path_info fastcgi_store fastcgi_store_access
+fastcgi_temp_file_write_size fastcgi_temp_path flv geo geoip_city geoip_country geoip_org geoip_proxy
+geoip_proxy_recursive grpc_bind grpc_buffer_size grpc_connect_timeout grpc_hide_header grpc_ignore_headers
+grpc_intercept_errors grpc_next_upstream grpc_next_upstream_timeout grpc_next_upstream_tries grpc_pass
+grpc_pass_header grpc_read_timeout grpc_send_timeout grpc_set_header grpc_socket_keepalive grpc_ssl_certificate
+grpc_ssl_certificate_key grpc_ssl_ciphers grpc_ssl_name grpc_ssl_protocols grpc_ssl_server_name
+grpc_ssl_trusted_certificate grpc_ssl_verify gunzip gunzip_buffers gzip gzip_buffers gzip_comp_level
+gzip_disable gzip_http_version gzip_min_length gzip_proxied gzip_static gzip_types gzip_vary hash http http2
+http2_body_preread_size http2_chunk_size http2_max_concurrent_streams http2_push http2_push_preload
+http2_recv_buffer_size http3 http3_hq http3_max_concurrent_streams http3_stream_buffer_size if
+if_modified_since ignore_invalid_headers image_filter include index internal ip_hash keepalive
+keepalive_disable keepalive_requests keepalive_time keepalive_timeout large_client_header_buffers
+least_conn limit_conn limit_conn_dry_run limit_conn_log_level limit_conn_status limit_conn_zone limit_except
+limit_rate limit_rate_after limit_req limit_req_dry_run limit_req_log_level limit_req_status limit_req_zone
+lingering_close lingering_time lingering_timeout listen load_module location lock_file log_format
+log_not_found log_subrequest map map_hash_bucket_size map_hash_max_size master_process max_ranges
+memcached_pass merge_slashes min_delete_depth mirror mirror_request_body mp4 mp4_buffer_size
+mp4_max_buffer_size msie_padding msie_refresh multi_accept open_file_cache open_file_cache_errors
+open_file_cache_min_uses open_file_cache_valid open_log_file_cache output_buffers override_charset pcre_jit
+pid port_in_redirect postpone_output proxy_bind proxy_buffer_size proxy_buffering proxy_buffers
+proxy_busy_buffers_size proxy_cache proxy_cache_background_update proxy_cache_bypass proxy_cache_convert_head
+proxy_cache_key proxy_cache_lock proxy_cache_lock_age proxy_cache_lock_timeout proxy_cache_max_range_offset
+proxy_cache_methods proxy_cache_min_uses proxy_cache_path proxy_cache_revalidate proxy_cache_use_stale
+proxy_cache_valid proxy_connect_timeout proxy_cookie_domain proxy_cookie_flags proxy_cookie_path
+proxy_force_ranges proxy_headers_hash_bucket_size proxy_headers_hash_max_size proxy_hide_header
+proxy_http_version proxy_ignore_client_abort proxy_ignore_headers proxy_intercept_errors proxy_limit_rate
+proxy_max_temp_file_size proxy_method proxy_next_upstream proxy_next_upstream_timeout proxy_next_upstream_tries
+proxy_no_cache proxy_pass proxy_pass_header proxy_pass_request_body proxy_pass_request_headers
+proxy_read_timeout proxy_redirect proxy_request_buffering proxy_send_lowat proxy_send_timeout proxy_set_body
+proxy_set_header proxy_socket_keepalive proxy_ssl_certificate proxy_ssl_certificate_key proxy_ssl_ciphers
+proxy_ssl_name proxy_ssl_protocols proxy_ssl_server_name proxy_ssl_session_reuse proxy_ssl_trusted_certificate
+proxy_ssl_verify proxy_ssl_verify_depth proxy_store proxy_store_access proxy_temp_file_write_size
+proxy_temp_path quic_gso quic_host_key quic_retry random random_index read_ahead real_ip_header
+real_ip_recursive recursive_error_pages referer_hash_bucket_size referer_hash_max_size request_pool_size
+reset_timedout_connection resolver resolver_timeout return rewrite rewrite_log root satisfy scgi_pass
+scgi_param secure_link secure_link_md5 secure_link_secret send_lowat send_timeout sendfile sendfile_max_chunk
+server server_name server_name_in_redirect server_names_hash_bucket_size server_names_hash_max_size
+server_tokens set set_real_ip_from slice split_clients ssi ssi_last_modified ssi_min_file_chunk ssi_silent_errors
+ssi_types ssi_value_length ssl ssl_buffer_size ssl_certificate ssl_certificate_key ssl_ciphers
+ssl_client_certificate ssl_conf_command ssl_crl ssl_dhparam ssl_early_data ssl_ecdh_curve ssl_engine
+ssl_ocsp ssl_ocsp_cache ssl_ocsp_responder ssl_password_file ssl_prefer_server_ciphers ssl_protocols
+ssl_reject_handshake ssl_session_cache ssl_session_ticket_key ssl_session_tickets ssl_session_timeout
+ssl_stapling ssl_stapling_file ssl_stapling_responder ssl_stapling_verify ssl_trusted_certificate
+ssl_verify_client ssl_verify_depth stream stub_status sub_filter sub_filter_last_modified sub_filter_once
+sub_filter_types subrequest_output_buffer_size tcp_nodelay tcp_nopush thread_pool timer_resolution try_files
+types types_hash_bucket_size types_hash_max_size underscores_in_headers uninitialized_variable_warn upstream
+use user userid userid_domain userid_expires userid_flags userid_mark userid_name userid_p3p userid_path
+userid_service uwsgi_param uwsgi_pass valid_referers variables_hash_bucket_size variables_hash_max_size
+worker_aio_requests worker_connections worker_cpu_affinity worker_priority worker_processes
+worker_rlimit_core worker_rlimit_nofile worker_shutdown_timeout working_directory xml_entities xslt_stylesheet
+xslt_types zone
+'''.split())
+
+# Directives that hold files nginx must be able to open at startup
+FILE_DIRECTIVES = ('ssl_certificate', 'ssl_certificate_key', 'ssl_trusted_certificate',
+                   'ssl_client_certificate', 'ssl_dhparam', 'ssl_crl', 'ssl_stapling_file')
+
+# Blocks whose contents are not directives (map values, MIME types, etc.)
+OPAQUE_BLOCKS = ('map', 'types', 'geo', 'split_clients', 'charset_map', 'match')
+
+NGINX_PREFIX = '/etc/nginx'
+
+
+class NginxSyntaxError(Exception):
+    def __init__(self, message, line):
+        super().__init__(message)
+        self.line = line
+
+
+class Directive:
+    __slots__ = ('name', 'args', 'line', 'block')
+
+    def __init__(self, name, args, line, block=None):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.block = block
+
+
+def tokenize(text):
+    """Yield (token, line, quoted) for words and the punctuation ; { }"""
+    i = 0
+    line = 1
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char == '\n':
+            line += 1
+            i += 1
+        elif char in ' \t\r':
+            i += 1
+        elif char == '#':
+            while i < length and text[i] != '\n':
+                i += 1
+        elif char in ';{}':
+            yield char, line, False
+            i += 1
+        elif char in '"\'':
+            start_line = line
+            i += 1
+            value = []
+            while i < length and text[i] != char:
+                if text[i] == '\\' and i + 1 < length:
+                    value.append(text[i:i + 2])
+                    i += 2
+                    continue
+                if text[i] == '\n':
+                    line += 1
+                value.append(text[i])
+                i += 1
+            if i >= length:
+                raise NginxSyntaxError('unterminated quoted string', start_line)
+            i += 1
+            yield ''.join(value), start_line, True
+        else:
+            start = i
+            while i < length and text[i] not in ' \t\r\n;{}\'"':
+                # As in nginx, a backslash makes the next character part of the word (e.g. regex \{2\})
+                if text[i] == '\\' and i + 1 < length:
+                    if text[i + 1] == '\n':
+                        line += 1
+                    i += 2
+                    continue
+                # ${var} is part of the word, not a block
+                if text[i] == '$' and i + 1 < length and text[i + 1] == '{':
+                    close = text.find('}', i)
+                    i = close + 1 if close != -1 else length
+                    continue
+                i += 1
+            yield text[start:i], line, False
+
+
+def parse(text):
+    """Parse config text into a list of Directive trees; raises NginxSyntaxError"""
+    root = []
+    stack = [(root, None)]
+    words = []
+    for token, line, quoted in tokenize(text):
+        if not quoted and token == ';':
+            if not words:
+                raise NginxSyntaxError('unexpected ";"', line)
+            stack[-1][0].append(Directive(words[0][0], [w for w, _ in words[1:]], words[0][1]))
+            words = []
+        elif not quoted and token == '{':
+            if not words:
+                raise NginxSyntaxError('unexpected "{"', line)
+            directive = Directive(words[0][0], [w for w, _ in words[1:]], words[0][1], [])
+            stack[-1][0].append(directive)
+            stack.append((directive.block, directive))
+            words = []
+        elif not quoted and token == '}':
+            if words:
+                raise NginxSyntaxError(f'unexpected "}}", expecting ";" after "{words[0][0]}"', line)
+            if len(stack) == 1:
+                raise NginxSyntaxError('unexpected "}"', line)
+            stack.pop()
+        else:
+            words.append((token, line))
+
+    if words:
+        raise NginxSyntaxError(f'unexpected end of file, expecting ";" or "{{" after "{words[0][0]}"', words[0][1])
+    if len(stack) > 1:
+        opener = stack[-1][1]
+        raise NginxSyntaxError(f'unexpected end of file, "{opener.name}" block opened here is never closed', opener.line)
+    return root
+
+
+def _listen_address(address):
+    """Normalised address:port of a listen directive's first argument"""
+    if address.startswith('unix:'):
+        return address
+    if address.startswith('['):
+        host, _, port = address[1:].partition(']')
+        return f"[{host}]:{port.lstrip(':') or '80'}"
+    if address.isdigit():
+        return f'*:{address}'
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '80')
+    # nginx binds * and 0.0.0.0 to the same wildcard socket
+    return f"{'*' if host == '0.0.0.0' else host}:{port}"
+
+
+def _listen_key(args):
+    """(address:port, transport) of a listen directive
+
+    ``quic`` (HTTP/3) and stream ``udp`` listens bind UDP sockets, so e.g.
+    ``listen 443 ssl`` and ``listen 443 quic`` do not collide.
+    """
+    transport = 'udp' if 'quic' in args[1:] or 'udp' in args[1:] else 'tcp'
+    return _listen_address(args[0] if args else '80'), transport
+
+
+def _describe_listen(key):
+    address, transport = key
+    return address if transport == 'tcp' else f'{address} ({transport})'
+
+
+def lint(text, exists=os.path.exists, prefix=NGINX_PREFIX):
+    """Problems in a site config as [{'line', 'severity', 'message'}], sorted by line
+
+    Errors are things ``nginx -t`` would reject; warnings are likely
+    mistakes nginx accepts (unknown third-party directives, conflicting
+    server names).
+    """
+    try:
+        tree = parse(text)
+    except NginxSyntaxError as e:
+        return [{'line': e.line, 'severity': 'error', 'message': str(e)}]
+
+    issues = []
+    server_names = {}
+    default_servers = {}
+
+    def report(line, severity, message):
+        issues.append({'line': line, 'severity': severity, 'message': message})
+
+    def walk(directives, parents):
+        for directive in directives:
+            name = directive.name
+            if name not in KNOWN_DIRECTIVES:
+                report(directive.line, 'warning', f'unknown directive "{name}"')
+
+            if name == 'location' and not any(p in ('server', 'location') for p in parents):
+                report(directive.line, 'error', '"location" directive is not allowed here')
+
+            if name in FILE_DIRECTIVES and directive.args and '$' not in directive.args[0] \
+                    and not directive.args[0].startswith('data:') and not directive.args[0].startswith('engine:'):
+                path = directive.args[0]
+                if not os.path.isabs(path):
+                    path = os.path.join(prefix, path)
+                if not exists(path):
+                    report(directive.line, 'error', f'{name} file "{path}" does not exist')
+
+            if name == 'server' and directive.block is not None and parents[-1:] != ['upstream']:
+                check_server(directive)
+
+            if directive.block is not None and name not in OPAQUE_BLOCKS:
+                walk(directive.block, parents + [name])
+
+    def check_server(server):
+        listens = {}
+        names = []
+        for child in server.block:
+            if child.name == 'listen':
+                key = _listen_key(child.args)
+                if key in listens:
+                    report(child.line, 'error',
+                           f'duplicate listen {_describe_listen(key)} (first on line {listens[key]})')
+                else:
+                    listens[key] = child.line
+                if 'default_server' in child.args or 'default' in child.args:
+                    if key in default_servers:
+                        report(child.line, 'error', f'a duplicate default server for {_describe_listen(key)} '
+                                                    f'(first on line {default_servers[key]})')
+                    else:
+                        default_servers[key] = child.line
+            elif child.name == 'server_name':
+                names.extend((value, child.line) for value in child.args)
+
+        # Name conflicts are per address, whichever transports listen on it
+        for address in dict.fromkeys(address for address, _ in listens) or ['*:80']:
+            for value, line in names:
+                if value == '' or value == '_':
+                    continue
+                first = server_names.setdefault((address, value.lower()), line)
+                if first != line:
+                    report(line, 'warning',
+                           f'conflicting server name "{value}" on {address} (also on line {first}), ignored')
+
+    walk(tree, [])
+    return sorted(issues, key=lambda issue: (issue['line'], issue['severity']))
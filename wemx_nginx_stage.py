@@ -0,0 +1,113 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from wemx_files import atomic_write
+
+INCLUDE_RE = re.compile(r'''^(\s*include\s+["']?)(/[^\s;"']*)''', re.MULTILINE)
+
+
+class NginxStager:
+    """Validates nginx config candidates in a shadow tree before they go live
+
+    The shadow tree mirrors nginx_root: files are symlinked to the live ones
+    (so certificates and keys are never copied), except files with absolute
+    ``include`` paths into nginx_root, which are rewritten to point into the
+    shadow, and the candidate itself. ``nginx -t -c <shadow>/nginx.conf``
+    therefore checks exactly what nginx would load after the save, while the
+    live file is untouched until the candidate has passed.
+    """
+
+    def __init__(self, runner, nginx_root='/etc/nginx', staging_dir='/var/lib/wemx-admin/nginx-staging',
+                 nginx_binary='/usr/sbin/nginx'):
+        self._runner = runner
+        self.nginx_root = os.path.abspath(nginx_root)
+        self.staging_dir = staging_dir
+        self.nginx_binary = nginx_binary
+        self._lock = threading.Lock()
+
+    def validate(self, path, content):
+        """Runner result of ``nginx -t`` against the live tree with path replaced by content"""
+        os.makedirs(self.staging_dir, mode=0o700, exist_ok=True)
+        shadow = tempfile.mkdtemp(prefix='stage.', dir=self.staging_dir)
+        try:
+            self._build(shadow, {os.path.abspath(path): content})
+            result = self._runner([self.nginx_binary, '-t', '-c', os.path.join(shadow, 'nginx.conf')],
+                                  shell=False, timeout=30)
+            # Report errors against the live paths the user knows
+            for stream in ('stdout', 'stderr'):
+                result[stream] = result.get(stream, '').replace(shadow, self.nginx_root)
+            return result
+        finally:
+            shutil.rmtree(shadow, ignore_errors=True)
+
+    def apply(self, path, content):
+        """Validate content, and only if nginx accepts it atomically replace path
+
+        Saves are serialised so two candidates can never validate against
+        each other's half-applied state.
+        """
+        with self._lock:
+            result = self.validate(path, content)
+            if result['success']:
+                atomic_write(path, content)
+            return result
+
+    def _shadow_path(self, shadow, path):
+        return os.path.join(shadow, os.path.relpath(path, self.nginx_root))
+
+    def _inside_root(self, path):
+        return path == self.nginx_root or path.startswith(self.nginx_root + os.sep)
+
+    def _rewrite_includes(self, shadow, text):
+        def replace(match):
+            target = match.group(2)
+            if not self._inside_root(target):
+                return match.group(0)
+            return match.group(1) + self._shadow_path(shadow, target)
+        return INCLUDE_RE.sub(replace, text)
+
+    def _build(self, shadow, overrides):
+        for directory, subdirs, files in os.walk(self.nginx_root):
+            target_dir = self._shadow_path(shadow, directory)
+            os.makedirs(target_dir, exist_ok=True)
+            for name in subdirs + files:
+                live = os.path.join(directory, name)
+                staged = os.path.join(target_dir, name)
+                if os.path.islink(live):
+                    self._stage_link(shadow, live, staged)
+                elif name in files:
+                    self._stage_file(shadow, live, staged, overrides)
+
+        # Candidates for files that do not exist yet
+        for path, content in overrides.items():
+            staged = self._shadow_path(shadow, path)
+            if self._inside_root(path) and not os.path.lexists(staged):
+                os.makedirs(os.path.dirname(staged), exist_ok=True)
+                with open(staged, 'w') as f:
+                    f.write(self._rewrite_includes(shadow, content))
+
+    def _stage_link(self, shadow, live, staged):
+        target = os.readlink(live)
+        resolved = os.path.normpath(os.path.join(os.path.dirname(live), target))
+        if os.path.isabs(target) and self._inside_root(resolved):
+            # e.g. sites-enabled/wemx.conf -> /etc/nginx/sites-available/wemx.conf
+            target = self._shadow_path(shadow, resolved)
+        os.symlink(target, staged)
+
+    def _stage_file(self, shadow, live, staged, overrides):
+        if live in overrides:
+            content = overrides[live]
+        else:
+            try:
+                with open(live, 'r') as f:
+                    content = f.read()
+            except (UnicodeDecodeError, OSError):
+                content = None
+            if content is None or not INCLUDE_RE.search(content):
+                os.symlink(live, staged)
+                return
+        with open(staged, 'w') as f:
+            f.write(self._rewrite_includes(shadow, content))
@@ -0,0 +1,159 @@
+import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PermissionFixer:
+    """Walks a tree with os.scandir and repairs only wrong owners and modes
+
+    Equivalent to ``chown -R uid:gid root`` followed by chmod'ing files to
+    file_mode and directories to dir_mode, except that entries which are
+    already correct are left alone. tree_modes maps a path relative to root
+    to a mode applied to that directory and everything below it (like
+    ``chmod -R``); path_modes maps a relative path to a mode for that single
+    entry. Symlinks get their owner fixed but are never chmod'ed or followed.
+
+    Each directory is a separate task on the thread pool, so large subtrees
+    such as vendor/ and storage/ are processed in parallel.
+    """
+
+    def __init__(self, root, uid, gid, file_mode=0o644, dir_mode=0o755,
+                 tree_modes=None, path_modes=None, workers=8):
+        self.root = os.path.abspath(root)
+        self.uid = uid
+        self.gid = gid
+        self.file_mode = file_mode
+        self.dir_mode = dir_mode
+        self.tree_modes = {os.path.join(self.root, p): m for p, m in (tree_modes or {}).items()}
+        self.path_modes = {os.path.join(self.root, p): m for p, m in (path_modes or {}).items()}
+        self.workers = workers
+        self.stats = {
+            'root': self.root,
+            'running': False,
+            'scanned_files': 0,
+            'scanned_dirs': 0,
+            'scanned_links': 0,
+            'changed_owner': 0,
+            'changed_mode': 0,
+            'errors': 0,
+            'error_samples': [],
+            'elapsed': 0.0
+        }
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._done = threading.Condition()
+
+    def progress(self):
+        """Copy of the live counters, safe to read while run() is in progress"""
+        with self._stats_lock:
+            snapshot = dict(self.stats)
+            snapshot['error_samples'] = list(self.stats['error_samples'])
+            return snapshot
+
+    def run(self):
+        """Fix the whole tree and return the final counters"""
+        started = time.monotonic()
+        with self._stats_lock:
+            self.stats['running'] = True
+
+        counts = self._new_counts()
+        try:
+            st = os.lstat(self.root)
+        except OSError as e:
+            self._record_error(counts, self.root, e)
+            self._merge(counts)
+            return self._finish(started)
+
+        root_mode = self.tree_modes.get(self.root)
+        self._fix_entry(self.root, st, True, root_mode, counts)
+        self._merge(counts)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='wemx-perms') as executor:
+            self._submit(executor, self.root, root_mode)
+            with self._done:
+                self._done.wait_for(lambda: self._pending == 0)
+
+        return self._finish(started)
+
+    def _finish(self, started):
+        with self._stats_lock:
+            self.stats['running'] = False
+            self.stats['elapsed'] = round(time.monotonic() - started, 3)
+        return self.progress()
+
+    def _submit(self, executor, path, inherited_mode):
+        with self._done:
+            self._pending += 1
+        executor.submit(self._scan_dir, executor, path, inherited_mode)
+
+    def _scan_dir(self, executor, path, inherited_mode):
+        counts = self._new_counts()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError as e:
+                        self._record_error(counts, entry.path, e)
+                        continue
+
+                    is_dir = stat.S_ISDIR(st.st_mode)
+                    tree_mode = self.tree_modes.get(entry.path, inherited_mode) if is_dir else inherited_mode
+                    self._fix_entry(entry.path, st, is_dir, tree_mode, counts)
+                    if is_dir:
+                        self._submit(executor, entry.path, tree_mode)
+        except OSError as e:
+            self._record_error(counts, path, e)
+        finally:
+            self._merge(counts)
+            with self._done:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._done.notify_all()
+
+    def _fix_entry(self, path, st, is_dir, tree_mode, counts):
+        is_link = stat.S_ISLNK(st.st_mode)
+        if is_link:
+            counts['scanned_links'] += 1
+        elif is_dir:
+            counts['scanned_dirs'] += 1
+        else:
+            counts['scanned_files'] += 1
+
+        try:
+            if st.st_uid != self.uid or st.st_gid != self.gid:
+                os.chown(path, self.uid, self.gid, follow_symlinks=False)
+                counts['changed_owner'] += 1
+
+            if is_link:
+                return
+
+            wanted = self.path_modes.get(path)
+            if wanted is None:
+                wanted = tree_mode if tree_mode is not None else (self.dir_mode if is_dir else self.file_mode)
+            if stat.S_IMODE(st.st_mode) != wanted:
+                os.chmod(path, wanted)
+                counts['changed_mode'] += 1
+        except OSError as e:
+            self._record_error(counts, path, e)
+
+    def _new_counts(self):
+        return {'scanned_files': 0, 'scanned_dirs': 0, 'scanned_links': 0,
+                'changed_owner': 0, 'changed_mode': 0, 'errors': 0, 'error_samples': []}
+
+    def _record_error(self, counts, path, error):
+        counts['errors'] += 1
+        if len(counts['error_samples']) < 10:
+            counts['error_samples'].append(f"{path}: {error.strerror or error}")
+
+    def _merge(self, counts):
+        # Workers keep local counters and merge once per directory
+        with self._stats_lock:
+            for key, value in counts.items():
+                if key == 'error_samples':
+                    room = 10 - len(self.stats['error_samples'])
+                    self.stats['error_samples'].extend(value[:max(0, room)])
+                else:
+                    self.stats[key] += value
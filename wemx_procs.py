@@ -0,0 +1,216 @@
+import fcntl
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from wemx_metrics import command_labels
+
+# Which concurrency bucket a command counts against, by its executable
+CATEGORY_EXECUTABLES = {
+    'packages': {'apt', 'apt-get', 'dpkg'},
+    'certbot': {'certbot'},
+    'artisan': {'artisan', 'composer'},
+    'filesystem': {'chown', 'chmod', 'find', 'rsync', 'cp', 'tar'},
+    'services': {'systemctl', 'nginx'},
+}
+
+# Limit name -> (resource, util-linux prlimit option)
+RLIMITS = {
+    'cpu': (resource.RLIMIT_CPU, '--cpu'),
+    'memory': (resource.RLIMIT_AS, '--as'),
+    'nofile': (resource.RLIMIT_NOFILE, '--nofile'),
+}
+PRLIMIT = '/usr/bin/prlimit'
+SHELL = '/bin/sh'
+
+# How often a command waiting for a system-wide slot retries the slot locks
+SLOT_POLL_INTERVAL = 0.05
+
+
+class CommandBusy(Exception):
+    pass
+
+
+def command_category(command):
+    """Concurrency category of a command list or shell string"""
+    executable, _ = command_labels(command)
+    for category, executables in CATEGORY_EXECUTABLES.items():
+        if executable in executables:
+            return category
+    return 'other'
+
+
+class _ThreadSlots:
+    """Slots shared by the threads of this process"""
+
+    def __init__(self, count):
+        self._semaphore = threading.BoundedSemaphore(count)
+
+    def acquire(self, timeout):
+        return self._semaphore if self._semaphore.acquire(timeout=timeout) else None
+
+    def release(self, held):
+        held.release()
+
+
+class _FileSlots:
+    """Slots shared by every process on the host: one flock'd file per slot
+
+    flock() locks belong to the open file, so threads of one worker compete
+    for them like separate workers do, and a crashed worker's slots are
+    freed by the kernel.
+    """
+
+    def __init__(self, prefix, count):
+        self._paths = [f'{prefix}.{index}.lock' for index in range(count)]
+
+    def acquire(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for path in self._paths:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(SLOT_POLL_INTERVAL if deadline is None
+                       else min(SLOT_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+
+    def release(self, held):
+        os.close(held)
+
+
+class CommandLimiter:
+    """Global and per-category caps on how many commands run at once
+
+    A command holds one slot of its category and one global slot for its
+    whole lifetime. The category slot is taken first, so commands queued
+    behind e.g. a running apt-get do not also tie up global slots. With
+    lock_dir the caps hold across all wemx_server workers; without it they
+    are per process. running/waiting in snapshot() count this process only.
+    """
+
+    def __init__(self, max_concurrent=8, category_limits=None, lock_dir=None):
+        self.max_concurrent = max_concurrent
+        self.category_limits = dict(category_limits or {})
+        self.lock_dir = lock_dir
+        if lock_dir is not None:
+            os.makedirs(lock_dir, mode=0o700, exist_ok=True)
+
+        def slots(name, count):
+            if lock_dir is None:
+                return _ThreadSlots(count)
+            return _FileSlots(os.path.join(lock_dir, name), count)
+
+        self._global = slots('all', max_concurrent)
+        # 'all' is not a command category, so its lock files cannot clash with one
+        self._categories = {name: slots(f'category-{name}', limit)
+                            for name, limit in self.category_limits.items()}
+        self._lock = threading.Lock()
+        self._running = {}
+        self._waiting = {}
+
+    @contextmanager
+    def slot(self, category, timeout=None):
+        """Hold a slot for category; raises CommandBusy if none frees up within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pools = [p for p in (self._categories.get(category), self._global) if p is not None]
+        acquired = []
+        self._count(self._waiting, category, 1)
+        try:
+            for pool in pools:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                held = pool.acquire(remaining)
+                if held is None:
+                    raise CommandBusy(f'Too many {category} commands running, try again shortly')
+                acquired.append((pool, held))
+        except BaseException:
+            for pool, held in reversed(acquired):
+                pool.release(held)
+            raise
+        finally:
+            self._count(self._waiting, category, -1)
+
+        self._count(self._running, category, 1)
+        try:
+            yield
+        finally:
+            self._count(self._running, category, -1)
+            for pool, held in reversed(acquired):
+                pool.release(held)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'category_limits': dict(self.category_limits),
+                'system_wide': self.lock_dir is not None,
+                'running': {k: v for k, v in self._running.items() if v},
+                'waiting': {k: v for k, v in self._waiting.items() if v}
+            }
+
+    def _count(self, counts, category, delta):
+        with self._lock:
+            counts[category] = counts.get(category, 0) + delta
+
+
+def rlimit_values(limits):
+    """[(name, value)] for limits ({'cpu': s, 'memory': bytes, 'nofile': n}), capped at our hard limits"""
+    values = []
+    for name, value in (limits or {}).items():
+        if value is None:
+            continue
+        _, hard = resource.getrlimit(RLIMITS[name][0])
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        values.append((name, value))
+    return values
+
+
+def spawn(command, limits=None, shell=False, **kwargs):
+    """Popen command as the leader of a new session, with limits applied
+
+    Limits are set by exec'ing through prlimit rather than a preexec_fn,
+    which can deadlock the child of a threaded process. Without prlimit
+    they are applied to the child right after it starts.
+    """
+    values = rlimit_values(limits)
+    wrapped = bool(values) and os.path.exists(PRLIMIT)
+    if wrapped:
+        argv = [SHELL, '-c', command] if shell else [command] if isinstance(command, str) else list(command)
+        options = [f'{RLIMITS[name][1]}={value}:{value}' for name, value in values]
+        command, shell = [PRLIMIT, *options, '--', *argv], False
+
+    process = subprocess.Popen(command, start_new_session=True, shell=shell, **kwargs)
+    if values and not wrapped:
+        for name, value in values:
+            try:
+                resource.prlimit(process.pid, RLIMITS[name][0], (value, value))
+            except (ProcessLookupError, PermissionError):
+                break
+    return process
+
+
+def kill_tree(process, grace=2.0):
+    """Stop process and everything it started: SIGTERM to the group, then SIGKILL"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+        try:
+            process.wait(timeout=grace)
+            # The leader is gone, but children may still hold the group
+            os.killpg(process.pid, 0)
+        except subprocess.TimeoutExpired:
+            continue
+        except ProcessLookupError:
+            return
+    process.wait()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Production entry point for the WemX admin panel
+
+The master process binds the listening socket once and runs worker
+processes that share it. Each worker serves the Flask app from a bounded
+thread pool with HTTP/1.1 keep-alive.
+
+Signals sent to the master:
+    SIGHUP          graceful reload - start fresh workers (re-importing the
+                    app and wemx_config), then drain the old ones
+    SIGTERM/SIGINT  graceful shutdown - drain all workers and exit
+
+Usage: python wemx_server.py [--app wemx_app:app] [--host H] [--port P]
+                             [--workers N] [--threads N] [--keepalive S]
+"""
+import argparse
+import importlib
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Environment passed from the master to its workers
+ENV_MASTER_PID = 'WEMX_ADMIN_MASTER_PID'
+ENV_GENERATION = 'WEMX_ADMIN_GENERATION'
+ENV_BOOT_TASKS = 'WEMX_ADMIN_BOOT_TASKS'
+
+# How long a new worker may take to import the app before it is given up on
+WORKER_STARTUP_TIMEOUT = 60
+
+
+def log(message):
+    print(f"[wemx-server {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def parse_args(argv=None):
+    env = os.environ
+    parser = argparse.ArgumentParser(description='WemX admin panel production server')
+    parser.add_argument('--app', default=env.get('WEMX_ADMIN_APP', 'wemx_app:app'),
+                        help='WSGI application as module:attribute')
+    parser.add_argument('--host', default=env.get('WEMX_ADMIN_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(env.get('WEMX_ADMIN_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(env.get('WEMX_ADMIN_WORKERS', 1)),
+                        help='worker processes; in-memory state (jobs, caches) is per worker')
+    parser.add_argument('--threads', type=int, default=int(env.get('WEMX_ADMIN_THREADS', 16)),
+                        help='request threads per worker')
+    parser.add_argument('--keepalive', type=float, default=float(env.get('WEMX_ADMIN_KEEPALIVE', 5)),
+                        help='seconds an idle keep-alive connection is held open')
+    parser.add_argument('--graceful-timeout', type=float, default=float(env.get('WEMX_ADMIN_GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a draining worker may take to finish in-flight requests and jobs')
+    # Internal: set by the master when it starts a worker
+    parser.add_argument('--worker-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# =====================================================
+# WORKER
+# =====================================================
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server on an inherited socket that handles requests on a bounded thread pool"""
+
+    multithread = True
+    daemon_threads = True
+
+    def __init__(self, host, port, app, fd, threads, keepalive):
+        handler = type('KeepAliveRequestHandler', (WSGIRequestHandler,), {
+            'protocol_version': 'HTTP/1.1',
+            'timeout': keepalive
+        })
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wemx-http')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def load_app(spec):
+    module_name, _, attribute = spec.partition(':')
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attribute or 'app')
+
+
+def run_worker(args):
+    module, app = load_app(args.app)
+    server = PooledWSGIServer(args.host, args.port, app, args.worker_fd, args.threads, args.keepalive)
+
+    def drain(signum, frame):
+        # shutdown() blocks until serve_forever returns, so call it off the main thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    if hasattr(module, 'start_background_tasks'):
+        module.start_background_tasks(first_boot=os.environ.get(ENV_BOOT_TASKS) == '1')
+
+    if args.ready_fd is not None:
+        os.write(args.ready_fd, b'1')
+        os.close(args.ready_fd)
+
+    server.serve_forever()
+
+    # Stop accepting, then let in-flight requests and the app's background jobs
+    # finish; both share the graceful timeout
+    deadline = time.monotonic() + args.graceful_timeout
+    finishers = [threading.Thread(target=server.pool.shutdown, kwargs={'wait': True}, daemon=True)]
+    if hasattr(module, 'drain_background_tasks'):
+        finishers.append(threading.Thread(target=module.drain_background_tasks,
+                                          args=(args.graceful_timeout,), daemon=True))
+    for finisher in finishers:
+        finisher.start()
+    for finisher in finishers:
+        finisher.join(max(0, deadline - time.monotonic()))
+    if any(finisher.is_alive() for finisher in finishers):
+        log("Graceful timeout reached with requests or jobs still running")
+    os._exit(0)
+
+
+# =====================================================
+# MASTER
+# =====================================================
+
+class Master:
+    """Owns the listening socket and the worker processes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.generation = 0
+        self.workers = {}
+        self.pending_signals = []
+        self.listener = socket.create_server(
+            (args.host, args.port),
+            family=socket.AF_INET6 if ':' in args.host else socket.AF_INET,
+            backlog=128,
+            reuse_port=False
+        )
+        self.listener.set_inheritable(True)
+
+    def spawn(self, generation, index):
+        """Start one worker and wait until it is serving; returns the Popen or None"""
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ)
+        env[ENV_MASTER_PID] = str(os.getpid())
+        env[ENV_GENERATION] = str(generation)
+        env[ENV_BOOT_TASKS] = '1' if generation == 1 and index == 0 else '0'
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            '--app', self.args.app,
+            '--host', self.args.host,
+            '--port', str(self.args.port),
+            '--threads', str(self.args.threads),
+            '--keepalive', str(self.args.keepalive),
+            '--graceful-timeout', str(self.args.graceful_timeout),
+            '--worker-fd', str(self.listener.fileno()),
+            '--ready-fd', str(write_fd)
+        ]
+        process = subprocess.Popen(command, env=env, pass_fds=(self.listener.fileno(), write_fd),
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        os.close(write_fd)
+
+        # A worker that cannot import the app (e.g. broken wemx_config) never reports ready
+        ready = False
+        with os.fdopen(read_fd, 'rb') as pipe:
+            readable, _, _ = select.select([pipe], [], [], WORKER_STARTUP_TIMEOUT)
+            if readable:
+                ready = pipe.read(1) == b'1'
+        if not ready:
+            process.kill()
+            process.wait()
+            log(f"Worker for generation {generation} failed to start")
+            return None
+
+        self.workers[process.pid] = (process, generation, index)
+        return process
+
+    def start_generation(self):
+        """Start a full set of workers; returns True if all of them came up"""
+        self.generation += 1
+        started = []
+        for index in range(self.args.workers):
+            process = self.spawn(self.generation, index)
+            if process is None:
+                for worker in started:
+                    self.stop_worker(worker)
+                return False
+            started.append(process)
+        log(f"Generation {self.generation} serving with {len(started)} workers x {self.args.threads} threads")
+        return True
+
+    def stop_worker(self, process):
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+        self.workers.pop(process.pid, None)
+
+    def reload(self):
+        """Bring up a new generation before draining the current one"""
+        old = [process for process, generation, _ in self.workers.values() if generation == self.generation]
+        if not self.start_generation():
+            log("Reload aborted; previous workers keep serving")
+            return
+        for process in old:
+            self.stop_worker(process)
+        threading.Thread(target=self._reap, args=(old,), daemon=True).start()
+
+    def _reap(self, processes):
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        for process in processes:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.pending_signals.append(signum))
+
+        log(f"Listening on http://{self.args.host}:{self.args.port}")
+        if not self.start_generation():
+            sys.exit(1)
+
+        while True:
+            time.sleep(0.5)
+            while self.pending_signals:
+                signum = self.pending_signals.pop(0)
+                if signum == signal.SIGHUP:
+                    log("SIGHUP received, reloading workers")
+                    self.reload()
+                else:
+                    self.shutdown()
+                    return
+
+            # Replace workers of the current generation that died unexpectedly
+            for pid, (process, generation, index) in list(self.workers.items()):
+                if process.poll() is not None:
+                    del self.workers[pid]
+                    if generation == self.generation:
+                        log(f"Worker {pid} exited with {process.returncode}, restarting")
+            running = {index for _, generation, index in self.workers.values() if generation == self.generation}
+            for index in range(self.args.workers):
+                if index not in running and self.spawn(self.generation, index) is None:
+                    time.sleep(5)
+
+    def shutdown(self):
+        log("Shutting down, draining workers")
+        processes = [process for process, _, _ in self.workers.values()]
+        for process in processes:
+            self.stop_worker(process)
+        self._reap(processes)
+        self.listener.close()
+
+
+def request_reload():
+    """Ask the master this worker runs under to reload; False if not under wemx_server"""
+    master_pid = os.environ.get(ENV_MASTER_PID)
+    if not master_pid:
+        return False
+    os.kill(int(master_pid), signal.SIGHUP)
+    return True
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    if arguments.worker_fd is not None:
+        run_worker(arguments)
+    else:
+        Master(arguments).run()
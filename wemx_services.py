@@ -0,0 +1,335 @@
+import json
+import subprocess
+import threading
+import time
+
+from wemx_procs import spawn, kill_tree
+
+SYSTEMCTL = '/usr/bin/systemctl'
+JOURNALCTL = '/usr/bin/journalctl'
+UNIT_SUFFIXES = {'service', 'timer', 'socket', 'target', 'path', 'mount'}
+SHOW_PROPERTIES = ('Id', 'LoadState', 'ActiveState', 'SubState', 'ActiveEnterTimestamp',
+                   'NextElapseUSecRealtime', 'LastTriggerUSec')
+
+
+def unit_name(unit):
+    """Full unit name: 'nginx' is nginx.service, 'php8.1-fpm' is php8.1-fpm.service"""
+    return unit if unit.rsplit('.', 1)[-1] in UNIT_SUFFIXES else f'{unit}.service'
+
+
+def show_units(units, runner):
+    """{unit: state} for several units from one ``systemctl show`` call
+
+    state holds active_state, sub_state, load_state and, where systemd has
+    them, since (entered the active state), next_elapse and last_trigger
+    (timers). Units systemd does not answer for are 'unknown'.
+    """
+    names = [unit_name(unit) for unit in units]
+    result = runner([SYSTEMCTL, 'show', '--property=' + ','.join(SHOW_PROPERTIES), *names], shell=False)
+    blocks = [dict(line.split('=', 1) for line in block.splitlines() if '=' in line)
+              for block in result['stdout'].strip().split('\n\n') if block.strip()]
+    by_id = {block.get('Id'): block for block in blocks}
+
+    states = {}
+    for position, (unit, name) in enumerate(zip(units, names)):
+        # Blocks come in argument order; Id differs only for aliases
+        block = by_id.get(name) or (blocks[position] if len(blocks) == len(names) else {})
+        states[unit] = {
+            'active_state': block.get('ActiveState') or 'unknown',
+            'sub_state': block.get('SubState') or 'unknown',
+            'load_state': block.get('LoadState') or 'unknown',
+            'since': block.get('ActiveEnterTimestamp') or None,
+            'next_elapse': block.get('NextElapseUSecRealtime') or None,
+            'last_trigger': block.get('LastTriggerUSec') or None
+        }
+    return states
+
+
+class SystemctlBackend:
+    """Unit states from ``systemctl show``, with no change notifications (polling only)"""
+
+    def __init__(self, runner):
+        self._runner = runner
+
+    def snapshot(self, units):
+        return show_units(units, self._runner)
+
+
+class JournalBackend(SystemctlBackend):
+    """Change notifications from systemd's own journal messages about the watched units
+
+    PID 1 logs every start, stop, reload and failure of a unit with a UNIT=
+    field, whether or not anyone is subscribed on D-Bus. ``journalctl
+    --follow`` streams those, and each one names a unit to re-read.
+    """
+
+    def __init__(self, runner):
+        super().__init__(runner)
+        self._process = None
+
+    def watch(self, units, notify, ready):
+        """Call notify(unit) for each journal message about a unit; returns when the stream ends"""
+        names = {unit_name(unit): unit for unit in units}
+        self._process = spawn(
+            [JOURNALCTL, '--follow', '--lines=0', '--output=json', '_PID=1',
+             *(f'UNIT={name}' for name in names)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        ready()
+        try:
+            for line in self._process.stdout:
+                try:
+                    unit = names.get(json.loads(line).get('UNIT'))
+                except ValueError:
+                    continue
+                if unit is not None:
+                    notify(unit)
+        finally:
+            self.close()
+
+    def close(self):
+        process, self._process = self._process, None
+        if process is not None:
+            if process.poll() is None:
+                kill_tree(process)
+            process.stdout.close()
+
+
+class UnitTable:
+    """In-memory state of systemd units that routes read without forking
+
+    One snapshot seeds the table. While the backend's watch stream is up
+    the table is live: each event marks a unit dirty, and dirty units are
+    re-read together after a short settle delay (a restart logs stopping,
+    stopped, starting and started). invalidate() makes the next read
+    re-snapshot, so a route that just restarted a unit never sees the old
+    state, and a live table still re-reads every resync seconds in case
+    the stream silently misses something. Without a stream (no journalctl, or a backend with no watch)
+    reads re-snapshot at most every poll_ttl seconds, like a TTL cache,
+    and the stream is retried every retry seconds.
+    """
+
+    def __init__(self, units, backend, poll_ttl=5.0, resync=300.0, retry=30.0, settle=0.2, logger=None):
+        self.units = list(units)
+        self.backend = backend
+        self.poll_ttl = poll_ttl
+        self.resync = resync
+        self.retry = retry
+        self.settle = settle
+        self.live = False
+        self.events = 0
+        self.on_change = None
+        self.on_invalidate = None
+        self._states = {}
+        self._stale = True
+        self._expires = 0.0
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+        self._logger = logger
+
+    def start(self):
+        """Start following the backend's events; safe to call more than once"""
+        with self._lock:
+            if self._started or getattr(self.backend, 'watch', None) is None:
+                return
+            self._started = True
+        threading.Thread(target=self._follow, name='wemx-unit-watch', daemon=True).start()
+        threading.Thread(target=self._refresh_dirty, name='wemx-unit-refresh', daemon=True).start()
+
+    def get(self):
+        """Current {unit: active_state}"""
+        return {unit: state['active_state'] for unit, state in self.details().items()}
+
+    def details(self):
+        """Current {unit: state} with sub-state, since and timer fields"""
+        with self._lock:
+            fresh = not self._stale and time.monotonic() < self._expires
+        if not fresh:
+            with self._refresh_lock:
+                with self._lock:
+                    fresh = not self._stale and time.monotonic() < self._expires
+                if not fresh:
+                    self._refresh(self.units)
+        with self._lock:
+            return {unit: dict(state) for unit, state in self._states.items()}
+
+    def is_active(self, unit):
+        return self.get().get(unit) == 'active'
+
+    def invalidate(self):
+        """Force the next read to re-read systemd, e.g. right after a restart"""
+        with self._lock:
+            self._stale = True
+        if self.on_invalidate is not None:
+            self.on_invalidate()
+
+    def _refresh(self, units):
+        states = self.backend.snapshot(units)
+        with self._lock:
+            changed = any(self._states.get(unit) != state for unit, state in states.items())
+            self._states.update(states)
+            if set(units) >= set(self.units):
+                self._stale = False
+                self._expires = time.monotonic() + (self.resync if self.live else self.poll_ttl)
+        if changed and self.on_change is not None:
+            self.on_change()
+
+    def _mark_dirty(self, unit):
+        with self._lock:
+            self.events += 1
+            self._dirty.add(unit)
+        self._wake.set()
+
+    def _ready(self):
+        # Anything that changed before the stream was up is caught by one re-read
+        with self._lock:
+            self.live = True
+            self._stale = True
+
+    def _follow(self):
+        while True:
+            try:
+                self.backend.watch(self.units, self._mark_dirty, self._ready)
+                reason = 'stream ended'
+            except Exception as e:
+                reason = str(e)
+            with self._lock:
+                self.live = False
+                self._stale = True
+            if self._logger:
+                self._logger.warning(f"Unit event stream unavailable ({reason}); polling systemd "
+                                     f"every {self.poll_ttl}s, retrying in {self.retry}s")
+            time.sleep(self.retry)
+
+    def _refresh_dirty(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.settle)
+            self._wake.clear()
+            with self._lock:
+                units, self._dirty = list(self._dirty), set()
+            if not units:
+                continue
+            try:
+                with self._refresh_lock:
+                    self._refresh(units)
+            except Exception:
+                with self._lock:
+                    self._stale = True
+
+
+class FeedFull(Exception):
+    pass
+
+
+class Subscription:
+    """A status feed subscriber's event iterator
+
+    close() gives the subscriber's slot back whether or not iteration ever
+    started; a generator closed before its first next() never runs its
+    finally block, so the slot cannot be released from there.
+    """
+
+    def __init__(self, feed):
+        self._feed = feed
+        self._events = feed._events()
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        self._events.close()
+        with self._feed._changed:
+            if not self._released:
+                self._released = True
+                self._feed._subscribers -= 1
+
+
+class StatusFeed:
+    """One background sampler whose results are pushed to every subscriber
+
+    The sampler runs only while someone is subscribed, calling sample()
+    every interval seconds (or at once after poke()), so probe cost does
+    not grow with the number of open dashboards. A subscriber first gets
+    the full snapshot, then only the keys that changed; a heartbeat is
+    yielded when nothing changed for heartbeat seconds so dead connections
+    are noticed.
+    """
+
+    def __init__(self, sample, interval=5.0, heartbeat=15.0, max_subscribers=8):
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.samples = 0
+        self._sample = sample
+        self._snapshot = None
+        self._version = 0
+        self._subscribers = 0
+        self._thread = None
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+
+    def subscribe(self):
+        """Register a subscriber and return its Subscription; raises FeedFull at capacity
+
+        Events are ('status', snapshot), ('delta', {key: value}) and
+        ('heartbeat', None). The caller must close() the subscription.
+        """
+        with self._changed:
+            if self._subscribers >= self.max_subscribers:
+                raise FeedFull(f'At most {self.max_subscribers} live status streams per worker')
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='wemx-status-feed', daemon=True)
+                self._thread.start()
+        return Subscription(self)
+
+    def poke(self):
+        """Sample now instead of at the next interval, e.g. after a service restart"""
+        self._wake.set()
+
+    def _events(self):
+        version = 0
+        last = None
+        while True:
+            with self._changed:
+                if self._version == version:
+                    self._changed.wait(self.heartbeat)
+                snapshot = self._snapshot if self._version != version else None
+                version = self._version
+            if snapshot is None:
+                yield 'heartbeat', None
+            elif last is None:
+                yield 'status', snapshot
+                last = snapshot
+            else:
+                changed = {key: value for key, value in snapshot.items() if last.get(key) != value}
+                if changed:
+                    yield 'delta', changed
+                last = snapshot
+
+    def _run(self):
+        while True:
+            with self._changed:
+                if self._subscribers == 0:
+                    self._thread = None
+                    return
+            try:
+                snapshot = self._sample()
+            except Exception as e:
+                snapshot = {'error': str(e)}
+            self.samples += 1
+            with self._changed:
+                if snapshot != self._snapshot:
+                    self._snapshot = snapshot
+                    self._version += 1
+                    self._changed.notify_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,115 @@
+import threading
+import time
+
+
+class Flight:
+    """One in-flight execution and the events it has produced so far"""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self.attached = 0
+        self._changed = threading.Condition()
+
+    def publish(self, kind, payload):
+        with self._changed:
+            self.events.append((kind, payload))
+            self._changed.notify_all()
+
+    def finish(self):
+        with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until the execution has ended; False if timeout ran out first"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.done, timeout=timeout)
+
+    def subscribe(self, follower=False):
+        """Yield every event from the start, then new ones until the execution ends"""
+        index = 0
+        while True:
+            with self._changed:
+                while index == len(self.events) and not self.done:
+                    self._changed.wait()
+                pending = self.events[index:]
+                done = self.done
+            index += len(pending)
+            for kind, payload in pending:
+                if follower and kind == 'result':
+                    payload = dict(payload, coalesced=True)
+                yield kind, payload
+            if done and index == len(self.events):
+                return
+
+
+class SingleFlight:
+    """Runs identical concurrent operations once and shares the outcome
+
+    Operations are event generators like the panel's *_events functions:
+    ('output', text) while running, ending with ('result', dict). The first
+    caller for a key starts the generator on a background thread; callers
+    arriving while it runs attach to it and replay its events from the
+    start, and every caller receives the same result (marked coalesced for
+    the ones that attached). Running off the request thread also means a
+    client disconnecting no longer aborts e.g. a half-done restart.
+    """
+
+    def __init__(self, on_attach=None):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._on_attach = on_attach
+
+    def events(self, key, factory):
+        """Event generator for key, starting factory() only if no identical run is in flight"""
+        with self._lock:
+            flight = self._flights.get(key)
+            follower = flight is not None
+            if follower:
+                flight.attached += 1
+            else:
+                flight = self._flights[key] = Flight(key)
+                threading.Thread(target=self._run, args=(flight, factory),
+                                 name=f'wemx-flight-{key[0]}', daemon=True).start()
+        if follower and self._on_attach is not None:
+            self._on_attach(key)
+        return flight.subscribe(follower=follower)
+
+    def call(self, key, func):
+        """Result of func() for key, shared with identical calls in flight"""
+        def factory():
+            yield 'result', func()
+
+        result = None
+        for kind, payload in self.events(key, factory):
+            if kind == 'result':
+                result = payload
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return [{'key': list(key), 'attached': flight.attached} for key, flight in self._flights.items()]
+
+    def drain(self, timeout=None):
+        """Wait for every execution in flight to end; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            flights = list(self._flights.values())
+        for flight in flights:
+            if not flight.wait(None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def _run(self, flight, factory):
+        try:
+            for kind, payload in factory():
+                flight.publish(kind, payload)
+        except Exception as e:
+            flight.publish('result', {'success': False, 'error': str(e)})
+        finally:
+            # Later callers start a fresh run rather than replaying this one
+            with self._lock:
+                self._flights.pop(flight.key, None)
+            flight.finish()
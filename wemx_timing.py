@@ -0,0 +1,121 @@
+import functools
+import threading
+import time
+
+from flask.sessions import SecureCookieSessionInterface
+
+
+class HookTimer:
+    """Aggregated wall time of the per-request hook chain
+
+    Each named hook keeps a count, total and maximum in nanoseconds. Recording
+    is a perf_counter_ns pair and one short critical section, so measuring a
+    hook costs far less than any hook worth measuring.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed_ns):
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                self._stats[name] = [1, elapsed_ns, elapsed_ns]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed_ns
+                if elapsed_ns > entry[2]:
+                    entry[2] = elapsed_ns
+
+    def timed(self, name, func):
+        """Wrap func so every call is recorded under name"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter_ns() - started)
+        wrapper.__wemx_timed__ = True
+        return wrapper
+
+    def instrument(self, app):
+        """Time every before/after/teardown request hook registered on app so far"""
+        for kind, registry in (('before_request', app.before_request_funcs),
+                               ('after_request', app.after_request_funcs),
+                               ('teardown_request', app.teardown_request_funcs)):
+            for funcs in registry.values():
+                for i, func in enumerate(funcs):
+                    if not getattr(func, '__wemx_timed__', False):
+                        funcs[i] = self.timed(f'{kind}:{func.__name__}', func)
+
+    def snapshot(self):
+        """{name: {count, total_ms, mean_us, max_us}}"""
+        with self._lock:
+            items = [(name, list(entry)) for name, entry in self._stats.items()]
+        return {name: {
+            'count': count,
+            'total_ms': round(total / 1e6, 3),
+            'mean_us': round(total / count / 1e3, 2),
+            'max_us': round(peak / 1e3, 2)
+        } for name, (count, total, peak) in items}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Flask's cookie session, with open/save recorded on a HookTimer
+
+    Flask builds a new signing serializer (and derives its key) on every
+    request; it only depends on the secret key, so it is reused until the
+    key changes.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+        self._serializer = None
+        self._serializer_key = None
+
+    def get_signing_serializer(self, app):
+        key = (app.secret_key, tuple(app.config.get('SECRET_KEY_FALLBACKS') or ()))
+        if self._serializer_key != key:
+            self._serializer = super().get_signing_serializer(app)
+            self._serializer_key = key
+        return self._serializer
+
+    def open_session(self, app, request):
+        started = time.perf_counter_ns()
+        try:
+            return super().open_session(app, request)
+        finally:
+            self.timer.record('session:open', time.perf_counter_ns() - started)
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter_ns()
+        try:
+            return super().save_session(app, session, response)
+        finally:
+            self.timer.record('session:save', time.perf_counter_ns() - started)
+
+
+class TimingMiddleware:
+    """WSGI middleware recording the time until the app returns its response iterable
+
+    For streamed responses this excludes the body, so it measures the hook
+    chain plus view dispatch rather than the transfer.
+    """
+
+    def __init__(self, wsgi_app, timer, name='request'):
+        self.wsgi_app = wsgi_app
+        self.timer = timer
+        self.name = name
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter_ns()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            self.timer.record(self.name, time.perf_counter_ns() - started)
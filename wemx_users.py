@@ -0,0 +1,51 @@
+import os
+import pwd
+import threading
+
+from wemx_files import file_signature
+
+
+class UserInventory:
+    """System accounts that have a home directory under /home
+
+    Built in-process from pwd.getpwall() plus one listing of /home, and
+    rebuilt only when /etc/passwd or /home changes.
+    """
+
+    def __init__(self, passwd_path='/etc/passwd', home_root='/home'):
+        self.passwd_path = passwd_path
+        self.home_root = home_root
+        self._signature = None
+        self._users = []
+        self._lock = threading.Lock()
+
+    def users(self):
+        """Sorted usernames, rebuilt if the account database changed"""
+        signature = (file_signature(self.passwd_path), file_signature(self.home_root))
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    homes = set(os.listdir(self.home_root))
+                except OSError:
+                    homes = set()
+                self._users = sorted({entry.pw_name for entry in pwd.getpwall() if entry.pw_name in homes})
+                self._signature = signature
+            return self._users
+
+    def query(self, search='', page=1, per_page=50):
+        """One page of usernames containing search (case-insensitive)"""
+        users = self.users()
+        if search:
+            needle = search.lower()
+            users = [name for name in users if needle in name.lower()]
+
+        total = len(users)
+        page = max(1, page)
+        start = (page - 1) * per_page
+        return {
+            'users': users[start:start + per_page],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page
+        }